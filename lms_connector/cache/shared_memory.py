@@ -0,0 +1,360 @@
+"""
+A Django cache backend kept in a memory mapped file, shared by every
+process on a host that maps the same file, e.x. the workers of a WSGI
+server. Point it at a file in /dev/shm to keep it in memory:
+
+    LMS_CACHE_BACKEND=lms_connector.cache.shared_memory.SharedMemoryCache
+    LMS_CACHE_LOCATION=/dev/shm/lms-connector-cache
+    LMS_CACHE_OPTIONS='{"SLOTS": 512, "SLOT_SIZE": 65536}'
+
+The file is a header followed by SLOTS slots of SLOT_SIZE bytes. A key is
+kept in one of PROBE_SLOTS consecutive slots from the one its hash picks,
+replacing, when they are all taken, the one least recently written. Values
+that do not fit in a slot are not kept.
+
+Only bytes and str values are kept, e.x. the entries of
+read_cache.dumps_entry(), nothing read from the file is unpickled. The
+file is created readable by its owner only. A file laid out for other
+SLOTS or SLOT_SIZE, which other processes may have mapped, is refused
+rather than emptied.
+
+Writers hold a lock, both a thread lock and an flock on the file. Readers
+take no lock, every slot has a generation counter that writers make odd
+while they change the slot and even again after. A reader whose slot was
+odd, or changed generation while it was being read, tries again and after
+a few attempts misses.
+"""
+from contextlib import contextmanager
+from typing import Any, Optional, Tuple
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+MAGIC = b'LMSC'
+LAYOUT_VERSION = 1
+# magic, layout version, slots, slot size
+FILE_HEADER = struct.Struct('<4sIII')
+FILE_HEADER_SIZE = 64
+# generation, key hash, expires at (0 for never), written at, payload size
+SLOT_HEADER = struct.Struct('<QQddI')
+SLOT_HEADER_SIZE = 40
+GENERATION = struct.Struct('<Q')
+# key size, value kind, then the key and the value
+PAYLOAD_HEADER = struct.Struct('<IB')
+BYTES_VALUE = 0
+STR_VALUE = 1
+PROBE_SLOTS = 8
+READ_ATTEMPTS = 3
+
+
+def _dumps(key: str, value: Any) -> bytes:
+    if isinstance(value, bytes):
+        kind = BYTES_VALUE
+    elif isinstance(value, str):
+        kind, value = STR_VALUE, value.encode('utf-8')
+    else:
+        raise TypeError(
+            f'SharedMemoryCache only keeps bytes and str values, '
+            f'not {type(value).__name__}'
+        )
+    encoded_key = key.encode('utf-8')
+    return (
+        PAYLOAD_HEADER.pack(len(encoded_key), kind) + encoded_key + value
+    )
+
+
+def _find_value(
+    buffer: mmap.mmap,
+    payload_offset: int,
+    payload_size: int,
+    encoded_key: bytes,
+) -> Optional[Tuple[int, int]]:
+    """
+    The kind and offset of the value of the _dumps() payload at
+    payload_offset, compared with encoded_key where it lies, None when it
+    is for another key or is not a payload, e.x. when it was torn by a
+    writer.
+    """
+    key_size, kind = PAYLOAD_HEADER.unpack_from(buffer, payload_offset)
+    key_offset = payload_offset + PAYLOAD_HEADER.size
+    value_offset = key_offset + key_size
+    if (
+        key_size != len(encoded_key) or
+        value_offset > payload_offset + payload_size or
+        kind not in (BYTES_VALUE, STR_VALUE) or
+        buffer[key_offset:value_offset] != encoded_key
+    ):
+        return None
+    return kind, value_offset
+
+
+def _key_hash(key: str) -> int:
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    # 0 marks an empty slot.
+    return int.from_bytes(digest, 'little') or 1
+
+
+class SharedMemoryCache(BaseCache):
+    def __init__(self, location: str, params: dict):
+        super(SharedMemoryCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = location
+        self.slots = int(options.get('SLOTS', 512))
+        self.slot_size = int(options.get('SLOT_SIZE', 64 * 1024))
+        if self.slot_size <= SLOT_HEADER_SIZE:
+            raise ValueError('SLOT_SIZE is too small to hold any value')
+        self.size = FILE_HEADER_SIZE + self.slots * self.slot_size
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        # Refuse a file laid out differently straight away.
+        with self._lock:
+            self._open()
+
+    @property
+    def _map(self) -> mmap.mmap:
+        """
+        The mapping of the file, opened again in forked processes which
+        must not share the flock of their parent.
+        """
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._open()
+        return self._mmap
+
+    def _open(self) -> None:
+        """
+        Must hold the thread lock.
+        """
+        cache_file = open(
+            os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600),
+            'r+b',
+        )
+        fcntl.flock(cache_file, fcntl.LOCK_EX)
+        try:
+            header = cache_file.read(FILE_HEADER.size)
+            expected_header = FILE_HEADER.pack(
+                MAGIC,
+                LAYOUT_VERSION,
+                self.slots,
+                self.slot_size,
+            )
+            if not header.strip(b'\0'):
+                # A new file, or one whose creator died before the header
+                # was written.
+                cache_file.truncate(self.size)
+                cache_file.seek(0)
+                cache_file.write(expected_header)
+                cache_file.flush()
+            elif (
+                header != expected_header or
+                os.fstat(cache_file.fileno()).st_size != self.size
+            ):
+                cache_file.close()
+                raise ImproperlyConfigured(
+                    f'{self.path} is not a cache file with {self.slots} '
+                    f'slots of {self.slot_size} bytes, remove it or point '
+                    f'LMS_CACHE_LOCATION somewhere else'
+                )
+        finally:
+            if not cache_file.closed:
+                fcntl.flock(cache_file, fcntl.LOCK_UN)
+        self._file = cache_file
+        self._mmap = mmap.mmap(cache_file.fileno(), self.size)
+        self._pid = os.getpid()
+
+    def _slot_offset(self, index: int) -> int:
+        return FILE_HEADER_SIZE + index * self.slot_size
+
+    def _probe(self, key_hash: int):
+        first_index = key_hash % self.slots
+        for step in range(min(PROBE_SLOTS, self.slots)):
+            yield self._slot_offset((first_index + step) % self.slots)
+
+    def _read(self, key: str) -> Optional[Tuple[float, Any]]:
+        """
+        The expiry and value of key, without taking a lock.
+        """
+        cache_map = self._map
+        key_hash = _key_hash(key)
+        encoded_key = key.encode('utf-8')
+        for offset in self._probe(key_hash):
+            for _ in range(READ_ATTEMPTS):
+                generation, slot_hash, expires_at, _, size = (
+                    SLOT_HEADER.unpack_from(cache_map, offset)
+                )
+                if generation % 2:
+                    continue
+                if slot_hash != key_hash or not size:
+                    break
+                payload_offset = offset + SLOT_HEADER_SIZE
+                try:
+                    # A torn read may fail and is retried like any other.
+                    found = _find_value(
+                        cache_map,
+                        payload_offset,
+                        size,
+                        encoded_key,
+                    )
+                except struct.error:
+                    found = None
+                if found is not None:
+                    kind, value_offset = found
+                    value = cache_map[value_offset:payload_offset + size]
+                if GENERATION.unpack_from(cache_map, offset)[0] != generation:
+                    continue
+                if found is None:
+                    break
+                # Only decoded once it is known not to be torn.
+                if kind == STR_VALUE:
+                    value = value.decode('utf-8')
+                return expires_at, value
+        return None
+
+    @contextmanager
+    def _write_lock(self):
+        """
+        Excludes the writers of other threads, and with an flock on the file
+        those of other processes.
+        """
+        # Map the file first, that takes the thread lock itself.
+        self._map
+        with self._lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _find_slot(self, key: str, key_hash: int) -> Tuple[int, bool]:
+        """
+        Must hold the write lock. The offset of the slot to write key to
+        and whether key is in it.
+        """
+        cache_map = self._map
+        encoded_key = key.encode('utf-8')
+        now = time.time()
+        free_offset = None
+        oldest_offset, oldest_written_at = None, None
+        for offset in self._probe(key_hash):
+            _, slot_hash, expires_at, written_at, size = (
+                SLOT_HEADER.unpack_from(cache_map, offset)
+            )
+            is_key_slot = (
+                size and
+                slot_hash == key_hash and
+                _find_value(
+                    cache_map,
+                    offset + SLOT_HEADER_SIZE,
+                    size,
+                    encoded_key,
+                ) is not None
+            )
+            if is_key_slot:
+                return offset, not (expires_at and expires_at <= now)
+            if not size or (expires_at and expires_at <= now):
+                if free_offset is None:
+                    free_offset = offset
+            elif oldest_written_at is None or written_at < oldest_written_at:
+                oldest_offset, oldest_written_at = offset, written_at
+        if free_offset is not None:
+            return free_offset, False
+        return oldest_offset, False
+
+    def _write_slot(
+        self,
+        offset: int,
+        key_hash: int,
+        expires_at: float,
+        payload: bytes,
+    ) -> None:
+        """
+        Must hold the write lock.
+        """
+        cache_map = self._map
+        generation = GENERATION.unpack_from(cache_map, offset)[0]
+        GENERATION.pack_into(cache_map, offset, generation + 1)
+        payload_offset = offset + SLOT_HEADER_SIZE
+        cache_map[payload_offset:payload_offset + len(payload)] = payload
+        SLOT_HEADER.pack_into(
+            cache_map,
+            offset,
+            generation + 1,
+            key_hash,
+            expires_at,
+            time.time(),
+            len(payload),
+        )
+        GENERATION.pack_into(cache_map, offset, generation + 2)
+
+    def _set(self, key: str, value: Any, timeout, only_new: bool) -> bool:
+        expires_at = self.get_backend_timeout(timeout) or 0
+        payload = _dumps(key, value)
+        key_hash = _key_hash(key)
+        with self._write_lock():
+            offset, exists = self._find_slot(key, key_hash)
+            if exists and only_new:
+                return False
+            if len(payload) > self.slot_size - SLOT_HEADER_SIZE:
+                if exists:
+                    self._write_slot(offset, 0, 0, b'')
+                return False
+            self._write_slot(offset, key_hash, expires_at, payload)
+            return True
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._set(key, value, timeout, only_new=True)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        found = self._read(key)
+        if found is None:
+            return default
+        expires_at, value = found
+        if expires_at and expires_at <= time.time():
+            return default
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._set(key, value, timeout, only_new=False)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        found = self._read(key)
+        if found is None:
+            return False
+        return self._set(key, found[1], timeout, only_new=False)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._write_lock():
+            offset, exists = self._find_slot(key, _key_hash(key))
+            if exists:
+                self._write_slot(offset, 0, 0, b'')
+            return exists
+
+    def clear(self):
+        with self._write_lock():
+            for index in range(self.slots):
+                self._write_slot(self._slot_offset(index), 0, 0, b'')
+
+    def close(self, **kwargs):
+        """
+        The mapping is kept open between requests.
+        """
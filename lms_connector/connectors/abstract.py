@@ -1,17 +1,67 @@
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 from contextlib import contextmanager
+from functools import partial
 from rest_framework.request import Request
-from typing import Dict, List, Union, Optional
+from math import ceil
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+import asyncio
+import time
 import traceback
 
+from django.conf import settings
+import httpx
+import requests
+
 from lms_connector.responses import (
     ErrorLCResponse,
     ErrorResponseCodes,
     ErrorResponseDetails,
     FormattedError,
 )
+from lms_connector.connectors.creds_envelope import CredsEnvelope
+from lms_connector.connectors.deadline import Deadline
+from lms_connector.connectors.fan_out import FanOutResult, fan_out_calls
+from lms_connector.connectors.read_cache import (
+    CacheEntry,
+    CacheStatus,
+    get_cache_directives,
+    read_cache,
+)
+from lms_connector.connectors.singleflight import (
+    SingleFlightTimeout,
+    async_single_flight,
+    single_flight,
+)
+from lms_connector.connectors.transport import (
+    CircuitState,
+    circuit_breakers,
+    get_async_client_pool,
+    get_background_executor,
+    get_host_key,
+    get_retry_policy,
+    get_session_pool,
+    hedge_budgets,
+    latency_trackers,
+    parse_retry_after,
+    rate_limiters,
+)
 from lms_connector.entities import (
     Assignment,
+    AssignmentExistence,
+    AssignmentExistenceStatus,
     Course,
     LMSUser,
     Student,
@@ -19,22 +69,45 @@ from lms_connector.entities import (
 from lms_connector.lms_connector_logger import logger
 from rest_framework import status
 
+# Only these are retried, repeating them can not change anything on the LMS.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+RETRYABLE_STATUS_CODES = (
+    status.HTTP_429_TOO_MANY_REQUESTS,
+    status.HTTP_502_BAD_GATEWAY,
+    status.HTTP_503_SERVICE_UNAVAILABLE,
+    status.HTTP_504_GATEWAY_TIMEOUT,
+)
+CIRCUIT_STATE_HEADER = 'LMS-Circuit-State'
+UPSTREAM_RETRIES_HEADER = 'LMS-Upstream-Retries'
+UPSTREAM_HEDGES_HEADER = 'LMS-Upstream-Hedges'
+RATE_LIMIT_QUEUE_HEADER = 'LMS-Rate-Limit-Queue'
+CACHE_STATUS_HEADER = 'LMS-Cache'
+
+
+def _close_response(future: Future) -> None:
+    """
+    Close the response of a call nobody is waiting for, which holds on to
+    its connection if it was streamed.
+    """
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
 
 class AbstractLMSConnector:
     __metaclass__ = ABCMeta
-    _incoming_request_headers: Union[Dict, None] = None
+    _creds_envelope: Optional[CredsEnvelope] = None
 
     @property
-    def incoming_request_headers(self) -> Dict:
-        if self._incoming_request_headers is not None:
-            return self._incoming_request_headers
+    def creds_envelope(self) -> CredsEnvelope:
+        if self._creds_envelope is not None:
+            return self._creds_envelope
         else:
             # This would be a programming error, a user should not be able
             # to cause this.
             formatted_error = FormattedError(
-                source='incoming request headers property',
+                source='creds envelope property',
                 code=ErrorResponseCodes.headers_not_set,
-                detail='headers were accessed without being set.'
+                detail='credentials were accessed without being set.'
             )
             raise ErrorLCResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -45,6 +118,7 @@ class AbstractLMSConnector:
     def get_connector(
         lms_type: str,
         lms_base_url: str,
+        creds_envelope: Optional[CredsEnvelope] = None,
     ) -> 'AbstractLMSConnector':
         if lms_type == 'sakai':
             from lms_connector.connectors.sakai import SakaiConnector
@@ -61,31 +135,675 @@ class AbstractLMSConnector:
                 status_code=status.HTTP_400_BAD_REQUEST,
                 errors=[formatted_error],
             )
-        return connector(
+        lms_connector = connector(
             lms_base_url=lms_base_url,
         )
+        lms_connector._creds_envelope = creds_envelope
+        return lms_connector
 
     @staticmethod
     def get_connector_from_request(
-        request: Request
+        request: Request,
+        creds_envelope: Optional[CredsEnvelope] = None,
     ) -> 'AbstractLMSConnector':
-        lms_base_url = request.META.get('HTTP_LMS_BASE_URL')
-        lms_type = request.META.get('HTTP_LMS_TYPE')
+        """
+        :param creds_envelope: built from the request headers if not given,
+            without requiring any of them.
+        """
+        if creds_envelope is None:
+            creds_envelope = CredsEnvelope.from_request_meta(
+                request.META,
+                required_headers=[],
+            )
         lms_connector = AbstractLMSConnector.get_connector(
-            lms_type,
-            lms_base_url,
+            creds_envelope.lms_type,
+            creds_envelope.lms_base_url,
+            creds_envelope,
+        )
+        lms_connector.deadline = Deadline.from_request_meta(request.META)
+        cache_directives = get_cache_directives(request.META)
+        lms_connector.cache_reads = not (
+            cache_directives & {'no-cache', 'no-store'}
         )
-        lms_connector._incoming_request_headers = request.META
+        lms_connector.cache_writes = 'no-store' not in cache_directives
         return lms_connector
 
     def __init__(self, lms_base_url: str):
         self.lms_base_url = lms_base_url
+        # Upstream bookkeeping for the request this connector serves.
+        self.upstream_retries = 0
+        self.upstream_hedges = 0
+        self.circuit_states: Dict[str, CircuitState] = {}
+        # Longest rate limiter queue, per host, that a call had to wait in.
+        self.rate_limit_queue_depths: Dict[str, int] = {}
+        # Shared by every upstream call made while serving the request.
+        self.deadline = Deadline(budget=settings.LMS_REQUEST_BUDGET)
+        # Whether reads may be answered from, and stored in, the read cache.
+        self.cache_reads = True
+        self.cache_writes = True
+        # What the read cache had for each cacheable read, and the age of
+        # the oldest entry used.
+        self.cache_statuses: List[CacheStatus] = []
+        self.cache_age: Optional[float] = None
+
+    @classmethod
+    def _session_for(cls, lms_base_url: str) -> requests.Session:
+        """
+        Get the pooled session for the host serving lms_base_url.
+
+        Connectors should make upstream calls through this session rather
+        than through requests.get() and friends so that connections to the
+        LMS are kept alive and reused.
+        """
+        return get_session_pool().session_for(lms_base_url)
+
+    def _raise_for_open_circuit(self, url: str) -> None:
+        breaker = circuit_breakers.get(url)
+        host_key = get_host_key(url)
+        if breaker.allow_request():
+            return
+
+        self.circuit_states[host_key] = CircuitState.open
+        retry_after = breaker.retry_after()
+        error_response = ErrorLCResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            errors=[FormattedError(
+                source=url,
+                code=ErrorResponseCodes.lms_circuit_open,
+                detail=ErrorResponseDetails.lms_circuit_open(
+                    host_key,
+                    retry_after,
+                ),
+            )],
+        )
+        error_response['Retry-After'] = str(ceil(retry_after))
+        raise error_response
+
+    def _raise_for_rate_limit(
+        self,
+        url: str,
+        acquired: bool,
+        queue_depth: int,
+    ) -> None:
+        """
+        Note how long the rate limiter queue was, and raise if no token was
+        acquired.
+        """
+        rate_limiter = rate_limiters.get(url)
+        host_key = get_host_key(url)
+        self.rate_limit_queue_depths[host_key] = max(
+            queue_depth,
+            self.rate_limit_queue_depths.get(host_key, 0),
+        )
+        if acquired:
+            return
+
+        retry_after = rate_limiter.retry_after()
+        error_response = ErrorLCResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            errors=[FormattedError(
+                source=url,
+                code=ErrorResponseCodes.lms_rate_limited,
+                detail=ErrorResponseDetails.lms_rate_limited(
+                    host_key,
+                    retry_after,
+                ),
+            )],
+        )
+        error_response['Retry-After'] = str(ceil(retry_after))
+        raise error_response
+
+    def _acquire_rate_limit(self, url: str) -> None:
+        """
+        Wait, within the request deadline, for the host's rate limiter to
+        allow another call.
+        """
+        acquired, queue_depth = rate_limiters.get(url).acquire(
+            timeout=self.deadline.remaining(),
+        )
+        self._raise_for_rate_limit(url, acquired, queue_depth)
+
+    async def _aacquire_rate_limit(self, url: str) -> None:
+        acquired, queue_depth = await rate_limiters.get(url).aacquire(
+            timeout=self.deadline.remaining(),
+        )
+        self._raise_for_rate_limit(url, acquired, queue_depth)
+
+    def _record_throttling(
+        self,
+        url: str,
+        response: Union[requests.Response, httpx.Response],
+    ) -> None:
+        """
+        Slow down calls to a host which says it is overloaded.
+        """
+        rate_limiter = rate_limiters.get(url)
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        is_throttled = (
+            response.status_code == status.HTTP_429_TOO_MANY_REQUESTS or (
+                response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+                and retry_after is not None
+            )
+        )
+        if is_throttled:
+            rate_limiter.record_throttled(retry_after)
+        else:
+            rate_limiter.record_success()
+
+    def _record_response(
+        self,
+        url: str,
+        response: Union[requests.Response, httpx.Response],
+    ) -> None:
+        """
+        Feed the outcome of a call which got an answer to the host's
+        circuit breaker and rate limiter.
+        """
+        breaker = circuit_breakers.get(url)
+        self._record_throttling(url, response)
+        if response.status_code < 500:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        self.circuit_states[get_host_key(url)] = breaker.state
+
+    def _record_connection_failure(self, url: str) -> None:
+        breaker = circuit_breakers.get(url)
+        breaker.record_failure()
+        self.circuit_states[get_host_key(url)] = breaker.state
+
+    def _hedge_delay(self, url: str) -> Optional[float]:
+        """
+        Count a call that may be hedged, and get how long to wait for its
+        first attempt before hedging it. None if not enough is known about
+        the host yet.
+        """
+        hedge_budgets.get(url).record_call()
+        hedge_after = latency_trackers.get(url).percentile(
+            settings.LMS_HEDGE_PERCENTILE,
+        )
+        if hedge_after is None:
+            return None
+        return min(hedge_after, self.deadline.remaining())
+
+    def _try_hedge(self, url: str) -> bool:
+        """
+        Whether the hedge budget and the rate limit of the host allow
+        sending a hedged attempt now.
+        """
+        can_hedge = (
+            hedge_budgets.get(url).try_spend() and
+            rate_limiters.get(url).acquire(timeout=0)[0]
+        )
+        if can_hedge:
+            self.upstream_hedges += 1
+        return can_hedge
+
+    @staticmethod
+    def _pick_attempt(done: Iterable, pending: Iterable) -> Optional[Any]:
+        """
+        The finished attempt to answer with, the first one that succeeded
+        or the last one to fail. None while others are still running.
+        """
+        for attempt in done:
+            if attempt.exception() is None or not pending:
+                return attempt
+        return None
+
+    @staticmethod
+    def _sends_hedged(method: str, hedge: bool) -> bool:
+        return (
+            hedge and
+            method.upper() in IDEMPOTENT_METHODS and
+            settings.LMS_HEDGING_ENABLED
+        )
+
+    @staticmethod
+    def _max_retries(method: str) -> int:
+        if method.upper() not in IDEMPOTENT_METHODS:
+            return 0
+        return get_retry_policy().max_retries
+
+    def _check_failed_attempt(
+        self,
+        url: str,
+        error: Exception,
+        has_retries_left: bool,
+    ) -> None:
+        """
+        Record an attempt that got no response, raise unless it should be
+        retried.
+        """
+        if self.deadline.expired:
+            # The attempt only had what was left of the client's budget,
+            # running out of it says nothing about the host.
+            raise self.deadline.exceeded_error(url) from error
+        self._record_connection_failure(url)
+        if not has_retries_left:
+            raise error
+
+    def _should_retry(
+        self,
+        url: str,
+        response: Union[requests.Response, httpx.Response],
+        has_retries_left: bool,
+    ) -> bool:
+        self._record_response(url, response)
+        return (
+            has_retries_left and
+            response.status_code in RETRYABLE_STATUS_CODES
+        )
+
+    def _retry_backoff(self, url: str, retry_number: int) -> float:
+        """
+        Count a retry and get the seconds to wait before making it.
+        """
+        # Do not retry into a circuit that the failure just opened.
+        self._raise_for_open_circuit(url)
+        self.upstream_retries += 1
+        return min(
+            get_retry_policy().backoff(retry_number),
+            self.deadline.remaining(),
+        )
+
+    def _timed_request(
+        self,
+        method: str,
+        url: str,
+        **kwargs
+    ) -> requests.Response:
+        """
+        A single call to the LMS, its latency feeds the host's hedging
+        threshold.
+        """
+        started_at = time.monotonic()
+        response = self._session_for(url).request(method, url, **kwargs)
+        latency_trackers.get(url).record(time.monotonic() - started_at)
+        return response
+
+    def _hedged_request(
+        self,
+        method: str,
+        url: str,
+        **kwargs
+    ) -> requests.Response:
+        """
+        Send the call again if it is slower than most recent calls to the
+        host, and use whichever answer comes back first.
+
+        Only use for idempotent calls.
+        """
+        hedge_after = self._hedge_delay(url)
+        if hedge_after is None:
+            return self._timed_request(method, url, **kwargs)
+
+        executor = get_background_executor()
+        pending = {
+            executor.submit(self._timed_request, method, url, **kwargs)
+        }
+        done, pending = wait(pending, timeout=hedge_after)
+        if not done and self._try_hedge(url):
+            pending.add(
+                executor.submit(self._timed_request, method, url, **kwargs)
+            )
+
+        # The loser is left to finish in the background.
+        while True:
+            if not done:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            attempt = self._pick_attempt(done, pending)
+            if attempt is not None:
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                return attempt.result()
+            done = set()
+
+    def _request(
+        self,
+        method: str,
+        url: str,
+        hedge: bool = False,
+        **kwargs
+    ) -> requests.Response:
+        """
+        Make a call to the LMS through the pooled session for its host.
+
+        Calls to a host whose circuit is open fail straight away, others
+        wait their turn with the host's rate limiter.
+        Idempotent calls are retried with backoff on connection errors and
+        on gateway style errors, anything else is only tried once.
+        Every attempt is limited to what is left of the request deadline.
+
+        :param hedge: allow the call to be hedged, see _hedged_request().
+            Hedging also has to be turned on with LMS_HEDGING_ENABLED.
+        """
+        self.deadline.raise_if_expired(url)
+        self._raise_for_open_circuit(url)
+
+        max_retries = self._max_retries(method)
+        if self._sends_hedged(method, hedge):
+            send = self._hedged_request
+        else:
+            send = self._timed_request
+        retry_number = 0
+        while True:
+            has_retries_left = retry_number < max_retries
+            self._acquire_rate_limit(url)
+            try:
+                response = send(
+                    method,
+                    url,
+                    timeout=self.deadline.timeout(),
+                    **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._check_failed_attempt(url, e, has_retries_left)
+            else:
+                if not self._should_retry(url, response, has_retries_left):
+                    return response
+                # Give a streamed response's connection back to the pool.
+                response.close()
+
+            retry_number += 1
+            time.sleep(self._retry_backoff(url, retry_number))
+            self.deadline.raise_if_expired(url)
+
+    @classmethod
+    def _async_client_for(cls, lms_base_url: str) -> httpx.AsyncClient:
+        """
+        _session_for() for coroutines, get the pooled httpx client for the
+        host serving lms_base_url.
+        """
+        return get_async_client_pool().client_for(lms_base_url)
+
+    async def _atimed_request(
+        self,
+        method: str,
+        url: str,
+        **kwargs
+    ) -> httpx.Response:
+        started_at = time.monotonic()
+        response = await self._async_client_for(url).request(
+            method,
+            url,
+            **kwargs
+        )
+        latency_trackers.get(url).record(time.monotonic() - started_at)
+        return response
+
+    async def _ahedged_request(
+        self,
+        method: str,
+        url: str,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        _hedged_request() for coroutines. The loser is cancelled rather
+        than left to finish.
+        """
+        hedge_after = self._hedge_delay(url)
+        if hedge_after is None:
+            return await self._atimed_request(method, url, **kwargs)
+
+        pending = {
+            asyncio.ensure_future(
+                self._atimed_request(method, url, **kwargs)
+            ),
+        }
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after)
+            if not done and self._try_hedge(url):
+                pending.add(asyncio.ensure_future(
+                    self._atimed_request(method, url, **kwargs)
+                ))
+
+            while True:
+                if not done:
+                    done, pending = await asyncio.wait(
+                        pending,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                attempt = self._pick_attempt(done, pending)
+                if attempt is not None:
+                    return attempt.result()
+                done = set()
+        finally:
+            for attempt in pending:
+                attempt.cancel()
+
+    async def _arequest(
+        self,
+        method: str,
+        url: str,
+        hedge: bool = False,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        _request() for coroutines, made through the pooled httpx client for
+        the host. Circuit breakers, rate limits, retries, hedging and the
+        deadline work as they do for _request().
+        """
+        self.deadline.raise_if_expired(url)
+        self._raise_for_open_circuit(url)
+
+        max_retries = self._max_retries(method)
+        if self._sends_hedged(method, hedge):
+            send = self._ahedged_request
+        else:
+            send = self._atimed_request
+        retry_number = 0
+        while True:
+            has_retries_left = retry_number < max_retries
+            await self._aacquire_rate_limit(url)
+            try:
+                response = await send(
+                    method,
+                    url,
+                    timeout=self.deadline.remaining(),
+                    **kwargs
+                )
+            except httpx.TransportError as e:
+                self._check_failed_attempt(url, e, has_retries_left)
+            else:
+                if not self._should_retry(url, response, has_retries_left):
+                    return response
+
+            retry_number += 1
+            await asyncio.sleep(self._retry_backoff(url, retry_number))
+            self.deadline.raise_if_expired(url)
+
+    def _coalesce(
+        self,
+        key: Hashable,
+        source: str,
+        fn: Callable[[], Any],
+    ) -> Any:
+        """
+        Share the result of fn() with identical calls made at the same time.
+
+        The key must tell apart everything that can change the result,
+        the url and the identity of the credentials used at least. Callers
+        must not mutate the shared result.
+        """
+        try:
+            return single_flight.do(
+                key,
+                fn,
+                timeout=self.deadline.remaining(),
+            )
+        except SingleFlightTimeout as e:
+            raise self.deadline.exceeded_error(source) from e
+
+    async def _acoalesce(
+        self,
+        key: Hashable,
+        source: str,
+        fn: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        _coalesce() for coroutines, shared with identical calls made from
+        the same event loop.
+        """
+        try:
+            return await async_single_flight.do(
+                key,
+                fn,
+                timeout=self.deadline.remaining(),
+            )
+        except SingleFlightTimeout as e:
+            raise self.deadline.exceeded_error(source) from e
+
+    def _get_cached(self, key: Hashable) -> Optional[CacheEntry]:
+        """
+        The cached entry for key, if the request allows using one. It may
+        be stale, see _refresh_in_background().
+
+        The key must tell apart everything that can change the response,
+        the LMS base url, the resource and the identity of the credentials.
+        """
+        cache_entry = read_cache.get_entry(key) if self.cache_reads else None
+        if cache_entry is None:
+            self.cache_statuses.append(CacheStatus.miss)
+            return None
+        if cache_entry.is_stale:
+            self.cache_statuses.append(CacheStatus.stale)
+        else:
+            self.cache_statuses.append(CacheStatus.hit)
+        self.cache_age = max(cache_entry.age, self.cache_age or 0)
+        return cache_entry
+
+    def _set_cached(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float,
+        tag_tokens: Tuple[Tuple[str, Optional[str]], ...] = (),
+        validators: Tuple[Tuple[str, str], ...] = (),
+    ) -> None:
+        """
+        :param tag_tokens: from _get_tag_tokens(), taken before value was
+            fetched.
+        :param validators: of the upstream response, see get_validators()
+        """
+        if self.cache_writes and ttl > 0:
+            read_cache.set(
+                key,
+                value,
+                ttl,
+                tags=tag_tokens,
+                validators=validators,
+            )
+
+    def _get_revalidation_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        """
+        The cached entry for key to send a conditional request with, when
+        it could not be used as is, e.x. it is being refreshed or the
+        client asked for Cache-Control: no-cache. Only entries with
+        validators are returned.
+        """
+        # When reads may use the cache a miss means there is no entry.
+        if self.cache_reads or not self.cache_writes:
+            return None
+        cache_entry = read_cache.get_entry(key)
+        if cache_entry is None or not cache_entry.validators:
+            return None
+        return cache_entry
+
+    @staticmethod
+    def _get_tag_tokens(
+        tags: Iterable[str],
+    ) -> Tuple[Tuple[str, Optional[str]], ...]:
+        """
+        Tags name what a cached read depends on, e.x. the url of an
+        assignment. Writes to it call _invalidate_cached() with the same
+        tags, which drops the entries of every set of credentials.
+        """
+        return read_cache.tag_tokens(tags)
+
+    @staticmethod
+    def _invalidate_cached(tags: Iterable[str]) -> None:
+        read_cache.invalidate_tags(tags)
+
+    @staticmethod
+    def _refresh_in_background(key: Hashable, refresh: Callable[[], Any]):
+        """
+        Run refresh(), which must store a fresh entry for key, off the
+        request thread. Only one refresh per key runs at a time.
+        """
+        if not read_cache.start_refresh(key):
+            return
+
+        def run_refresh():
+            try:
+                refresh()
+            except Exception:
+                logger.info(traceback.format_exc())
+            finally:
+                read_cache.end_refresh(key)
+
+        get_background_executor().submit(run_refresh)
+
+    def fan_out(
+        self,
+        fn: Callable[[Any], Any],
+        items: Iterable[Any],
+        source: str,
+        max_concurrency: Optional[int] = None,
+    ) -> FanOutResult:
+        """
+        Call fn for every item in parallel, e.x. to list the students of
+        many courses in about the time it takes to list one.
+
+        The calls share this connector and its deadline, see fan_out_calls()
+        for how failures and the deadline are handled.
+        """
+        return fan_out_calls(
+            fn,
+            items,
+            deadline=self.deadline,
+            source=source,
+            max_concurrency=max_concurrency,
+        )
+
+    @property
+    def upstream_headers(self) -> Dict[str, str]:
+        """
+        Headers telling the caller how upstream calls went for this request.
+        """
+        headers = {
+            UPSTREAM_RETRIES_HEADER: str(self.upstream_retries),
+            UPSTREAM_HEDGES_HEADER: str(self.upstream_hedges),
+        }
+        if self.circuit_states:
+            headers[CIRCUIT_STATE_HEADER] = ', '.join(
+                f'{host_key}={state.value}'
+                for host_key, state in sorted(self.circuit_states.items())
+            )
+        queue_depths = self.rate_limit_queue_depths.items()
+        if any(queue_depth for _, queue_depth in queue_depths):
+            headers[RATE_LIMIT_QUEUE_HEADER] = ', '.join(
+                f'{host_key}={queue_depth}'
+                for host_key, queue_depth in sorted(queue_depths)
+            )
+        if self.cache_statuses:
+            # The worst of what the reads for the request got.
+            for cache_status in CacheStatus.stale, CacheStatus.miss:
+                if cache_status in self.cache_statuses:
+                    break
+            else:
+                cache_status = CacheStatus.hit
+            headers[CACHE_STATUS_HEADER] = cache_status.value
+        if self.cache_age is not None:
+            headers['Age'] = str(int(self.cache_age))
+        return headers
 
     @classmethod
     @contextmanager
     def _raise_thirdparty_error_on_error(cls, url):
         try:
             yield
+        except ErrorLCResponse:
+            raise
         except Exception as e:
             logger.info(traceback.format_exc())
             error = FormattedError(
@@ -123,6 +841,27 @@ class AbstractLMSConnector:
         Pull a list of students for the selected course
         """
 
+    def iter_courses(self) -> Iterator[Course]:
+        """
+        list_courses() without building the list. The LMS is called before
+        this returns, only the mapping to Courses is lazy.
+        """
+        return iter(self.list_courses())
+
+    def iter_students_in_course(
+        self,
+        lms_course_id: str,
+        course_sections: Optional[List[str]] = None
+    ) -> Iterator[Student]:
+        """
+        list_students_in_course() without building the list, see
+        iter_courses().
+        """
+        return iter(self.list_students_in_course(
+            lms_course_id,
+            course_sections,
+        ))
+
     @abstractmethod
     def create_grade_for_course(
         self,
@@ -265,3 +1004,210 @@ class AbstractLMSConnector:
         :param external_assignment_id: When possible, store external id
             in the LMS. This is the ID generated by you and not the LMS
         """
+
+    def check_assignments_exist(
+        self,
+        lms_course_id: str,
+        lms_assignment_ids: List[str],
+    ) -> List[AssignmentExistence]:
+        """
+        Check that many assignments exist at once, e.x. before posting
+        grades to them, with get_assignment() calls made in parallel.
+
+        An assignment get_assignment() fails with lms_not_found for is
+        missing, any other failure is reported as an error for its id.
+
+        :param lms_course_id: id of the remote lms course
+        :param lms_assignment_ids: ids of the remote lms assignments, the
+            results are in the same order.
+        """
+        fan_out_result = self.fan_out(
+            partial(self.get_assignment, lms_course_id),
+            lms_assignment_ids,
+            source=f'assignments of course {lms_course_id}',
+        )
+        existences = []
+        for index, lms_assignment_id in enumerate(lms_assignment_ids):
+            failure = fan_out_result.failures.get(index)
+            if failure is None:
+                existences.append(AssignmentExistence(
+                    lms_assignment_id=lms_assignment_id,
+                    status=AssignmentExistenceStatus.found,
+                    assignment=fan_out_result.results[index],
+                ))
+            elif failure.status_code == status.HTTP_404_NOT_FOUND and all(
+                error['code'] == ErrorResponseCodes.lms_not_found.value
+                for error in failure.errors
+            ):
+                existences.append(AssignmentExistence(
+                    lms_assignment_id=lms_assignment_id,
+                    status=AssignmentExistenceStatus.missing,
+                ))
+            else:
+                existences.append(AssignmentExistence(
+                    lms_assignment_id=lms_assignment_id,
+                    status=AssignmentExistenceStatus.error,
+                    errors=failure.errors,
+                ))
+        return existences
+
+    # Async counterparts of the interface above. By default they run the
+    # sync method in a thread, connectors should override them with calls
+    # made through _arequest().
+
+    async def _run_in_thread(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a sync connector method without blocking the event loop.
+
+        Not the background executor, sync methods wait on work they submit
+        to it and could starve it.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            partial(fn, *args, **kwargs),
+        )
+
+    async def alist_courses(self) -> List[Course]:
+        return await self._run_in_thread(self.list_courses)
+
+    async def alist_students_in_course(
+        self,
+        lms_course_id: str,
+        course_sections: Optional[List[str]] = None
+    ) -> List[Student]:
+        return await self._run_in_thread(
+            self.list_students_in_course,
+            lms_course_id,
+            course_sections,
+        )
+
+    async def acreate_grade_for_course(
+        self,
+        lms_course_id: str,
+        grade_details: Dict,
+        sections_info=[],
+    ) -> Dict:
+        return await self._run_in_thread(
+            self.create_grade_for_course,
+            lms_course_id,
+            grade_details,
+            sections_info,
+        )
+
+    async def acreate_or_update_grade_for_student(
+        self,
+        lms_course_id: str,
+        lms_student_id: str,
+        grade: float,
+    ) -> List[Dict]:
+        return await self._run_in_thread(
+            self.create_or_update_grade_for_student,
+            lms_course_id,
+            lms_student_id,
+            grade,
+        )
+
+    async def aupdate_grade_for_course(
+        self,
+        lms_course_id: str,
+        lms_student_id: str,
+        grade: float,
+    ) -> None:
+        return await self._run_in_thread(
+            self.update_grade_for_course,
+            lms_course_id,
+            lms_student_id,
+            grade,
+        )
+
+    async def adelete_grade_for_course(
+        self,
+        lms_course_id: str,
+        lms_grade_column_id: str,
+    ) -> None:
+        return await self._run_in_thread(
+            self.delete_grade_for_course,
+            lms_course_id,
+            lms_grade_column_id,
+        )
+
+    async def alist_sections_for_course(
+        self,
+        lms_course_id: str
+    ) -> List[Dict]:
+        return await self._run_in_thread(
+            self.list_sections_for_course,
+            lms_course_id,
+        )
+
+    async def aget_current_user_info(self) -> LMSUser:
+        return await self._run_in_thread(self.get_current_user_info)
+
+    async def aget_assignment(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+    ) -> Assignment:
+        return await self._run_in_thread(
+            self.get_assignment,
+            lms_course_id,
+            lms_assignment_id,
+        )
+
+    async def acheck_assignments_exist(
+        self,
+        lms_course_id: str,
+        lms_assignment_ids: List[str],
+    ) -> List[AssignmentExistence]:
+        return await self._run_in_thread(
+            self.check_assignments_exist,
+            lms_course_id,
+            lms_assignment_ids,
+        )
+
+    async def apost_assignment(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+        max_grade: str,
+        external_assignment_id: str = None
+    ):
+        return await self._run_in_thread(
+            self.post_assignment,
+            lms_course_id,
+            lms_assignment_id,
+            max_grade,
+            external_assignment_id,
+        )
+
+    async def aupdate_assignment(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+        max_grade: str,
+        external_assignment_id: str = None
+    ):
+        return await self._run_in_thread(
+            self.update_assignment,
+            lms_course_id,
+            lms_assignment_id,
+            max_grade,
+            external_assignment_id,
+        )
+
+    async def apost_grades(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+        max_grade: str,
+        student_grade_info: List[dict],
+        external_assignment_id: str = None
+    ):
+        return await self._run_in_thread(
+            self.post_grades,
+            lms_course_id,
+            lms_assignment_id,
+            max_grade,
+            student_grade_info,
+            external_assignment_id,
+        )
@@ -1,2 +1,135 @@
+from typing import Dict, List, Optional
+import hashlib
+
+from django.utils.crypto import salted_hmac
+
+from lms_connector.helpers import raise_for_missing_headers
+
+HTTP_LMS_TYPE = 'HTTP_LMS_TYPE'
+HTTP_LMS_BASE_URL = 'HTTP_LMS_BASE_URL'
+HTTP_LMS_CLIENT_KEY = 'HTTP_LMS_CLIENT_KEY'
+HTTP_LMS_CLIENT_SECRET = 'HTTP_LMS_CLIENT_SECRET'
+HTTP_LMS_OAUTH_TOKEN = 'HTTP_LMS_OAUTH_TOKEN'
+HTTP_LMS_OAUTH_SECRET = 'HTTP_LMS_OAUTH_SECRET'
+
+# Needed to make calls to an LMS on behalf of a user.
+DEFAULT_REQUIRED_HEADERS = [
+    HTTP_LMS_BASE_URL,
+    HTTP_LMS_CLIENT_KEY,
+    HTTP_LMS_OAUTH_TOKEN,
+]
+# Needed to start authorizing a user.
+AUTH_REQUIRED_HEADERS = [
+    HTTP_LMS_TYPE,
+    HTTP_LMS_BASE_URL,
+    HTTP_LMS_CLIENT_KEY,
+    HTTP_LMS_CLIENT_SECRET,
+]
+
+# Incoming header -> CredsEnvelope attribute
+HEADER_FIELDS = (
+    (HTTP_LMS_TYPE, 'lms_type'),
+    (HTTP_LMS_BASE_URL, 'lms_base_url'),
+    (HTTP_LMS_CLIENT_KEY, 'client_key'),
+    (HTTP_LMS_CLIENT_SECRET, 'client_secret'),
+    (HTTP_LMS_OAUTH_TOKEN, 'oauth_token'),
+    (HTTP_LMS_OAUTH_SECRET, 'oauth_secret'),
+)
+SECRET_FIELDS = ('client_secret', 'oauth_token', 'oauth_secret')
+# The incoming headers as sent by clients, e.x. LMS-BASE-URL
+CREDENTIAL_HEADER_NAMES = tuple(
+    header[len('HTTP_'):].replace('_', '-') for header, _ in HEADER_FIELDS
+)
+
+
 class CredsEnvelope:
-    pass
+    """
+    The LMS a request is for and the credentials to use with it.
+
+    Built once per request from the incoming headers. It is immutable and
+    hashable, and its identity, a digest of everything in it, is the key
+    under which anything kept per set of credentials is stored so that the
+    credentials themselves never are.
+    """
+    __slots__ = tuple(field for _, field in HEADER_FIELDS) + ('identity',)
+
+    def __init__(
+        self,
+        lms_type: Optional[str] = None,
+        lms_base_url: Optional[str] = None,
+        client_key: Optional[str] = None,
+        client_secret: Optional[str] = None,
+        oauth_token: Optional[str] = None,
+        oauth_secret: Optional[str] = None,
+    ):
+        values = {
+            'lms_type': lms_type,
+            'lms_base_url': lms_base_url,
+            'client_key': client_key,
+            'client_secret': client_secret,
+            'oauth_token': oauth_token,
+            'oauth_secret': oauth_secret,
+        }
+        for field, value in values.items():
+            object.__setattr__(self, field, value)
+
+        identity_source = '\n'.join(
+            f'{field}={values[field] or ""}'
+            for _, field in HEADER_FIELDS
+        )
+        object.__setattr__(
+            self,
+            'identity',
+            hashlib.sha256(identity_source.encode('utf-8')).hexdigest(),
+        )
+
+    @classmethod
+    def from_request_meta(
+        cls,
+        incoming_headers: Dict,
+        required_headers: List[str],
+    ) -> 'CredsEnvelope':
+        """
+        :param incoming_headers: request.META
+        :param required_headers: headers which must be present, in their
+            internal form e.x. HTTP_LMS_BASE_URL
+        """
+        raise_for_missing_headers(incoming_headers, required_headers)
+        return cls(**{
+            field: incoming_headers.get(header)
+            for header, field in HEADER_FIELDS
+        })
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Tells sets of credentials apart without revealing them, it is keyed
+        with SECRET_KEY so that it can not be checked against guesses.
+        """
+        return salted_hmac(
+            'lms_connector.credential_fingerprint',
+            self.identity,
+        ).hexdigest()[:32]
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, CredsEnvelope) and
+            self.identity == other.identity
+        )
+
+    def __hash__(self):
+        return hash(self.identity)
+
+    def __repr__(self):
+        fields = ', '.join(
+            f'{field}=***' if field in SECRET_FIELDS
+            else f'{field}={getattr(self, field)!r}'
+            for _, field in HEADER_FIELDS
+        )
+        return f'{type(self).__name__}({fields})'
@@ -0,0 +1,106 @@
+from typing import Dict, Optional, Tuple
+import time
+
+from django.conf import settings
+from rest_framework import status
+
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+    ErrorResponseDetails,
+    FormattedError,
+)
+
+# Seconds the client is willing to wait, e.x. LMS-Request-Timeout: 10
+HTTP_LMS_REQUEST_TIMEOUT = 'HTTP_LMS_REQUEST_TIMEOUT'
+# Where serverless-wsgi puts the lambda context object in the WSGI environ.
+LAMBDA_CONTEXT_KEYS = ('serverless.context', 'context')
+DEADLINE_SOURCE = 'deadline'
+
+
+class Deadline:
+    """
+    The time budget shared by every upstream call made for one request.
+    """
+    def __init__(self, budget: float):
+        """
+        :param budget: seconds, from now, until the deadline.
+        """
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    @classmethod
+    def from_request_meta(cls, incoming_headers: Dict) -> 'Deadline':
+        """
+        Take the tightest of the configured budget, the budget asked for
+        by the client and the time the lambda has left to run.
+        """
+        budgets = [settings.LMS_REQUEST_BUDGET]
+
+        requested_budget = incoming_headers.get(HTTP_LMS_REQUEST_TIMEOUT)
+        if requested_budget is not None:
+            budgets.append(cls._parse_requested_budget(requested_budget))
+
+        lambda_budget = cls._get_lambda_budget(incoming_headers)
+        if lambda_budget is not None:
+            budgets.append(lambda_budget)
+
+        return cls(budget=max(0, min(budgets)))
+
+    @staticmethod
+    def _parse_requested_budget(requested_budget: str) -> float:
+        try:
+            budget = float(requested_budget)
+        except ValueError:
+            budget = -1
+
+        if budget <= 0:
+            raise ErrorLCResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                errors=[FormattedError(
+                    source=DEADLINE_SOURCE,
+                    code=ErrorResponseCodes.bad_lms_connector_headers,
+                    detail=ErrorResponseDetails.bad_request_timeout(
+                        requested_budget,
+                    ),
+                )],
+            )
+        return budget
+
+    @staticmethod
+    def _get_lambda_budget(incoming_headers: Dict) -> Optional[float]:
+        for context_key in LAMBDA_CONTEXT_KEYS:
+            context = incoming_headers.get(context_key)
+            if hasattr(context, 'get_remaining_time_in_millis'):
+                remaining = context.get_remaining_time_in_millis() / 1000
+                # Leave time to send the error before lambda is killed.
+                return remaining - settings.LMS_DEADLINE_MARGIN
+        return None
+
+    def remaining(self) -> float:
+        return max(0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() == 0
+
+    def timeout(self) -> Tuple[float, float]:
+        """
+        The (connect, read) timeout to give to requests.
+        """
+        remaining = self.remaining()
+        return remaining, remaining
+
+    def raise_if_expired(self, source: str) -> None:
+        if self.expired:
+            raise self.exceeded_error(source)
+
+    def exceeded_error(self, source: str) -> ErrorLCResponse:
+        return ErrorLCResponse(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            errors=[FormattedError(
+                source=source,
+                code=ErrorResponseCodes.deadline_exceeded,
+                detail=ErrorResponseDetails.deadline_exceeded(self.budget),
+            )],
+        )
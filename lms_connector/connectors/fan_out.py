@@ -0,0 +1,151 @@
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import threading
+import traceback
+
+from django.conf import settings
+from rest_framework import status
+
+from lms_connector.connectors.deadline import Deadline
+from lms_connector.lms_connector_logger import logger
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+    FormattedError,
+)
+
+_fan_out_executor: Optional[ThreadPoolExecutor] = None
+_fan_out_executor_lock = threading.Lock()
+
+
+def get_fan_out_executor() -> ThreadPoolExecutor:
+    """
+    The process wide threads fan-outs run on.
+
+    Kept apart from the background executor, work run here waits on work
+    submitted there (hedges) and must not be able to starve it.
+    """
+    global _fan_out_executor
+    if _fan_out_executor is None:
+        with _fan_out_executor_lock:
+            if _fan_out_executor is None:
+                _fan_out_executor = ThreadPoolExecutor(
+                    max_workers=settings.LMS_FAN_OUT_MAX_WORKERS,
+                    thread_name_prefix='lms-fan-out',
+                )
+    return _fan_out_executor
+
+
+class FanOutResult:
+    """
+    The outcome of a fan-out, in the order the items were given.
+
+    results holds None for the items which failed, failures holds the
+    error response for each of those by index.
+    """
+    def __init__(self, size: int):
+        self.results: List[Any] = [None] * size
+        self.failures: Dict[int, ErrorLCResponse] = {}
+
+    @property
+    def errors(self) -> List[FormattedError]:
+        return [
+            error
+            for index in sorted(self.failures)
+            for error in self.failures[index].errors
+        ]
+
+    def raise_for_errors(self) -> None:
+        """
+        Raise one error response holding every error, with the status
+        code of the first item which failed.
+        """
+        if not self.failures:
+            return
+        first_failure = self.failures[min(self.failures)]
+        raise ErrorLCResponse(
+            status_code=first_failure.status_code,
+            errors=self.errors,
+        )
+
+
+def _as_error_response(source: str, exception: Exception) -> ErrorLCResponse:
+    """
+    Must be called while handling exception.
+    """
+    if isinstance(exception, ErrorLCResponse):
+        return exception
+    logger.info(traceback.format_exc())
+    return ErrorLCResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        errors=[FormattedError(
+            source=source,
+            code=ErrorResponseCodes.bad_thirdparty_request,
+            detail=str(exception),
+        )],
+    )
+
+
+def fan_out_calls(
+    fn: Callable[[Any], Any],
+    items: Iterable[Any],
+    deadline: Deadline,
+    source: str,
+    max_concurrency: Optional[int] = None,
+) -> FanOutResult:
+    """
+    Call fn once per item on the fan-out threads, at most max_concurrency
+    at a time.
+
+    A failing item does not stop the others. Items not started by the
+    deadline are not started at all, and those still running then are
+    given up on, both fail with deadline_exceeded.
+
+    :param source: the FormattedError source of errors which fn raised
+        that were not already error responses.
+    :param max_concurrency: defaults to LMS_FAN_OUT_CONCURRENCY.
+    """
+    items = list(items)
+    max_concurrency = max_concurrency or settings.LMS_FAN_OUT_CONCURRENCY
+    executor = get_fan_out_executor()
+    fan_out_result = FanOutResult(len(items))
+    # Future -> index of its item
+    running: Dict[Future, int] = {}
+    next_index = 0
+
+    while next_index < len(items) or running:
+        while next_index < len(items) and len(running) < max_concurrency:
+            future = executor.submit(fn, items[next_index])
+            running[future] = next_index
+            next_index += 1
+
+        done, _ = wait(
+            running,
+            timeout=deadline.remaining(),
+            return_when=FIRST_COMPLETED,
+        )
+        if not done:
+            break
+        for future in done:
+            index = running.pop(future)
+            try:
+                fan_out_result.results[index] = future.result()
+            except Exception as e:
+                fan_out_result.failures[index] = _as_error_response(
+                    source,
+                    e,
+                )
+
+    # Whatever is left ran out of time. Running calls can not be stopped,
+    # their own upstream timeouts are bounded by the same deadline.
+    for future, index in running.items():
+        future.cancel()
+        fan_out_result.failures[index] = deadline.exceeded_error(source)
+    for index in range(next_index, len(items)):
+        fan_out_result.failures[index] = deadline.exceeded_error(source)
+    return fan_out_result
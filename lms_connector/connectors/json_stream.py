@@ -0,0 +1,122 @@
+"""
+Reading one array out of a large json object as its bytes arrive, e.x. the
+sites of direct/site.json, without the whole body being held at once.
+"""
+from typing import Any, Iterable, Iterator
+import codecs
+import json
+
+WHITESPACE = ' \t\r\n'
+
+
+class _ChunkReader:
+    """
+    Json text over an iterable of byte chunks. Only what has not been read
+    yet, and the chunk it started in, is kept.
+    """
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self.text = ''
+        self.position = 0
+        self.at_end = False
+
+    def _read_more(self) -> None:
+        self.text = self.text[self.position:]
+        self.position = 0
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.text += self._text_decoder.decode(b'', final=True)
+            self.at_end = True
+        else:
+            self.text += self._text_decoder.decode(chunk)
+
+    def peek(self) -> str:
+        """
+        The next character which is not whitespace, it is not consumed.
+        """
+        while True:
+            while (
+                self.position < len(self.text) and
+                self.text[self.position] in WHITESPACE
+            ):
+                self.position += 1
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if self.at_end:
+                raise ValueError('json ended early')
+            self._read_more()
+
+    def expect(self, characters: str) -> str:
+        """
+        Consume the next character, which must be one of characters.
+        """
+        character = self.peek()
+        if character not in characters:
+            raise ValueError(
+                f'expected one of {characters!r} in json, got {character!r}'
+            )
+        self.position += 1
+        return character
+
+    def decode_value(self) -> Any:
+        """
+        Consume and decode the next whole json value.
+
+        A value that is not whole yet is only decoded again once twice as
+        much of it has arrived, so a value spanning many chunks is decoded
+        a few times rather than once per chunk. Up to as much again may be
+        read past its end.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(
+                    self.text,
+                    self.position,
+                )
+            except json.JSONDecodeError:
+                if self.at_end:
+                    raise
+            else:
+                # A number at the end may go on in the next chunk.
+                if end < len(self.text) or self.at_end:
+                    self.position = end
+                    return value
+            tried_size = len(self.text) - self.position
+            while (
+                not self.at_end and
+                len(self.text) - self.position < 2 * tried_size
+            ):
+                self._read_more()
+
+
+def iter_array_items(chunks: Iterable[bytes], key: str) -> Iterator[Any]:
+    """
+    The items of the array under key in the top level json object, each
+    decoded on its own as the chunks holding it arrive. Other members are
+    decoded and dropped, nothing past the array is read.
+
+    Yields nothing when the object has no such key, raises ValueError for
+    anything that is not json.
+    """
+    reader = _ChunkReader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.decode_value()
+        reader.expect(':')
+        if name == key:
+            reader.expect('[')
+            if reader.peek() == ']':
+                return
+            while True:
+                yield reader.decode_value()
+                if reader.expect(',]') == ']':
+                    return
+        reader.decode_value()
+        if reader.expect(',}') == '}':
+            return
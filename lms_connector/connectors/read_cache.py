@@ -0,0 +1,494 @@
+from collections import OrderedDict
+from enum import Enum
+from math import ceil
+from typing import (
+    Any,
+    Dict,
+    Hashable,
+    Iterable,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+from uuid import uuid4
+import hashlib
+import json
+import threading
+import time
+import traceback
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from lms_connector.lms_connector_logger import logger
+
+HTTP_CACHE_CONTROL = 'HTTP_CACHE_CONTROL'
+# Bumped whenever what is stored in the shared cache changes shape, entries
+# written in another format are ignored.
+SERIALIZATION_VERSION = 4
+_COMPRESSED = 0x1
+# In process tag tokens kept at most, see LayeredReadCache.tag_tokens().
+MAX_LOCAL_TAGS = 10000
+# Upstream response header -> the conditional request header it is sent back
+# in when revalidating.
+VALIDATOR_HEADERS = (
+    ('ETag', 'If-None-Match'),
+    ('Last-Modified', 'If-Modified-Since'),
+)
+
+
+class CacheStatus(Enum):
+    hit = 'hit'
+    stale = 'stale'
+    miss = 'miss'
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    # Wall clock times, entries are shared between hosts.
+    stored_at: float
+    expires_at: float
+    # (tag, token) pairs, see LayeredReadCache.tag_tokens().
+    tags: Tuple[Tuple[str, Optional[str]], ...] = ()
+    # (header, value) pairs of the upstream response, see get_validators().
+    validators: Tuple[Tuple[str, str], ...] = ()
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() >= self.expires_at
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.stored_at)
+
+
+class ReadCache:
+    """
+    Responses of LMS reads, fresh for a ttl given per entry and then kept,
+    stale, for a further grace period.
+
+    The approximate size, as json, of everything held is bounded by
+    max_bytes, the least recently used entries are dropped to stay under
+    it. Callers must not mutate what they get back, it is shared.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        # key -> (entry, kept until, size)
+        self._entries: OrderedDict = OrderedDict()
+
+    def _pop(self, key: Hashable) -> Optional[tuple]:
+        """
+        Must hold the lock.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+        return entry
+
+    def get_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        """
+        The entry for key, which may be stale.
+        """
+        with self._lock:
+            item = self._pop(key)
+            if item is None:
+                return None
+            entry, kept_until, size = item
+            if kept_until <= time.time():
+                return None
+            self._entries[key] = item
+            self.size += size
+            return entry
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        The value for key, only if it is fresh.
+        """
+        entry = self.get_entry(key)
+        if entry is None or entry.is_stale:
+            return None
+        return entry.value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float,
+        grace: float = 0,
+        stored_at: Optional[float] = None,
+        tags: Tuple[Tuple[str, Optional[str]], ...] = (),
+        validators: Tuple[Tuple[str, str], ...] = (),
+    ) -> None:
+        """
+        :param stored_at: when the value was fetched, now by default.
+        """
+        if stored_at is None:
+            stored_at = time.time()
+        entry = CacheEntry(
+            value,
+            stored_at,
+            stored_at + ttl,
+            tuple(tags),
+            tuple(validators),
+        )
+        size = len(json.dumps(value, separators=(',', ':')))
+        with self._lock:
+            self._pop(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (entry, entry.expires_at + grace, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def dumps_entry(entry: CacheEntry) -> bytes:
+    """
+    A version byte, a flags byte and
+    [stored at, expires at, tags, validators, value] as json, which is zlib
+    compressed once it reaches LMS_CACHE_COMPRESS_MIN_BYTES.
+    """
+    payload = json.dumps(
+        [
+            entry.stored_at,
+            entry.expires_at,
+            entry.tags,
+            entry.validators,
+            entry.value,
+        ],
+        separators=(',', ':'),
+    ).encode('utf-8')
+    flags = 0
+    if len(payload) >= settings.LMS_CACHE_COMPRESS_MIN_BYTES:
+        payload = zlib.compress(payload)
+        flags |= _COMPRESSED
+    return bytes([SERIALIZATION_VERSION, flags]) + payload
+
+
+def loads_entry(data: bytes) -> Optional[CacheEntry]:
+    """
+    The entry of a dumps_entry(), None if it was written in another format.
+    """
+    if not isinstance(data, bytes) or len(data) < 2:
+        return None
+    version, flags = data[0], data[1]
+    if version != SERIALIZATION_VERSION:
+        return None
+    payload = data[2:]
+    if flags & _COMPRESSED:
+        payload = zlib.decompress(payload)
+    stored_at, expires_at, tags, validators, value = json.loads(
+        payload.decode('utf-8')
+    )
+    return CacheEntry(
+        value,
+        stored_at,
+        expires_at,
+        tuple((tag, token) for tag, token in tags),
+        tuple((header, value) for header, value in validators),
+    )
+
+
+class SharedReadCache:
+    """
+    Read cache entries kept in a Django cache, shared by every container
+    and worker that is configured with the same cache backend.
+
+    A failing backend is logged and treated as a miss, it must never fail
+    the request.
+    """
+    def __init__(self, alias: str):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _cache_key(key: Hashable) -> str:
+        # Memcached only takes short keys without spaces.
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return f'lms-read:v{SERIALIZATION_VERSION}:{digest}'
+
+    @staticmethod
+    def _tag_key(tag: str) -> str:
+        digest = hashlib.sha256(tag.encode('utf-8')).hexdigest()
+        return f'lms-tag:{digest}'
+
+    def get_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        try:
+            return loads_entry(self.cache.get(self._cache_key(key)))
+        except Exception:
+            logger.info(traceback.format_exc())
+            return None
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float,
+        grace: float = 0,
+        tags: Tuple[Tuple[str, Optional[str]], ...] = (),
+        validators: Tuple[Tuple[str, str], ...] = (),
+    ) -> None:
+        stored_at = time.time()
+        entry = CacheEntry(
+            value,
+            stored_at,
+            stored_at + ttl,
+            tuple(tags),
+            tuple(validators),
+        )
+        try:
+            self.cache.set(
+                self._cache_key(key),
+                dumps_entry(entry),
+                timeout=max(1, ceil(ttl + grace)),
+            )
+        except Exception:
+            logger.info(traceback.format_exc())
+
+    def delete(self, key: Hashable) -> None:
+        try:
+            self.cache.delete(self._cache_key(key))
+        except Exception:
+            logger.info(traceback.format_exc())
+
+    def get_token(self, tag: str) -> Optional[str]:
+        try:
+            return self.cache.get(self._tag_key(tag))
+        except Exception:
+            logger.info(traceback.format_exc())
+            return None
+
+    def get_or_create_token(self, tag: str) -> Optional[str]:
+        tag_key = self._tag_key(tag)
+        try:
+            token = self.cache.get(tag_key)
+            if token is None:
+                # add() keeps a token another worker has just made.
+                self.cache.add(tag_key, uuid4().hex, timeout=None)
+                token = self.cache.get(tag_key)
+            return token
+        except Exception:
+            logger.info(traceback.format_exc())
+            return None
+
+    def delete_tokens(self, tags: Iterable[str]) -> None:
+        try:
+            self.cache.delete_many([self._tag_key(tag) for tag in tags])
+        except Exception:
+            logger.info(traceback.format_exc())
+
+
+class LayeredReadCache:
+    """
+    The in process cache in front of, when LMS_SHARED_CACHE_ENABLED is
+    on, the shared one. Hits in the shared cache are kept in process for
+    as long as they would be in the shared one.
+    """
+    def __init__(self, local: ReadCache, shared: SharedReadCache):
+        self.local = local
+        self.shared = shared
+        self._lock = threading.Lock()
+        # Keys whose stale entry is being refreshed.
+        self._refreshing: Set[Hashable] = set()
+        # tag -> token, when tokens are not kept in the shared cache.
+        self._local_tokens: OrderedDict = OrderedDict()
+
+    def _get_token(self, tag: str, create: bool = False) -> Optional[str]:
+        if settings.LMS_SHARED_CACHE_ENABLED:
+            if create:
+                return self.shared.get_or_create_token(tag)
+            return self.shared.get_token(tag)
+        with self._lock:
+            token = self._local_tokens.pop(tag, None)
+            if token is None and create:
+                token = uuid4().hex
+            if token is not None:
+                self._local_tokens[tag] = token
+            # A forgotten token only costs a miss.
+            while len(self._local_tokens) > MAX_LOCAL_TAGS:
+                self._local_tokens.popitem(last=False)
+            return token
+
+    def tag_tokens(
+        self,
+        tags: Iterable[str],
+    ) -> Tuple[Tuple[str, Optional[str]], ...]:
+        """
+        The current token of each tag, to store entries depending on them
+        with. Get them before fetching what is stored, so that an
+        invalidation made meanwhile is not missed.
+
+        An entry is only used while the tokens it was stored with are still
+        current, invalidate_tags() drops the tokens of its tags.
+        """
+        return tuple((tag, self._get_token(tag, create=True)) for tag in tags)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> None:
+        """
+        Make every entry depending on any of tags, whichever credentials
+        it was stored for, a miss.
+        """
+        tags = list(tags)
+        with self._lock:
+            for tag in tags:
+                self._local_tokens.pop(tag, None)
+        if settings.LMS_SHARED_CACHE_ENABLED:
+            self.shared.delete_tokens(tags)
+
+    def _is_current(self, entry: CacheEntry) -> bool:
+        return all(
+            token is not None and self._get_token(tag) == token
+            for tag, token in entry.tags
+        )
+
+    def get_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        entry = self.local.get_entry(key)
+        if entry is None and settings.LMS_SHARED_CACHE_ENABLED:
+            entry = self.shared.get_entry(key)
+            if entry is not None:
+                self.local.set(
+                    key,
+                    entry.value,
+                    ttl=entry.expires_at - entry.stored_at,
+                    grace=settings.LMS_CACHE_STALE_GRACE,
+                    stored_at=entry.stored_at,
+                    tags=entry.tags,
+                    validators=entry.validators,
+                )
+        if entry is None:
+            return None
+        if not self._is_current(entry):
+            self.local.delete(key)
+            return None
+        return entry
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.get_entry(key)
+        if entry is None or entry.is_stale:
+            return None
+        return entry.value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: float,
+        tags: Tuple[Tuple[str, Optional[str]], ...] = (),
+        validators: Tuple[Tuple[str, str], ...] = (),
+    ) -> None:
+        """
+        :param tags: from tag_tokens()
+        :param validators: from get_validators()
+        """
+        grace = settings.LMS_CACHE_STALE_GRACE
+        self.local.set(
+            key,
+            value,
+            ttl,
+            grace,
+            tags=tags,
+            validators=validators,
+        )
+        if settings.LMS_SHARED_CACHE_ENABLED:
+            self.shared.set(
+                key,
+                value,
+                ttl,
+                grace,
+                tags=tags,
+                validators=validators,
+            )
+
+    def delete(self, key: Hashable) -> None:
+        self.local.delete(key)
+        if settings.LMS_SHARED_CACHE_ENABLED:
+            self.shared.delete(key)
+
+    def clear(self) -> None:
+        """
+        Only clears the in process cache, others may be using the shared
+        one.
+        """
+        self.local.clear()
+
+    def start_refresh(self, key: Hashable) -> bool:
+        """
+        Mark the entry for key as being refreshed, False if it already is.
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key: Hashable) -> None:
+        with self._lock:
+            self._refreshing.discard(key)
+
+
+read_cache = LayeredReadCache(
+    local=ReadCache(max_bytes=settings.LMS_READ_CACHE_MAX_BYTES),
+    shared=SharedReadCache(alias=settings.LMS_CACHE_ALIAS),
+)
+
+
+def get_cache_directives(incoming_headers: Dict) -> Set[str]:
+    """
+    The directives of the incoming Cache-Control header, e.x. {'no-cache'}
+    """
+    cache_control = incoming_headers.get(HTTP_CACHE_CONTROL) or ''
+    return {
+        directive.split('=', 1)[0].strip().lower()
+        for directive in cache_control.split(',')
+        if directive.strip()
+    }
+
+
+def get_validators(
+    response_headers: Mapping[str, str],
+) -> Tuple[Tuple[str, str], ...]:
+    """
+    The ETag and Last-Modified headers of an upstream response, to
+    revalidate the cached response with, see get_conditional_headers().
+    """
+    return tuple(
+        (header, response_headers[header])
+        for header, _ in VALIDATOR_HEADERS
+        if response_headers.get(header)
+    )
+
+
+def get_conditional_headers(
+    validators: Tuple[Tuple[str, str], ...],
+) -> Dict[str, str]:
+    """
+    The headers which make a GET answer 304 Not Modified when the response
+    the validators came with is still current.
+    """
+    conditional_header_names = dict(VALIDATOR_HEADERS)
+    return {
+        conditional_header_names[header]: value
+        for header, value in validators
+        if header in conditional_header_names
+    }
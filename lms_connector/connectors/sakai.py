@@ -1,16 +1,45 @@
-from typing import Dict, List, Union, Optional
+from collections import OrderedDict
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 from urllib.parse import urljoin
+import re
+import threading
+import time
+import traceback
 
+from django.conf import settings
+from oauthlib.oauth1 import Client as OAuth1Client
 from requests_oauthlib import OAuth1, OAuth1Session
-import re
+from rest_framework import status
+import httpx
 import requests
 
-from lms_connector.helpers import (
-    raise_for_missing_headers,
-)
 from lms_connector.connectors.abstract import (
     AbstractLMSConnector,
 )
+from lms_connector.connectors.creds_envelope import CredsEnvelope
+from lms_connector.connectors.fan_out import get_fan_out_executor
+from lms_connector.connectors.json_stream import iter_array_items
+from lms_connector.connectors.read_cache import (
+    CacheEntry,
+    get_conditional_headers,
+    get_validators,
+)
+from lms_connector.connectors.transport import (
+    get_background_executor,
+    get_host_key,
+)
 from lms_connector.entities import (
     Assignment,
     Course,
@@ -19,68 +48,551 @@ from lms_connector.entities import (
     Role,
     Student,
 )
+from lms_connector.lms_connector_logger import logger
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+    ErrorResponseDetails,
+    FormattedError,
+)
 
 COURSES_RESOURCE = 'direct/site.json'
+# EntityBroker paging, _start counts from 0.
+COURSES_PAGE_RESOURCE = COURSES_RESOURCE + '?_start={start}&_limit={limit}'
 STUDENTS_RESOURCE = 'direct/grades/students/{lms_course_id}.json'
 CURRENT_USER_RESOURCE = 'direct/user/current.json'
 ASSIGNMENT_RESOURCE = (
     'direct/grades/gradeitem/{lms_course_id}/{lms_assignment_id}.json'
 )
 SCORES_RESOURCE = 'direct/grades/gradeitem/{lms_course_id}.json'
+# Of a gradebook item, see _assignment_fields().
+ASSIGNMENT_CACHED_FIELDS = ('id', 'name', 'pointsPossible')
+SESSION_RESOURCE = 'direct/session/current.json'
+# Bytes of direct/site.json read at a time, see _parse_sites().
+SITE_JSON_CHUNK_SIZE = 64 * 1024
+
+SESSION_REJECTED_STATUS_CODES = (
+    status.HTTP_401_UNAUTHORIZED,
+    status.HTTP_403_FORBIDDEN,
+)
+
+
+class SakaiRead(NamedTuple):
+    """
+    A GET of SakaiConnector._get() or _aget() that missed the cache, and
+    what is needed to read and cache its response.
+    """
+    full_url: str
+    coalesce_key: Tuple[str, str, str]
+    cache_key: Tuple[str, str, str]
+    cache_ttl: float
+    tag_tokens: Tuple[str, ...]
+    revalidation_entry: Optional[CacheEntry]
+    not_found_ttl: Optional[float]
+    project: Optional[Callable[[Any], Any]]
+    parse: Optional[Callable[[requests.Response], Any]]
+
+    @property
+    def validators(self) -> Tuple[Tuple[str, str], ...]:
+        """
+        Sent to Sakai to revalidate the stale entry, if there is one.
+        """
+        if self.revalidation_entry is None:
+            return ()
+        return self.revalidation_entry.validators
+
+
+class SakaiSessionCache:
+    """
+    Sakai session ids, per host and set of credentials, that calls can
+    send as a cookie instead of being OAuth1 signed and re-authenticated.
+
+    Only digests of the credentials are kept. Entries expire after ttl
+    seconds without use, the least recently used are dropped beyond
+    max_entries.
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (session id, expires at)
+        self._sessions: OrderedDict = OrderedDict()
+        # Keys whose session is being created.
+        self._pending = set()
+
+    def get(self, key: Tuple[str, str]) -> Optional[str]:
+        with self._lock:
+            session_id, expires_at = self._sessions.pop(key, (None, 0))
+            now = time.monotonic()
+            if session_id is None or expires_at <= now:
+                return None
+            # Sakai sessions expire after inactivity, using one extends it.
+            self._sessions[key] = (session_id, now + self.ttl)
+            return session_id
+
+    def set(self, key: Tuple[str, str], session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+            self._sessions[key] = (session_id, time.monotonic() + self.ttl)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def invalidate(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def start_pending(self, key: Tuple[str, str]) -> bool:
+        """
+        Mark the session for key as being created, False if it already is.
+        """
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+            return True
+
+    def end_pending(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._pending.discard(key)
 
-HTTP_LMS_CLIENT_KEY = 'HTTP_LMS_CLIENT_KEY'
-HTTP_LMS_CLIENT_SECRET = 'HTTP_LMS_CLIENT_SECRET'
-AUTH_REQUIRED_HEADERS = [
-    HTTP_LMS_CLIENT_KEY,
-    HTTP_LMS_CLIENT_SECRET,
-]
-DEFAULT_REQUIRED_HEADERS = [
-    'HTTP_LMS_BASE_URL',
-    'HTTP_LMS_CLIENT_KEY',
-    'HTTP_LMS_OAUTH_TOKEN',
-]
+
+sakai_sessions = SakaiSessionCache(
+    ttl=settings.LMS_SAKAI_SESSION_TTL,
+    max_entries=settings.LMS_SAKAI_SESSION_MAX_ENTRIES,
+)
+
+
+class AsyncOAuth1(httpx.Auth):
+    """
+    OAuth1 sign httpx requests the way requests_oauthlib.OAuth1 signs
+    requests ones, in the Authorization header and without the body.
+    """
+    def __init__(self, creds_envelope: CredsEnvelope):
+        self._client = OAuth1Client(
+            client_key=creds_envelope.client_key,
+            client_secret=creds_envelope.client_secret,
+            resource_owner_key=creds_envelope.oauth_token,
+        )
+
+    def auth_flow(
+        self,
+        request: httpx.Request,
+    ) -> Generator[httpx.Request, httpx.Response, None]:
+        _, headers, _ = self._client.sign(
+            str(request.url),
+            http_method=request.method,
+        )
+        request.headers['Authorization'] = headers['Authorization']
+        yield request
 
 
 class SakaiConnector(AbstractLMSConnector):
     @staticmethod
     def _get_oauth_auth(
-        incoming_headers: Dict,
+        creds_envelope: CredsEnvelope,
     ) -> OAuth1:
 
         return OAuth1(
-            client_key=incoming_headers.get('HTTP_LMS_CLIENT_KEY'),
-            client_secret=incoming_headers.get('HTTP_LMS_CLIENT_SECRET'),
-            resource_owner_key=incoming_headers.get('HTTP_LMS_OAUTH_TOKEN')
+            client_key=creds_envelope.client_key,
+            client_secret=creds_envelope.client_secret,
+            resource_owner_key=creds_envelope.oauth_token,
         )
 
     @classmethod
     def _get_full_url(cls, hostname: str, resource: str) -> str:
         return urljoin(hostname, resource)
 
+    @staticmethod
+    def _get_session_key(
+        creds_envelope: CredsEnvelope,
+        hostname: str,
+    ) -> Tuple[str, str]:
+        return get_host_key(hostname), creds_envelope.identity
+
     @classmethod
-    def _get(
+    def _establish_session(
         cls,
-        incoming_request_headers: Dict,
+        creds_envelope: CredsEnvelope,
+        hostname: str,
+        session_key: Tuple[str, str],
+    ) -> None:
+        """
+        Create a Sakai session with an OAuth1 signed call, and keep its id.
+
+        This runs in the background, with a connector of its own so that it
+        does not count against the deadline of the request which asked.
+        """
+        connector = cls(lms_base_url=hostname)
+        full_url = cls._get_full_url(hostname, SESSION_RESOURCE)
+        try:
+            response = connector._request(
+                'GET',
+                full_url,
+                auth=cls._get_oauth_auth(creds_envelope),
+            )
+            session_id = response.cookies.get(
+                settings.LMS_SAKAI_SESSION_COOKIE
+            )
+            if response.ok and session_id:
+                sakai_sessions.set(session_key, session_id)
+        except Exception:
+            logger.info(traceback.format_exc())
+        finally:
+            sakai_sessions.end_pending(session_key)
+
+    @classmethod
+    def _refresh_cached(
+        cls,
+        creds_envelope: CredsEnvelope,
         hostname: str,
         resource: str,
-    ) -> Union[List[Dict], Dict]:
+        cache_ttl: float,
+        cache_tags: Tuple[str, ...] = (),
+        not_found_ttl: Optional[float] = None,
+        project: Optional[Callable[[Any], Any]] = None,
+        parse: Optional[Callable[[requests.Response], Any]] = None,
+    ) -> None:
         """
-        Wrap requests.get(), add credentials, and format url.
+        Read a resource again to replace its stale cache entry.
+
+        This runs in the background, with a connector of its own, see
+        _establish_session().
         """
+        connector = cls(lms_base_url=hostname)
+        connector._creds_envelope = creds_envelope
+        connector.cache_reads = False
+        connector._get(
+            creds_envelope,
+            hostname,
+            resource,
+            cache_ttl=cache_ttl,
+            cache_tags=cache_tags,
+            not_found_ttl=not_found_ttl,
+            project=project,
+            parse=parse,
+        )
 
-        raise_for_missing_headers(
-            incoming_request_headers,
-            DEFAULT_REQUIRED_HEADERS,
+    def _authenticated_request(
+        self,
+        method: str,
+        creds_envelope: CredsEnvelope,
+        hostname: str,
+        full_url: str,
+        **kwargs
+    ) -> requests.Response:
+        """
+        Make a call as the user the incoming credentials belong to.
+
+        With LMS_SAKAI_SESSION_REUSE on, a Sakai session created for the
+        credentials is used when there is one. Otherwise the call is OAuth1
+        signed, and a session is created in the background for later calls.
+        Calls that Sakai refuses with the session are signed and tried again,
+        when it refuses those too, reads cached for the credentials, see
+        _credentials_tag(), are dropped.
+        """
+        if settings.LMS_SAKAI_SESSION_REUSE:
+            session_key = self._get_session_key(creds_envelope, hostname)
+            session_id = sakai_sessions.get(session_key)
+            if session_id is not None:
+                response = self._request(
+                    method,
+                    full_url,
+                    cookies={settings.LMS_SAKAI_SESSION_COOKIE: session_id},
+                    **kwargs
+                )
+                if response.status_code not in SESSION_REJECTED_STATUS_CODES:
+                    return response
+                response.close()
+                sakai_sessions.invalidate(session_key)
+            elif sakai_sessions.start_pending(session_key):
+                get_background_executor().submit(
+                    self._establish_session,
+                    creds_envelope,
+                    hostname,
+                    session_key,
+                )
+
+        response = self._request(
+            method,
+            full_url,
+            auth=self._get_oauth_auth(creds_envelope),
+            **kwargs
         )
+        if response.status_code in SESSION_REJECTED_STATUS_CODES:
+            self._invalidate_cached([self._credentials_tag(creds_envelope)])
+        return response
+
+    async def _aauthenticated_request(
+        self,
+        method: str,
+        creds_envelope: CredsEnvelope,
+        hostname: str,
+        full_url: str,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        _authenticated_request() for coroutines.
+        """
+        if settings.LMS_SAKAI_SESSION_REUSE:
+            session_key = self._get_session_key(creds_envelope, hostname)
+            session_id = sakai_sessions.get(session_key)
+            if session_id is not None:
+                cookie = f'{settings.LMS_SAKAI_SESSION_COOKIE}={session_id}'
+                headers = dict(kwargs.get('headers', {}), Cookie=cookie)
+                response = await self._arequest(
+                    method,
+                    full_url,
+                    **dict(kwargs, headers=headers)
+                )
+                if response.status_code not in SESSION_REJECTED_STATUS_CODES:
+                    return response
+                sakai_sessions.invalidate(session_key)
+            elif sakai_sessions.start_pending(session_key):
+                get_background_executor().submit(
+                    self._establish_session,
+                    creds_envelope,
+                    hostname,
+                    session_key,
+                )
 
-        auth = cls._get_oauth_auth(
-            incoming_request_headers,
+        response = await self._arequest(
+            method,
+            full_url,
+            auth=AsyncOAuth1(creds_envelope),
+            **kwargs
         )
-        full_url = cls._get_full_url(hostname, resource)
+        if response.status_code in SESSION_REJECTED_STATUS_CODES:
+            self._invalidate_cached([self._credentials_tag(creds_envelope)])
+        return response
 
-        with cls._raise_thirdparty_error_on_error(full_url):
-            request_response = requests.get(full_url, auth=auth)
-            response_json = request_response.json()
+    def _start_read(
+        self,
+        creds_envelope: CredsEnvelope,
+        hostname: str,
+        resource: str,
+        cache_ttl: float,
+        cache_tags: Tuple[str, ...],
+        not_found_ttl: Optional[float],
+        project: Optional[Callable[[Any], Any]],
+        parse: Optional[Callable[[requests.Response], Any]],
+    ) -> Tuple[Optional[CacheEntry], Optional[SakaiRead]]:
+        """
+        Look a GET up in the cache, the entry is returned when there is
+        one, a stale entry is also refreshed in the background. Otherwise
+        the GET has to be made, see _read_response().
+        """
+        full_url = self._get_full_url(hostname, resource)
+        cache_key = (hostname, resource, creds_envelope.identity)
+        tag_tokens = ()
+        revalidation_entry = None
+        if cache_ttl:
+            cache_entry = self._get_cached(cache_key)
+            if cache_entry is not None:
+                if cache_entry.is_stale:
+                    self._refresh_in_background(cache_key, partial(
+                        self._refresh_cached,
+                        creds_envelope,
+                        hostname,
+                        resource,
+                        cache_ttl,
+                        cache_tags,
+                        not_found_ttl,
+                        project,
+                        parse,
+                    ))
+                return cache_entry, None
+            tag_tokens = self._get_tag_tokens(cache_tags)
+            revalidation_entry = self._get_revalidation_entry(cache_key)
+
+        return None, SakaiRead(
+            full_url=full_url,
+            coalesce_key=('GET', full_url, creds_envelope.identity),
+            cache_key=cache_key,
+            cache_ttl=cache_ttl,
+            tag_tokens=tag_tokens,
+            revalidation_entry=revalidation_entry,
+            not_found_ttl=not_found_ttl,
+            project=project,
+            parse=parse,
+        )
+
+    def _read_response(
+        self,
+        sakai_read: SakaiRead,
+        request_response: Union[requests.Response, httpx.Response],
+        ok: bool,
+    ) -> Optional[Union[List[Dict], Dict]]:
+        """
+        Read, and cache, the response to a GET that missed the cache.
+
+        :param ok: whether the response is a success, requests and httpx
+            tell it apart differently.
+        """
+        if (
+            sakai_read.revalidation_entry is not None and
+            request_response.status_code == status.HTTP_304_NOT_MODIFIED
+        ):
+            # A 304 may update the validators, the body stays the same.
+            response_json = sakai_read.revalidation_entry.value
+            validators = (
+                get_validators(request_response.headers) or
+                sakai_read.validators
+            )
+        elif (
+            sakai_read.not_found_ttl is not None and
+            request_response.status_code == status.HTTP_404_NOT_FOUND
+        ):
+            self._set_cached(
+                sakai_read.cache_key,
+                None,
+                sakai_read.not_found_ttl,
+                sakai_read.tag_tokens,
+            )
+            return None
+        elif not ok:
+            # Errors are neither parsed, projected nor cached.
+            if sakai_read.parse is not None or sakai_read.project is not None:
+                raise self._lms_error(
+                    sakai_read.full_url,
+                    request_response.status_code,
+                    request_response.text,
+                )
+            return request_response.json()
+        else:
+            if sakai_read.parse is not None:
+                response_json = sakai_read.parse(request_response)
+            else:
+                response_json = request_response.json()
+            if sakai_read.project is not None:
+                response_json = sakai_read.project(response_json)
+            validators = get_validators(request_response.headers)
+        self._set_cached(
+            sakai_read.cache_key,
+            response_json,
+            sakai_read.cache_ttl,
+            sakai_read.tag_tokens,
+            validators,
+        )
+        return response_json
+
+    def _get(
+        self,
+        creds_envelope: CredsEnvelope,
+        hostname: str,
+        resource: str,
+        hedge: bool = False,
+        cache_ttl: float = 0,
+        cache_tags: Tuple[str, ...] = (),
+        not_found_ttl: Optional[float] = None,
+        project: Optional[Callable[[Any], Any]] = None,
+        parse: Optional[Callable[[requests.Response], Any]] = None,
+    ) -> Optional[Union[List[Dict], Dict]]:
+        """
+        Make a GET through _request(), add credentials, and format url.
+
+        :param hedge: see AbstractLMSConnector._request()
+        :param cache_ttl: seconds the response may be cached for.
+        :param cache_tags: see AbstractLMSConnector._get_tag_tokens()
+        :param not_found_ttl: when given, a 404 from Sakai is answered
+            with None, and cached for these seconds.
+        :param project: applied to the json of a successful response, only
+            what it returns is cached, e.x. the few fields kept of a large
+            object. Failed reads are then raised, see _lms_error().
+        :param parse: reads the json of a successful response in place of
+            Response.json(), the body is streamed to it as it arrives.
+            Failed reads are then raised, like with project.
+        """
+        cache_entry, sakai_read = self._start_read(
+            creds_envelope,
+            hostname,
+            resource,
+            cache_ttl,
+            cache_tags,
+            not_found_ttl,
+            project,
+            parse,
+        )
+        if cache_entry is not None:
+            return cache_entry.value
+
+        def fetch():
+            request_response = self._authenticated_request(
+                'GET',
+                creds_envelope,
+                hostname,
+                sakai_read.full_url,
+                hedge=hedge,
+                headers=get_conditional_headers(sakai_read.validators),
+                stream=parse is not None,
+            )
+            # Also hands a streamed response's connection back to the pool.
+            try:
+                return self._read_response(
+                    sakai_read,
+                    request_response,
+                    request_response.ok,
+                )
+            finally:
+                request_response.close()
+
+        # Identical reads made at the same time share one call to Sakai.
+        with self._raise_thirdparty_error_on_error(sakai_read.full_url):
+            response_json = self._coalesce(
+                sakai_read.coalesce_key,
+                sakai_read.full_url,
+                fetch,
+            )
+
+        return response_json
+
+    async def _aget(
+        self,
+        creds_envelope: CredsEnvelope,
+        hostname: str,
+        resource: str,
+        hedge: bool = False,
+        cache_ttl: float = 0,
+        cache_tags: Tuple[str, ...] = (),
+        not_found_ttl: Optional[float] = None,
+        project: Optional[Callable[[Any], Any]] = None,
+    ) -> Optional[Union[List[Dict], Dict]]:
+        """
+        _get() for coroutines.
+        """
+        cache_entry, sakai_read = self._start_read(
+            creds_envelope,
+            hostname,
+            resource,
+            cache_ttl,
+            cache_tags,
+            not_found_ttl,
+            project,
+            parse=None,
+        )
+        if cache_entry is not None:
+            return cache_entry.value
+
+        async def fetch():
+            request_response = await self._aauthenticated_request(
+                'GET',
+                creds_envelope,
+                hostname,
+                sakai_read.full_url,
+                hedge=hedge,
+                headers=get_conditional_headers(sakai_read.validators),
+            )
+            return self._read_response(
+                sakai_read,
+                request_response,
+                request_response.is_success,
+            )
+
+        with self._raise_thirdparty_error_on_error(sakai_read.full_url):
+            response_json = await self._acoalesce(
+                sakai_read.coalesce_key,
+                sakai_read.full_url,
+                fetch,
+            )
 
         return response_json
 
@@ -94,29 +606,282 @@ class SakaiConnector(AbstractLMSConnector):
             return response_text
 
     @classmethod
-    def _post(
+    def _lms_error(
         cls,
-        incoming_request_headers: Dict,
+        url: str,
+        status_code: int,
+        response_text: str,
+    ) -> ErrorLCResponse:
+        """
+        For reads Sakai failed, with what Sakai said about it.
+        """
+        return ErrorLCResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            errors=[FormattedError(
+                source=url,
+                code=ErrorResponseCodes.bad_thirdparty_request,
+                detail=cls.get_error(response_text),
+                status=status_code,
+            )],
+        )
+
+    def _post(
+        self,
+        creds_envelope: CredsEnvelope,
         hostname: str,
         resource: str,
         json: dict,
     ) -> Union[List[Dict], Dict]:
         """
-        Wrap requests.post(), add credentials, data, and format url.
+        Make a POST through _request(), add credentials, data, and format url.
         """
-        raise_for_missing_headers(
-            incoming_request_headers,
-            DEFAULT_REQUIRED_HEADERS,
-        )
-        auth = cls._get_oauth_auth(incoming_request_headers,)
-        full_url = cls._get_full_url(hostname, resource)
+        full_url = self._get_full_url(hostname, resource)
+
+        with self._raise_thirdparty_error_on_error(full_url):
+            request_response = self._authenticated_request(
+                'POST',
+                creds_envelope,
+                hostname,
+                full_url,
+                json=json,
+            )
+            response_json = request_response.json()
+
+        return response_json
+
+    async def _apost(
+        self,
+        creds_envelope: CredsEnvelope,
+        hostname: str,
+        resource: str,
+        json: dict,
+    ) -> Union[List[Dict], Dict]:
+        """
+        _post() for coroutines.
+        """
+        full_url = self._get_full_url(hostname, resource)
 
-        with cls._raise_thirdparty_error_on_error(full_url):
-            request_response = requests.post(full_url, auth=auth, json=json)
+        with self._raise_thirdparty_error_on_error(full_url):
+            request_response = await self._aauthenticated_request(
+                'POST',
+                creds_envelope,
+                hostname,
+                full_url,
+                json=json,
+            )
             response_json = request_response.json()
 
         return response_json
 
+    @staticmethod
+    def _credentials_tag(creds_envelope: CredsEnvelope) -> str:
+        """
+        What cached reads depend on the credentials still being valid, it
+        is invalidated when Sakai refuses them.
+        """
+        return f'credentials:{creds_envelope.identity}'
+
+    def _assignment_tag(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+    ) -> str:
+        """
+        What cached reads of an assignment depend on, its url.
+        """
+        return self._get_full_url(
+            self.lms_base_url,
+            ASSIGNMENT_RESOURCE.format(
+                lms_course_id=lms_course_id,
+                lms_assignment_id=lms_assignment_id,
+            ),
+        )
+
+    def _after_assignment_write(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+        resp: Dict,
+    ) -> None:
+        """
+        Drop what is cached for an assignment that was just written to, for
+        every set of credentials, and cache what Sakai answered the write
+        with for these credentials. A read of the same gradebook item
+        answers with the same json, less the scores, which are not kept.
+        """
+        assignment_tag = self._assignment_tag(
+            lms_course_id,
+            lms_assignment_id,
+        )
+        self._invalidate_cached([assignment_tag])
+        # lms_assignment_id for sakai is the assignment name
+        if resp.get('name') != lms_assignment_id:
+            return
+        resource = ASSIGNMENT_RESOURCE.format(
+            lms_course_id=lms_course_id,
+            lms_assignment_id=lms_assignment_id,
+        )
+        self._set_cached(
+            (self.lms_base_url, resource, self.creds_envelope.identity),
+            self._assignment_fields(resp),
+            settings.LMS_CACHE_TTL_ASSIGNMENT,
+            self._get_tag_tokens([assignment_tag]),
+        )
+
+    # Mapping of Sakai responses, shared by the sync and async methods.
+
+    @staticmethod
+    def _iter_courses_from_response(
+        courses_response: Dict,
+    ) -> Iterator[Course]:
+        for site in courses_response['site_collection']:
+            pages = site.get('sitePages', [])
+            for page in pages:
+                # Only allow courses using the Gradebook feature.
+                if page['title'] == 'Gradebook':
+                    yield Course(
+                        course_id=site['id'],
+                        title=site['title']
+                    )
+                    break
+
+    @classmethod
+    def _courses_from_response(cls, courses_response: Dict) -> List[Course]:
+        return list(cls._iter_courses_from_response(courses_response))
+
+    @staticmethod
+    def _parse_sites(response: requests.Response) -> Dict:
+        """
+        The sites of a direct/site.json response, with only the fields
+        courses are made from. Every site is decoded, and its other fields
+        dropped, as it streams in, so the whole body, which lists the
+        properties and pages of every site, is never held at once.
+        """
+        chunks = response.iter_content(chunk_size=SITE_JSON_CHUNK_SIZE)
+        sites = [
+            dict(
+                {key: site[key] for key in ('id', 'title') if key in site},
+                sitePages=[
+                    {'title': page.get('title')}
+                    for page in site.get('sitePages') or []
+                ],
+            )
+            for site in iter_array_items(chunks, 'site_collection')
+        ]
+        # Read what follows the sites, a chunk at a time, so the connection
+        # can be used again once the response is closed.
+        for _ in chunks:
+            pass
+        return {'site_collection': sites}
+
+    @staticmethod
+    def _roster_from_response(students_response: Dict) -> List[Dict]:
+        return students_response['grades_collection']
+
+    @staticmethod
+    def _iter_students_from_response(roster: List[Dict]) -> Iterator[Student]:
+        for student in roster:
+            yield Student(
+                student_id=student['userId'],
+                email=student['email'],
+                role=Role.student,
+                first_name=student['fname'],
+                last_name=student['lname'],
+                user_name=student['username'],
+            )
+
+    @classmethod
+    def _students_from_response(cls, roster: List[Dict]) -> List[Student]:
+        return list(cls._iter_students_from_response(roster))
+
+    @staticmethod
+    def _user_from_response(resp: Dict) -> LMSUser:
+        return LMSUser(
+            lms_user_id=resp['id'],
+            email=resp['email'],
+            first_name=resp.get('firstName'),
+            last_name=resp.get('lastName'),
+        )
+
+    def _assignment_not_found(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+    ) -> ErrorLCResponse:
+        return ErrorLCResponse(
+            status_code=status.HTTP_404_NOT_FOUND,
+            errors=[FormattedError(
+                source=self._assignment_tag(lms_course_id, lms_assignment_id),
+                code=ErrorResponseCodes.lms_not_found,
+                detail=ErrorResponseDetails.assignment_not_found(
+                    lms_course_id,
+                    lms_assignment_id,
+                ),
+            )],
+        )
+
+    @staticmethod
+    def _assignment_fields(resp: Dict) -> Dict:
+        """
+        What is cached of a gradebook item, the fields assignments are made
+        from.
+        """
+        return {
+            key: resp[key]
+            for key in ASSIGNMENT_CACHED_FIELDS
+            if key in resp
+        }
+
+    @staticmethod
+    def _assignment_from_response(resp: Dict) -> Assignment:
+        return Assignment(
+            title=resp.get('name'),
+            max_grade=resp.get('pointsPossible'),
+        )
+
+    @staticmethod
+    def _scores_payload(
+        lms_assignment_id: str,
+        max_grade: str,
+        student_grade_info: List[Grade],
+        external_assignment_id: str = None,
+    ) -> Dict:
+        sakai_grade_info = []
+        for grade_info in student_grade_info:
+            sakai_grade_info.append({
+                'userId': grade_info['lms_student_id'],
+                'grade': grade_info['grade'],
+            })
+
+        # lms_assignment_id for sakai is the assignment name
+        return {
+            'name': lms_assignment_id,
+            'externalID': external_assignment_id,
+            'pointsPossible': max_grade,
+            'scores': sakai_grade_info,
+        }
+
+    @staticmethod
+    def _assignment_from_scores_response(resp: Dict) -> Assignment:
+        grades = []
+        for grade_info in resp.get('scores', []):
+            grades.append(Grade(
+                lms_student_id=grade_info.get('userId'),
+                grade=grade_info.get('grade')
+            ))
+
+        return Assignment(
+            title=resp.get('name'),
+            max_grade=resp.get('pointsPossible'),
+            grades=grades,
+        )
+
+    @staticmethod
+    def _without_grades(assignment: Assignment) -> Assignment:
+        if assignment.get('grades'):
+            del assignment['grades']
+        return assignment
+
     def get_auth_url(
         self,
         request_token_url: str,
@@ -124,19 +889,17 @@ class SakaiConnector(AbstractLMSConnector):
         callback_url: str,
     ) -> Dict:
 
-        raise_for_missing_headers(
-            self.incoming_request_headers,
-            AUTH_REQUIRED_HEADERS,
-        )
-
         oauth = OAuth1Session(
-            client_key=self.incoming_request_headers[HTTP_LMS_CLIENT_KEY],
-            client_secret=(
-                self.incoming_request_headers[HTTP_LMS_CLIENT_SECRET]),
+            client_key=self.creds_envelope.client_key,
+            client_secret=self.creds_envelope.client_secret,
             signature_type='auth_header',
             callback_uri=callback_url,
         )
-        request_token = oauth.fetch_request_token(request_token_url)
+        self.deadline.raise_if_expired(request_token_url)
+        request_token = oauth.fetch_request_token(
+            request_token_url,
+            timeout=self.deadline.timeout(),
+        )
 
         auth_url = (
             f'{authorize_url}'
@@ -148,59 +911,154 @@ class SakaiConnector(AbstractLMSConnector):
             'oauth_token_secret': request_token.get('oauth_token_secret'),
         }
 
+    def _get_sites(self, resource: str) -> Dict:
+        return self._get(
+            self.creds_envelope,
+            self.lms_base_url,
+            resource,
+            hedge=True,
+            cache_ttl=settings.LMS_CACHE_TTL_COURSES,
+            parse=self._parse_sites,
+        )
+
+    def _iter_sites_responses(self) -> Iterator[Dict]:
+        """
+        The site collection a page at a time, see LMS_SAKAI_SITES_PAGE_SIZE.
+        The first page is read before this returns, so that Sakai failing
+        is raised to the caller rather than part way through its response.
+        """
+        page_size = settings.LMS_SAKAI_SITES_PAGE_SIZE
+        if not page_size:
+            return iter([self._get_sites(COURSES_RESOURCE)])
+        first_page = self._get_sites(
+            COURSES_PAGE_RESOURCE.format(start=0, limit=page_size),
+        )
+        return self._iter_later_sites_responses(first_page, page_size)
+
+    def _iter_later_sites_responses(
+        self,
+        sites_response: Dict,
+        page_size: int,
+    ) -> Iterator[Dict]:
+        """
+        The pages from sites_response on. The next page is read while the
+        current one is used, and no more are read once the caller stops.
+
+        Sites already seen are dropped, a site joined while paging moves
+        the others along. Paging ends with a short page or one with nothing
+        new, which is also how a Sakai that ignores paging is handled.
+        """
+        seen_site_ids = set()
+        start = 0
+        next_page = None
+        try:
+            while True:
+                sites = sites_response['site_collection']
+                new_sites = [
+                    site for site in sites
+                    if site.get('id') not in seen_site_ids
+                ]
+                seen_site_ids.update(site.get('id') for site in new_sites)
+                start += page_size
+                if len(sites) >= page_size and new_sites:
+                    next_page = get_fan_out_executor().submit(
+                        self._get_sites,
+                        COURSES_PAGE_RESOURCE.format(
+                            start=start,
+                            limit=page_size,
+                        ),
+                    )
+                yield {'site_collection': new_sites}
+                if next_page is None:
+                    return
+                sites_response = next_page.result()
+                next_page = None
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    def iter_courses(self) -> Iterator[Course]:
+        return (
+            course
+            for sites_response in self._iter_sites_responses()
+            for course in self._iter_courses_from_response(sites_response)
+        )
+
     def list_courses(self) -> List[Course]:
-        courses_response = self._get(
-            self.incoming_request_headers,
+        return list(self.iter_courses())
+
+    async def alist_courses(self) -> List[Course]:
+        courses_response = await self._aget(
+            self.creds_envelope,
             self.lms_base_url,
             COURSES_RESOURCE,
+            hedge=True,
+            cache_ttl=settings.LMS_CACHE_TTL_COURSES,
         )
-        courses = []
-        for site in courses_response['site_collection']:
-            pages = site.get('sitePages', [])
-            for page in pages:
-                # Only allow courses using the Gradebook feature.
-                if page['title'] == 'Gradebook':
-                    courses.append(Course(
-                        course_id=site['id'],
-                        title=site['title']
-                    ))
-                    break
-        return courses
+        return self._courses_from_response(courses_response)
+
+    def iter_students_in_course(
+        self,
+        lms_course_id: str,
+        course_sections: Optional[List[str]] = None
+    ) -> Iterator[Student]:
+        # Read before streaming starts, so a failed read is an error
+        # response rather than a 200 that ends in an error.
+        roster = self._get(
+            self.creds_envelope,
+            self.lms_base_url,
+            STUDENTS_RESOURCE.format(lms_course_id=lms_course_id),
+            hedge=True,
+            cache_ttl=settings.LMS_CACHE_TTL_STUDENTS,
+            project=self._roster_from_response,
+        )
+        return self._iter_students_from_response(roster)
 
     def list_students_in_course(
         self,
         lms_course_id: str,
         course_sections: Optional[List[str]] = None
     ):
-        students_response: List[Dict] = self._get(
-            self.incoming_request_headers,
+        return list(self.iter_students_in_course(
+            lms_course_id,
+            course_sections,
+        ))
+
+    async def alist_students_in_course(
+        self,
+        lms_course_id: str,
+        course_sections: Optional[List[str]] = None
+    ):
+        roster = await self._aget(
+            self.creds_envelope,
             self.lms_base_url,
             STUDENTS_RESOURCE.format(lms_course_id=lms_course_id),
-        )['grades_collection']
-
-        students = []
-        for student in students_response:
-            students.append(Student(
-                student_id=student['userId'],
-                email=student['email'],
-                role=Role.student,
-                first_name=student['fname'],
-                last_name=student['lname'],
-                user_name=student['username'],
-            ))
-        return students
+            hedge=True,
+            cache_ttl=settings.LMS_CACHE_TTL_STUDENTS,
+            project=self._roster_from_response,
+        )
+        return self._students_from_response(roster)
 
     def get_current_user_info(self) -> LMSUser:
-        resp = self._get(
-            self.incoming_request_headers,
+        # Only the LMSUser is kept of Sakai's large profile object.
+        return self._get(
+            self.creds_envelope,
             self.lms_base_url,
             CURRENT_USER_RESOURCE,
+            cache_ttl=settings.LMS_CACHE_TTL_CURRENT_USER,
+            cache_tags=(self._credentials_tag(self.creds_envelope),),
+            project=self._user_from_response,
         )
-        return LMSUser(
-            lms_user_id=resp['id'],
-            email=resp['email'],
-            first_name=resp.get('firstName'),
-            last_name=resp.get('lastName'),
+
+    async def aget_current_user_info(self) -> LMSUser:
+        # Only the LMSUser is kept of Sakai's large profile object.
+        return await self._aget(
+            self.creds_envelope,
+            self.lms_base_url,
+            CURRENT_USER_RESOURCE,
+            cache_ttl=settings.LMS_CACHE_TTL_CURRENT_USER,
+            cache_tags=(self._credentials_tag(self.creds_envelope),),
+            project=self._user_from_response,
         )
 
     def get_assignment(
@@ -210,17 +1068,45 @@ class SakaiConnector(AbstractLMSConnector):
     ):
         # lms_assignment_id for sakai is the assignment name
         resp = self._get(
-            self.incoming_request_headers,
+            self.creds_envelope,
             self.lms_base_url,
             ASSIGNMENT_RESOURCE.format(
                 lms_course_id=lms_course_id,
                 lms_assignment_id=lms_assignment_id,
             ),
+            cache_ttl=settings.LMS_CACHE_TTL_ASSIGNMENT,
+            cache_tags=(
+                self._assignment_tag(lms_course_id, lms_assignment_id),
+            ),
+            not_found_ttl=settings.LMS_CACHE_TTL_ASSIGNMENT_MISSING,
+            project=self._assignment_fields,
         )
-        return Assignment(
-            title=resp.get('name'),
-            max_grade=resp.get('pointsPossible'),
+        if resp is None:
+            raise self._assignment_not_found(lms_course_id, lms_assignment_id)
+        return self._assignment_from_response(resp)
+
+    async def aget_assignment(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+    ):
+        resp = await self._aget(
+            self.creds_envelope,
+            self.lms_base_url,
+            ASSIGNMENT_RESOURCE.format(
+                lms_course_id=lms_course_id,
+                lms_assignment_id=lms_assignment_id,
+            ),
+            cache_ttl=settings.LMS_CACHE_TTL_ASSIGNMENT,
+            cache_tags=(
+                self._assignment_tag(lms_course_id, lms_assignment_id),
+            ),
+            not_found_ttl=settings.LMS_CACHE_TTL_ASSIGNMENT_MISSING,
+            project=self._assignment_fields,
         )
+        if resp is None:
+            raise self._assignment_not_found(lms_course_id, lms_assignment_id)
+        return self._assignment_from_response(resp)
 
     def post_assignment(
         self,
@@ -236,9 +1122,23 @@ class SakaiConnector(AbstractLMSConnector):
             student_grade_info=[],
             external_assignment_id=external_assignment_id,
         )
-        if assignment.get('grades'):
-            del assignment['grades']
-        return assignment
+        return self._without_grades(assignment)
+
+    async def apost_assignment(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+        max_grade: str,
+        external_assignment_id: str = None
+    ):
+        assignment = await self.apost_grades(
+            lms_course_id=lms_course_id,
+            lms_assignment_id=lms_assignment_id,
+            max_grade=max_grade,
+            student_grade_info=[],
+            external_assignment_id=external_assignment_id,
+        )
+        return self._without_grades(assignment)
 
     def update_assignment(
         self,
@@ -254,9 +1154,23 @@ class SakaiConnector(AbstractLMSConnector):
             student_grade_info=[],
             external_assignment_id=external_assignment_id,
         )
-        if assignment.get('grades'):
-            del assignment['grades']
-        return assignment
+        return self._without_grades(assignment)
+
+    async def aupdate_assignment(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+        max_grade: str,
+        external_assignment_id: str = None
+    ):
+        assignment = await self.apost_grades(
+            lms_course_id=lms_course_id,
+            lms_assignment_id=lms_assignment_id,
+            max_grade=max_grade,
+            student_grade_info=[],
+            external_assignment_id=external_assignment_id,
+        )
+        return self._without_grades(assignment)
 
     def post_grades(
         self,
@@ -266,39 +1180,42 @@ class SakaiConnector(AbstractLMSConnector):
         student_grade_info: List[Grade],
         external_assignment_id: str = None,
     ) -> Assignment:
-
-        sakai_grade_info = []
-        for grade_info in student_grade_info:
-            sakai_grade_info.append({
-                'userId': grade_info['lms_student_id'],
-                'grade': grade_info['grade'],
-            })
-
-        # lms_assignment_id for sakai is the assignment name
-        payload = {
-            'name': lms_assignment_id,
-            'externalID': external_assignment_id,
-            'pointsPossible': max_grade,
-            'scores': sakai_grade_info,
-        }
         resp = self._post(
-            self.incoming_request_headers,
+            self.creds_envelope,
             self.lms_base_url,
             SCORES_RESOURCE.format(
                 lms_course_id=lms_course_id,
             ),
-            json=payload,
+            json=self._scores_payload(
+                lms_assignment_id,
+                max_grade,
+                student_grade_info,
+                external_assignment_id,
+            ),
         )
+        self._after_assignment_write(lms_course_id, lms_assignment_id, resp)
+        return self._assignment_from_scores_response(resp)
 
-        grades = []
-        for grade_info in resp.get('scores', []):
-            grades.append(Grade(
-                lms_student_id=grade_info.get('userId'),
-                grade=grade_info.get('grade')
-            ))
-
-        return Assignment(
-            title=resp.get('name'),
-            max_grade=resp.get('pointsPossible'),
-            grades=grades,
+    async def apost_grades(
+        self,
+        lms_course_id: str,
+        lms_assignment_id: str,
+        max_grade: str,
+        student_grade_info: List[Grade],
+        external_assignment_id: str = None,
+    ) -> Assignment:
+        resp = await self._apost(
+            self.creds_envelope,
+            self.lms_base_url,
+            SCORES_RESOURCE.format(
+                lms_course_id=lms_course_id,
+            ),
+            json=self._scores_payload(
+                lms_assignment_id,
+                max_grade,
+                student_grade_info,
+                external_assignment_id,
+            ),
         )
+        self._after_assignment_write(lms_course_id, lms_assignment_id, resp)
+        return self._assignment_from_scores_response(resp)
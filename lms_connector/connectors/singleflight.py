@@ -0,0 +1,142 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+import asyncio
+import copy
+import threading
+
+
+class SingleFlightTimeout(Exception):
+    """
+    A call waited longer than it was willing to for an identical call
+    already in flight.
+    """
+
+
+def _copy_exception(exception: BaseException) -> BaseException:
+    """
+    Give each waiting caller its own copy of a failure, error responses in
+    particular are rendered and have headers added per request.
+    """
+    try:
+        return copy.copy(exception)
+    except Exception:
+        return exception
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.exception: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Collapse identical concurrent calls into one.
+
+    The first caller for a key makes the call. Callers arriving with the
+    same key while it is in flight wait for, and share, its outcome.
+    Nothing is kept once the call is done, this is not a cache.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Any],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        :param timeout: seconds to wait for a call already in flight,
+            SingleFlightTimeout is raised after that.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not is_leader:
+            if not call.done.wait(timeout):
+                raise SingleFlightTimeout(key)
+            if call.exception is not None:
+                raise _copy_exception(call.exception)
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines.
+
+    Only coroutines running in the same event loop share calls.
+    """
+    def __init__(self):
+        # (id of event loop, key) -> call
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        call = self._calls.get(call_key)
+        if call is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(call), timeout)
+            except asyncio.TimeoutError:
+                raise SingleFlightTimeout(key)
+            except asyncio.CancelledError:
+                if not call.cancelled():
+                    # This caller was cancelled, not the call it waited on.
+                    raise
+                return await self.do(key, fn, timeout)
+            except Exception as e:
+                raise _copy_exception(e)
+            return result
+
+        call = loop.create_future()
+        self._calls[call_key] = call
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            # Nobody may be waiting, do not warn about it.
+            call.exception()
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self._calls[call_key]
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
@@ -0,0 +1,583 @@
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from enum import Enum
+from math import ceil
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import random
+import threading
+import time
+
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+import httpx
+import requests
+
+
+def get_host_key(lms_base_url: str) -> str:
+    """
+    Reduce an LMS base url to the scheme and host it is served from.
+
+    Everything that is tracked per LMS host (pooled connections and so on)
+    is keyed by this value so that http://lms/ and http://lms/portal share
+    state.
+    """
+    split_url = urlsplit(lms_base_url or '')
+    return f'{split_url.scheme}://{split_url.netloc}'.lower()
+
+
+class SessionPool:
+    """
+    Keep one requests.Session per LMS host so that keep-alive connections
+    survive between calls, and between invocations of a warm container.
+
+    The number of hosts and the number of connections per host are bounded.
+    Hosts which have not been used for idle_timeout seconds are closed and
+    forgotten, as are the least recently used hosts once max_hosts is hit.
+    """
+    def __init__(
+        self,
+        max_hosts: int,
+        pool_maxsize: int,
+        idle_timeout: float,
+    ):
+        self.max_hosts = max_hosts
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # host key -> (session, last used)
+        self._sessions: OrderedDict = OrderedDict()
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        # Sessions are shared by calls made with different credentials,
+        # cookies set for one must never be sent with another.
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _evict(self, now: float) -> None:
+        """
+        Close sessions that are idle or over capacity. Must hold the lock.
+        """
+        while self._sessions:
+            host_key, (session, last_used) = next(
+                iter(self._sessions.items())
+            )
+            is_idle = now - last_used > self.idle_timeout
+            is_over_capacity = len(self._sessions) > self.max_hosts
+            if not (is_idle or is_over_capacity):
+                break
+            del self._sessions[host_key]
+            session.close()
+
+    def session_for(self, lms_base_url: str) -> requests.Session:
+        host_key = get_host_key(lms_base_url)
+        now = time.monotonic()
+        with self._lock:
+            if host_key in self._sessions:
+                session, _ = self._sessions.pop(host_key)
+            else:
+                session = self._new_session()
+            # Most recently used hosts live at the end.
+            self._sessions[host_key] = (session, now)
+            self._evict(now)
+        return session
+
+    @property
+    def hosts(self):
+        with self._lock:
+            return list(self._sessions.keys())
+
+    def close(self) -> None:
+        with self._lock:
+            for session, _ in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+_session_pool: Optional[SessionPool] = None
+_session_pool_lock = threading.Lock()
+
+
+def get_session_pool() -> SessionPool:
+    """
+    The process wide session pool, created from settings on first use.
+    """
+    global _session_pool
+    if _session_pool is None:
+        with _session_pool_lock:
+            if _session_pool is None:
+                _session_pool = SessionPool(
+                    max_hosts=settings.LMS_POOL_MAX_HOSTS,
+                    pool_maxsize=settings.LMS_POOL_MAXSIZE,
+                    idle_timeout=settings.LMS_POOL_IDLE_TIMEOUT,
+                )
+    return _session_pool
+
+
+class AsyncClientPool:
+    """
+    SessionPool for asyncio callers, one httpx.AsyncClient per LMS host.
+
+    A client can only be used from the event loop it was first used in, so
+    clients are kept per event loop and host. Bounds and eviction are the
+    same as for SessionPool, clients whose event loop is closed are dropped.
+    """
+    def __init__(
+        self,
+        max_hosts: int,
+        pool_maxsize: int,
+        idle_timeout: float,
+    ):
+        self.max_hosts = max_hosts
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # (event loop, host key) -> (client, last used)
+        self._clients: OrderedDict = OrderedDict()
+
+    def _new_client(self) -> httpx.AsyncClient:
+        # As with SessionPool, cookies must never be shared between calls.
+        cookie_jar = CookieJar(DefaultCookiePolicy(allowed_domains=[]))
+        return httpx.AsyncClient(
+            cookies=httpx.Cookies(cookie_jar),
+            limits=httpx.Limits(
+                max_connections=self.pool_maxsize,
+                max_keepalive_connections=self.pool_maxsize,
+            ),
+        )
+
+    @staticmethod
+    def _close(loop: asyncio.AbstractEventLoop, client: httpx.AsyncClient):
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    def _evict(self, now: float) -> None:
+        """
+        Close clients that are idle, over capacity or whose event loop is
+        gone. Must hold the lock.
+        """
+        for loop, host_key in list(self._clients.keys()):
+            if loop.is_closed():
+                del self._clients[(loop, host_key)]
+        while self._clients:
+            key, (client, last_used) = next(iter(self._clients.items()))
+            is_idle = now - last_used > self.idle_timeout
+            is_over_capacity = len(self._clients) > self.max_hosts
+            if not (is_idle or is_over_capacity):
+                break
+            del self._clients[key]
+            self._close(key[0], client)
+
+    def client_for(self, lms_base_url: str) -> httpx.AsyncClient:
+        """
+        Must be called from a coroutine, the client is for its event loop.
+        """
+        key = (asyncio.get_running_loop(), get_host_key(lms_base_url))
+        now = time.monotonic()
+        with self._lock:
+            if key in self._clients:
+                client, _ = self._clients.pop(key)
+            else:
+                client = self._new_client()
+            self._clients[key] = (client, now)
+            self._evict(now)
+        return client
+
+    @property
+    def hosts(self):
+        with self._lock:
+            return [host_key for _, host_key in self._clients.keys()]
+
+
+_async_client_pool: Optional[AsyncClientPool] = None
+
+
+def get_async_client_pool() -> AsyncClientPool:
+    """
+    The process wide asyncio client pool, created from settings on first
+    use.
+    """
+    global _async_client_pool
+    if _async_client_pool is None:
+        with _session_pool_lock:
+            if _async_client_pool is None:
+                _async_client_pool = AsyncClientPool(
+                    max_hosts=settings.LMS_POOL_MAX_HOSTS,
+                    pool_maxsize=settings.LMS_POOL_MAXSIZE,
+                    idle_timeout=settings.LMS_POOL_IDLE_TIMEOUT,
+                )
+    return _async_client_pool
+
+
+class CircuitState(Enum):
+    closed = 'closed'
+    open = 'open'
+    half_open = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    Stop calling an LMS host which keeps failing.
+
+    After failure_threshold consecutive failures the circuit opens and
+    calls are refused without touching the network. Once reset_timeout
+    seconds have passed a single probe call is let through (half open),
+    its outcome decides whether the circuit closes or opens again.
+    """
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CircuitState.closed
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+
+    def _retry_after(self, now: float) -> float:
+        if self._state != CircuitState.open:
+            return 0
+        return max(0, self.reset_timeout - (now - self._opened_at))
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            if (
+                self._state == CircuitState.open and
+                self._retry_after(time.monotonic()) == 0
+            ):
+                return CircuitState.half_open
+            return self._state
+
+    def retry_after(self) -> float:
+        """
+        Seconds until an open circuit lets a probe call through.
+        """
+        with self._lock:
+            return self._retry_after(time.monotonic())
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._state == CircuitState.closed:
+                return True
+            if self._state == CircuitState.open:
+                if self._retry_after(now) > 0:
+                    return False
+                self._state = CircuitState.half_open
+                self._probe_started_at = None
+            # Half open, let a single probe through. A probe which never
+            # reported back is replaced after reset_timeout.
+            if (
+                self._probe_started_at is not None and
+                now - self._probe_started_at < self.reset_timeout
+            ):
+                return False
+            self._probe_started_at = now
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CircuitState.closed
+            self._failures = 0
+            self._probe_started_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if (
+                self._state == CircuitState.half_open or
+                self._failures >= self.failure_threshold
+            ):
+                self._state = CircuitState.open
+                self._opened_at = time.monotonic()
+                self._probe_started_at = None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, see
+    https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    """
+    def __init__(
+        self,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def backoff(self, retry_number: int) -> float:
+        """
+        :param retry_number: 1 for the first retry, 2 for the second...
+        """
+        ceiling = self.backoff_base * (2 ** (retry_number - 1))
+        return random.uniform(0, min(self.backoff_max, ceiling))
+
+
+class HostRegistry:
+    """
+    Lazily create and hold one object per LMS host.
+
+    The factory is called with the host key of the host.
+    """
+    def __init__(self, factory: Callable[[str], Any]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._items: Dict[str, Any] = {}
+
+    def get(self, lms_base_url: str) -> Any:
+        host_key = get_host_key(lms_base_url)
+        with self._lock:
+            if host_key not in self._items:
+                self._items[host_key] = self._factory(host_key)
+            return self._items[host_key]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        with self._lock:
+            return list(self._items.items())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+circuit_breakers = HostRegistry(lambda host_key: CircuitBreaker(
+    failure_threshold=settings.LMS_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.LMS_CIRCUIT_RESET_TIMEOUT,
+))
+
+
+def get_retry_policy() -> RetryPolicy:
+    return RetryPolicy(
+        max_retries=settings.LMS_RETRY_MAX,
+        backoff_base=settings.LMS_RETRY_BACKOFF_BASE,
+        backoff_max=settings.LMS_RETRY_BACKOFF_MAX,
+    )
+
+
+class LatencyTracker:
+    """
+    Keep the latencies of the most recent calls to an LMS host.
+    """
+    def __init__(self, window: int, min_samples: int):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        The latency percent of recent calls finished within, or None when
+        too few calls have been seen to tell.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        index = max(0, ceil(percent / 100 * len(samples)) - 1)
+        return samples[index]
+
+
+class HedgeBudget:
+    """
+    Bound the extra load that hedged calls put on an LMS host.
+
+    Every call earns ratio of a token and every hedge spends a whole one,
+    so at most ratio hedges are sent per call on average. Tokens are capped
+    so that a quiet period can not be followed by a burst of hedges.
+    """
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+
+    def record_call(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+latency_trackers = HostRegistry(lambda host_key: LatencyTracker(
+    window=settings.LMS_LATENCY_WINDOW,
+    min_samples=settings.LMS_HEDGE_MIN_SAMPLES,
+))
+hedge_budgets = HostRegistry(lambda host_key: HedgeBudget(
+    ratio=settings.LMS_HEDGE_BUDGET_RATIO,
+    max_tokens=settings.LMS_HEDGE_BUDGET_MAX,
+))
+
+_background_executor: Optional[ThreadPoolExecutor] = None
+_background_executor_lock = threading.Lock()
+
+
+def get_background_executor() -> ThreadPoolExecutor:
+    """
+    Threads for upstream work done off the calling thread, such as hedges.
+    """
+    global _background_executor
+    if _background_executor is None:
+        with _background_executor_lock:
+            if _background_executor is None:
+                _background_executor = ThreadPoolExecutor(
+                    max_workers=settings.LMS_BACKGROUND_MAX_WORKERS,
+                    thread_name_prefix='lms-background',
+                )
+    return _background_executor
+
+
+class TokenBucket:
+    """
+    Limit the rate of calls to an LMS host.
+
+    Tokens are added at rate per second up to burst, every call takes one.
+    When the LMS says it is overloaded (429 or 503) calls are paused for
+    as long as it asks, and the rate is halved. Each call which is not
+    throttled then wins back a little of the configured rate.
+    """
+    def __init__(self, rate: float, burst: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self._condition = threading.Condition()
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        # Number of calls waiting for a token right now.
+        self.queue_depth = 0
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0, now - self._updated_at)
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    def _wait_time(self, now: float) -> float:
+        wait_for_tokens = max(0, (1 - self._tokens) / self.rate)
+        return max(self._paused_until - now, wait_for_tokens)
+
+    def acquire(self, timeout: float) -> Tuple[bool, int]:
+        """
+        Wait up to timeout seconds for a token.
+
+        Gives up straight away when it is clear no token will be available
+        in time.
+
+        :return: whether a token was taken, and the number of calls that
+            were queued, this one included, if it had to wait.
+        """
+        with self._condition:
+            give_up_at = time.monotonic() + timeout
+            queued_behind = 0
+            self.queue_depth += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait_time = self._wait_time(now)
+                    if wait_time == 0:
+                        self._tokens -= 1
+                        return True, queued_behind
+                    if now + wait_time > give_up_at:
+                        return False, queued_behind
+                    queued_behind = max(queued_behind, self.queue_depth)
+                    self._condition.wait(wait_time)
+            finally:
+                self.queue_depth -= 1
+
+    async def aacquire(self, timeout: float) -> Tuple[bool, int]:
+        """
+        acquire() for coroutines, waiting does not block the event loop.
+        """
+        with self._condition:
+            give_up_at = time.monotonic() + timeout
+            self.queue_depth += 1
+        queued_behind = 0
+        try:
+            while True:
+                with self._condition:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait_time = self._wait_time(now)
+                    if wait_time == 0:
+                        self._tokens -= 1
+                        return True, queued_behind
+                    if now + wait_time > give_up_at:
+                        return False, queued_behind
+                    queued_behind = max(queued_behind, self.queue_depth)
+                await asyncio.sleep(wait_time)
+        finally:
+            with self._condition:
+                self.queue_depth -= 1
+
+    def retry_after(self) -> float:
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            return self._wait_time(now)
+
+    def record_throttled(self, retry_after: Optional[float]) -> None:
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            self._paused_until = max(
+                self._paused_until,
+                now + (retry_after if retry_after is not None else 1),
+            )
+            self._tokens = 0
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def record_success(self) -> None:
+        with self._condition:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def _make_token_bucket(host_key: str) -> TokenBucket:
+    rate = settings.LMS_RATE_LIMITS.get(host_key, settings.LMS_RATE_LIMIT)
+    return TokenBucket(rate=rate, burst=settings.LMS_RATE_LIMIT_BURST)
+
+
+rate_limiters = HostRegistry(_make_token_bucket)
+
+
+def parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header, which is either a number of
+    seconds or an HTTP date.
+    """
+    if not retry_after:
+        return None
+    try:
+        return max(0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -2,6 +2,7 @@ from enum import Enum
 from typing import (
     List,
     Optional,
+    Tuple,
 )
 
 
@@ -10,6 +11,12 @@ class Role(Enum):
 
 
 class Course(dict):
+    # Every key an entity can have, what ?fields= may ask for.
+    FIELDS: Tuple[str, ...] = (
+        'course_id',
+        'title',
+    )
+
     def __init__(self, course_id: str, title: str):
         super(Course, self).__init__([
             ('course_id', course_id),
@@ -18,6 +25,15 @@ class Course(dict):
 
 
 class Student(dict):
+    FIELDS: Tuple[str, ...] = (
+        'student_id',
+        'email',
+        'role',
+        'first_name',
+        'last_name',
+        'user_name',
+    )
+
     def __init__(
         self,
         student_id: str,
@@ -38,6 +54,13 @@ class Student(dict):
 
 
 class LMSUser(dict):
+    FIELDS: Tuple[str, ...] = (
+        'lms_user_id',
+        'email',
+        'first_name',
+        'last_name',
+    )
+
     def __init__(
         self,
         lms_user_id: str,
@@ -54,6 +77,11 @@ class LMSUser(dict):
 
 
 class Grade(dict):
+    FIELDS: Tuple[str, ...] = (
+        'lms_student_id',
+        'grade',
+    )
+
     def __init__(
         self,
         lms_student_id,
@@ -66,6 +94,12 @@ class Grade(dict):
 
 
 class Assignment(dict):
+    FIELDS: Tuple[str, ...] = (
+        'title',
+        'max_grade',
+        'grades',
+    )
+
     def __init__(
         self,
         title: str,
@@ -81,3 +115,32 @@ class Assignment(dict):
             assignment_items.append(('grades', grades))
 
         super(Assignment, self).__init__(assignment_items)
+
+
+class AssignmentExistenceStatus(Enum):
+    found = 'found'
+    missing = 'missing'
+    error = 'error'
+
+
+class AssignmentExistence(dict):
+    FIELDS: Tuple[str, ...] = (
+        'lms_assignment_id',
+        'status',
+        'assignment',
+        'errors',
+    )
+
+    def __init__(
+        self,
+        lms_assignment_id: str,
+        status: AssignmentExistenceStatus,
+        assignment: Optional[Assignment] = None,
+        errors: Optional[List[dict]] = None,
+    ):
+        super(AssignmentExistence, self).__init__([
+            ('lms_assignment_id', lms_assignment_id),
+            ('status', status.value),
+            ('assignment', assignment),
+            ('errors', errors or []),
+        ])
@@ -0,0 +1,83 @@
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from rest_framework import status
+from rest_framework.request import Request
+
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+    ErrorResponseDetails,
+    FormattedError,
+)
+
+FIELDS_PARAM = 'fields'
+# Separates the parts of a nested field name, e.x. assignment.title, which
+# is refused rather than read as an unknown field.
+NESTED_FIELD_SEPARATOR = '.'
+
+
+def get_fields(
+    request: Request,
+    entity_class: type,
+) -> Optional[Tuple[str, ...]]:
+    """
+    The fields of entity_class the comma separated fields query parameter
+    asks for, None when it is not given and every field should be
+    returned. Checked before anything is fetched.
+
+    Only top level fields can be picked, a field holding nested objects,
+    e.x. the grades of an Assignment, is returned whole.
+    """
+    requested = request.GET.get(FIELDS_PARAM)
+    if requested is None:
+        return None
+    fields = {field.strip() for field in requested.split(',')} - {''}
+    nested_fields = sorted(
+        field for field in fields if NESTED_FIELD_SEPARATOR in field
+    )
+    if nested_fields:
+        raise ErrorLCResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            errors=[FormattedError(
+                source=request.path,
+                code=ErrorResponseCodes.bad_request_parameters,
+                detail=ErrorResponseDetails.nested_fields(
+                    FIELDS_PARAM,
+                    nested_fields,
+                ),
+            )],
+        )
+    unknown_fields = fields.difference(entity_class.FIELDS)
+    if not fields or unknown_fields:
+        raise ErrorLCResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            errors=[FormattedError(
+                source=request.path,
+                code=ErrorResponseCodes.bad_request_parameters,
+                detail=ErrorResponseDetails.bad_fields(
+                    FIELDS_PARAM,
+                    sorted(unknown_fields),
+                    entity_class.FIELDS,
+                ),
+            )],
+        )
+    # In the order the entity has them, so the same fields asked for in
+    # any order give the same response.
+    return tuple(field for field in entity_class.FIELDS if field in fields)
+
+
+def project(entity: Dict, fields: Optional[Tuple[str, ...]]) -> Dict:
+    """
+    Only the fields of entity asked for, all of them when fields is None.
+    """
+    if fields is None:
+        return entity
+    return {field: entity[field] for field in fields if field in entity}
+
+
+def project_all(
+    entities: Iterable[Dict],
+    fields: Optional[Tuple[str, ...]],
+) -> Iterator[Dict]:
+    for entity in entities:
+        yield project(entity, fields)
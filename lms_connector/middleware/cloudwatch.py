@@ -1,6 +1,7 @@
 import boto3
 import os
 from datetime import datetime
+from typing import Dict, Optional
 from lms_connector.helpers import no_error
 
 
@@ -13,13 +14,36 @@ def get_namespace():
 
 
 @no_error
-def record_response_status_code(status_code):
+def record_response_status_code(
+    status_code,
+    rate_limit_queue_depths: Optional[Dict[str, int]] = None,
+):
+    """
+    :param rate_limit_queue_depths: LMS host to the longest rate limiter
+        queue a call to it waited in, recorded along with the status code.
+    """
     if os.environ.get('STAGE') is None:
         # Probably local dev without a lambda, we don't need to log
         # response codes in this case.
         return
     status_code = int(status_code)
     now = datetime.utcnow()
+    queue_depth_metrics = [
+        {
+            'MetricName': 'rate_limit_queue_depth',
+            'Dimensions': [
+                {
+                    'Name': 'lms_host',
+                    'Value': host_key,
+                },
+            ],
+            'Timestamp': now,
+            'Value': queue_depth,
+            'Unit': 'Count',
+            'StorageResolution': 60
+        }
+        for host_key, queue_depth in (rate_limit_queue_depths or {}).items()
+    ]
     cw_client = get_cloud_watch_client()
     cw_client.put_metric_data(
         Namespace=get_namespace(),
@@ -37,7 +61,7 @@ def record_response_status_code(status_code):
                 'Unit': 'Count',
                 'StorageResolution': 60
             },
-        ]
+        ] + queue_depth_metrics
     )
 
 
@@ -50,5 +74,8 @@ class CloudWatch:
         # This is where the view ends up being called
         response = self.get_response(request)
         # The view has now been run and we have a response
-        record_response_status_code(response.status_code)
+        record_response_status_code(
+            response.status_code,
+            getattr(response, 'rate_limit_queue_depths', None),
+        )
         return response
@@ -0,0 +1,151 @@
+from bisect import bisect_right
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import hashlib
+import json
+
+from django.conf import settings
+from django.core import signing
+from rest_framework import status
+from rest_framework.request import Request
+
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+    ErrorResponseDetails,
+    FormattedError,
+)
+
+LIMIT_PARAM = 'limit'
+CURSOR_PARAM = 'cursor'
+CURSOR_SALT = 'lms_connector.pagination'
+# Where streamed pages, which have no envelope, send their next cursor.
+NEXT_CURSOR_HEADER = 'LMS-Next-Cursor'
+
+
+class Page(NamedTuple):
+    results: List[Dict]
+    # None on the last page.
+    next_cursor: Optional[str]
+
+
+def _sort_key(result: Dict, key: str) -> Tuple[str, str]:
+    """
+    Orders results by key, and results with the same key by their content,
+    so that the order does not depend on the order the LMS answered in.
+    """
+    content = json.dumps(result, sort_keys=True, separators=(',', ':'))
+    return (
+        str(result.get(key)),
+        hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest(),
+    )
+
+
+def _bad_parameter(request: Request, detail: str) -> ErrorLCResponse:
+    return ErrorLCResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        errors=[FormattedError(
+            source=request.path,
+            code=ErrorResponseCodes.bad_request_parameters,
+            detail=detail,
+        )],
+    )
+
+
+def _dump_cursor(after: Tuple[str, str], cursor_salt: str) -> str:
+    """
+    Signed without a timestamp, unlike signing.dumps(), so the same page
+    always has the same cursor and its response the same ETag.
+    """
+    encoded = signing.b64_encode(
+        json.dumps(list(after), separators=(',', ':')).encode('utf-8'),
+    )
+    return signing.Signer(salt=cursor_salt).sign(encoded.decode('ascii'))
+
+
+def _load_cursor(cursor: str, cursor_salt: str) -> Tuple[str, str]:
+    encoded = signing.Signer(salt=cursor_salt).unsign(cursor)
+    return tuple(json.loads(signing.b64_decode(encoded.encode('ascii'))))
+
+
+def _get_limit(request: Request) -> int:
+    max_limit = settings.LMS_PAGE_MAX_LIMIT
+    limit = request.GET.get(LIMIT_PARAM)
+    if limit is None:
+        return min(settings.LMS_PAGE_DEFAULT_LIMIT, max_limit)
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= max_limit:
+        raise _bad_parameter(request, ErrorResponseDetails.bad_limit(
+            LIMIT_PARAM,
+            max_limit,
+        ))
+    return limit
+
+
+class PageRequest(NamedTuple):
+    limit: int
+    # Sort key of the last result of the previous page.
+    after: Optional[Tuple[str, str]]
+    cursor_salt: str
+
+
+def get_page_request(request: Request) -> Optional[PageRequest]:
+    """
+    The page the limit and cursor query parameters ask for, None when
+    neither is given and every result should be returned. Checked before
+    anything is fetched.
+    """
+    if LIMIT_PARAM not in request.GET and CURSOR_PARAM not in request.GET:
+        return None
+    limit = _get_limit(request)
+    # Cursors only work on the path they were returned for.
+    cursor_salt = f'{CURSOR_SALT}:{request.path}'
+    after = None
+    cursor = request.GET.get(CURSOR_PARAM)
+    if cursor:
+        try:
+            after = _load_cursor(cursor, cursor_salt)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise _bad_parameter(
+                request,
+                ErrorResponseDetails.bad_cursor(CURSOR_PARAM),
+            )
+    return PageRequest(limit=limit, after=after, cursor_salt=cursor_salt)
+
+
+def paginate(
+    results: List[Dict],
+    key: str,
+    page_request: PageRequest,
+) -> Page:
+    """
+    The page of results ordered by key.
+
+    A cursor holds the sort key of the last result of its page, so later
+    pages neither skip nor repeat results when earlier ones change. Pages
+    are cut from the whole list, which connectors cache, so asking for
+    them does not call the LMS again.
+    """
+    sort_keys = sorted(
+        (_sort_key(result, key), index)
+        for index, result in enumerate(results)
+    )
+    start = 0
+    if page_request.after is not None:
+        # Past every result whose sort key is the cursor's.
+        start = bisect_right(sort_keys, (page_request.after, len(results)))
+
+    limit = page_request.limit
+    page_keys = sort_keys[start:start + limit]
+    next_cursor = None
+    if start + limit < len(sort_keys):
+        next_cursor = _dump_cursor(
+            page_keys[-1][0],
+            page_request.cursor_salt,
+        )
+    return Page(
+        results=[results[index] for _, index in page_keys],
+        next_cursor=next_cursor,
+    )
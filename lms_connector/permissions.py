@@ -1,6 +1,9 @@
 from django.conf import settings
 from rest_framework.permissions import BasePermission
 
+# As sent by clients, it is read from request.META as HTTP_API_KEY.
+API_KEY_HEADER_NAME = 'API-KEY'
+
 
 class ValidateApiKey(BasePermission):
     def has_permission(self, request, view):
@@ -0,0 +1,63 @@
+from typing import Any, Iterable, Iterator
+import json
+import traceback
+
+from rest_framework import status
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from lms_connector.lms_connector_logger import logger
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+    FormattedError,
+)
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+def json_line(data: Any) -> bytes:
+    return json.dumps(
+        data,
+        cls=JSONEncoder,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    ).encode('utf-8') + b'\n'
+
+
+def json_lines(entities: Iterable[Any], source: str) -> Iterator[bytes]:
+    """
+    One line per entity, taken from entities only as the line is sent.
+
+    The status code is sent before the first line, a failure part way is
+    sent as a last line holding the errors, as an error response would.
+    """
+    try:
+        for entity in entities:
+            yield json_line(entity)
+    except ErrorLCResponse as e:
+        yield json_line({'errors': e.data['errors']})
+    except Exception as e:
+        logger.info(traceback.format_exc())
+        yield json_line({'errors': [FormattedError(
+            source=source,
+            code=ErrorResponseCodes.unhandled_exception,
+            detail=str(e),
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )]})
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Lets clients Accept application/x-ndjson. Views stream their results
+    themselves, see views.NDJSONMixin, anything else, e.x. an error
+    response, is rendered as a single line.
+    """
+    media_type = NDJSON_MEDIA_TYPE
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json_line(data)
@@ -1,7 +1,9 @@
 from enum import Enum
+import hashlib
 import json
 from json import JSONDecodeError
 from typing import (
+    Iterable,
     List,
     Optional,
 )
@@ -10,6 +12,8 @@ from rest_framework import status as drf_status_code
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
 
+CREDENTIAL_FINGERPRINT_HEADER = 'LMS-Credential-Fingerprint'
+
 
 class ErrorResponseCodes(Enum):
     """
@@ -19,6 +23,11 @@ class ErrorResponseCodes(Enum):
     lms_data_bad_json = 'lms_data_bad_json'
     lms_data_invalid = 'lms_data_invalid'
     bad_thirdparty_request = 'bad_thirdparty_request'
+    lms_circuit_open = 'lms_circuit_open'
+    deadline_exceeded = 'deadline_exceeded'
+    lms_rate_limited = 'lms_rate_limited'
+    lms_not_found = 'lms_not_found'
+    bad_request_parameters = 'bad_request_parameters'
     bad_lms_connector_headers = 'bad_lms_connector_headers'
     missing_required_header = 'missing_required_header'
     headers_not_set = 'headers_not_set'
@@ -39,6 +48,72 @@ class ErrorResponseDetails:
     def lms_not_supported(lms_name: str) -> str:
         return 'LMS {} not supported.'.format(lms_name)
 
+    @staticmethod
+    def lms_circuit_open(host: str, retry_after: float) -> str:
+        return (
+            f'{host} is failing, calls to it are paused for '
+            f'{retry_after:.0f} more seconds.'
+        )
+
+    @staticmethod
+    def lms_rate_limited(host: str, retry_after: float) -> str:
+        return (
+            f'Too many calls to {host}, the next one can be made in '
+            f'{retry_after:.1f} seconds which is past the deadline.'
+        )
+
+    @staticmethod
+    def assignment_not_found(
+        lms_course_id: str,
+        lms_assignment_id: str,
+    ) -> str:
+        return (
+            f'Assignment {lms_assignment_id} was not found in course '
+            f'{lms_course_id}.'
+        )
+
+    @staticmethod
+    def bad_ids_count(field_name: str, max_ids: int) -> str:
+        return f'Between 1 and {max_ids} {field_name} must be given.'
+
+    @staticmethod
+    def bad_limit(field_name: str, max_limit: int) -> str:
+        return f'{field_name} must be a number between 1 and {max_limit}.'
+
+    @staticmethod
+    def bad_cursor(field_name: str) -> str:
+        return f'{field_name} is not a cursor this endpoint returned.'
+
+    @staticmethod
+    def bad_fields(
+        field_name: str,
+        unknown_fields: List[str],
+        known_fields: Iterable[str],
+    ) -> str:
+        unknown = ', '.join(unknown_fields) or 'nothing'
+        return (
+            f'{field_name} asked for {unknown}, it must list one or more '
+            f'of: {", ".join(known_fields)}.'
+        )
+
+    @staticmethod
+    def nested_fields(field_name: str, nested_fields: List[str]) -> str:
+        return (
+            f'{field_name} asked for {", ".join(nested_fields)}, only top '
+            f'level fields can be picked, nested objects are returned whole.'
+        )
+
+    @staticmethod
+    def deadline_exceeded(budget: float) -> str:
+        return f'LMS did not respond within the {budget:.1f} second budget.'
+
+    @staticmethod
+    def bad_request_timeout(requested_timeout: str) -> str:
+        return (
+            f'LMS-REQUEST-TIMEOUT must be a positive number of seconds, '
+            f'got {requested_timeout}.'
+        )
+
     @staticmethod
     def lms_data_not_json(decode_error: JSONDecodeError) -> str:
         return 'lms_data is not json: {}'.format(str(decode_error))
@@ -103,6 +178,47 @@ class LCResponse(Response):
         """
         super(LCResponse, self).__init__(data={}, status=status_code)
 
+    @property
+    def etag(self) -> str:
+        """
+        A strong ETag, quoted, over the rendered body, so only once the
+        response has been rendered.
+        """
+        digest = hashlib.blake2b(self.content, digest_size=16)
+        return f'"{digest.hexdigest()}"'
+
+    def set_cache_policy(
+        self,
+        max_age: Optional[int],
+        vary: Iterable[str] = (),
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        """
+        Tell caches between us and the client, e.x. API Gateway, whether
+        and for how long they may keep this response.
+
+        :param max_age: seconds, None when the response must not be kept.
+        :param vary: the request headers the response depends on.
+        :param fingerprint: of the credentials the response is for, see
+            CredsEnvelope.fingerprint
+        """
+        if max_age is None:
+            self['Cache-Control'] = 'no-store'
+        else:
+            self['Cache-Control'] = f'max-age={max_age}'
+        if vary:
+            self['Vary'] = ', '.join(vary)
+        if fingerprint is not None:
+            self[CREDENTIAL_FINGERPRINT_HEADER] = fingerprint
+
+    def not_modified(self) -> None:
+        """
+        Turn this rendered response into a bodyless 304, keeping its
+        headers.
+        """
+        self.status_code = drf_status_code.HTTP_304_NOT_MODIFIED
+        self.content = b''
+
 
 class SingleLCResponse(LCResponse):
     """
@@ -147,6 +263,13 @@ class MultiLCResponse(LCResponse):
     def add_result(self, result) -> None:
         self._results.append(result)
 
+    def set_next_cursor(self, next_cursor: Optional[str]) -> None:
+        """
+        For paginated results, the cursor of the next page, None on the
+        last one.
+        """
+        self.data['next'] = next_cursor
+
 
 class ErrorLCResponse(LCResponse, Exception):
     """
@@ -173,6 +296,18 @@ class ErrorLCResponse(LCResponse, Exception):
     def add_error(self, error: FormattedError) -> None:
         self._errors.append(error)
 
+    def __copy__(self) -> 'ErrorLCResponse':
+        """
+        A fresh, unrendered response with the same errors and headers.
+        """
+        error_response = ErrorLCResponse(
+            status_code=self.status_code,
+            errors=self.errors,
+        )
+        for header, value in self.items():
+            error_response[header] = value
+        return error_response
+
     @property
     def errors(self):
         return self._errors
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
+import json
 import os
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -110,3 +111,152 @@ REST_FRAMEWORK = {
     ],
     'EXCEPTION_HANDLER': 'lms_connector.exception_handler.exception_handler',
 }
+
+# Upstream LMS transport.
+# Pooled keep-alive sessions, one per LMS host.
+LMS_POOL_MAX_HOSTS = int(os.environ.get('LMS_POOL_MAX_HOSTS', 32))
+LMS_POOL_MAXSIZE = int(os.environ.get('LMS_POOL_MAXSIZE', 10))
+# Seconds a host may go unused before its connections are closed.
+LMS_POOL_IDLE_TIMEOUT = float(os.environ.get('LMS_POOL_IDLE_TIMEOUT', 300))
+# Consecutive failures before calls to an LMS host are refused, and the
+# seconds to wait before probing it again.
+LMS_CIRCUIT_FAILURE_THRESHOLD = int(
+    os.environ.get('LMS_CIRCUIT_FAILURE_THRESHOLD', 5)
+)
+LMS_CIRCUIT_RESET_TIMEOUT = float(
+    os.environ.get('LMS_CIRCUIT_RESET_TIMEOUT', 30)
+)
+# Retries of idempotent upstream calls, with jittered exponential backoff.
+LMS_RETRY_MAX = int(os.environ.get('LMS_RETRY_MAX', 2))
+LMS_RETRY_BACKOFF_BASE = float(os.environ.get('LMS_RETRY_BACKOFF_BASE', 0.1))
+LMS_RETRY_BACKOFF_MAX = float(os.environ.get('LMS_RETRY_BACKOFF_MAX', 2))
+# Seconds every upstream call made for a request has to share. Clients can
+# ask for less with the LMS-Request-Timeout header. API Gateway gives up
+# after 29 seconds.
+LMS_REQUEST_BUDGET = float(os.environ.get('LMS_REQUEST_BUDGET', 25))
+# Seconds kept back from the lambda remaining time to report a timeout.
+LMS_DEADLINE_MARGIN = float(os.environ.get('LMS_DEADLINE_MARGIN', 1))
+# Hedging, opt in. When a GET that connectors mark as hedgeable has not
+# answered within the host's LMS_HEDGE_PERCENTILE latency, send it again and
+# use whichever answer comes first. At most LMS_HEDGE_BUDGET_RATIO extra
+# calls are made per call to a host.
+LMS_HEDGING_ENABLED = (
+    os.environ.get('LMS_HEDGING_ENABLED', 'false').lower() == 'true'
+)
+LMS_HEDGE_PERCENTILE = float(os.environ.get('LMS_HEDGE_PERCENTILE', 95))
+LMS_HEDGE_BUDGET_RATIO = float(os.environ.get('LMS_HEDGE_BUDGET_RATIO', 0.1))
+LMS_HEDGE_BUDGET_MAX = float(os.environ.get('LMS_HEDGE_BUDGET_MAX', 10))
+LMS_HEDGE_MIN_SAMPLES = int(os.environ.get('LMS_HEDGE_MIN_SAMPLES', 20))
+# Number of recent calls per host that latency percentiles are taken over.
+LMS_LATENCY_WINDOW = int(os.environ.get('LMS_LATENCY_WINDOW', 200))
+# Calls per second to an LMS host, and how many may be made at once after
+# a quiet period. Rates for particular hosts can be given as json, e.x.
+# LMS_RATE_LIMITS='{"https://sakai.school.edu": 5}'
+LMS_RATE_LIMIT = float(os.environ.get('LMS_RATE_LIMIT', 20))
+LMS_RATE_LIMIT_BURST = float(os.environ.get('LMS_RATE_LIMIT_BURST', 20))
+LMS_RATE_LIMITS = {
+    host.lower().rstrip('/'): float(rate)
+    for host, rate
+    in json.loads(os.environ.get('LMS_RATE_LIMITS', '{}')).items()
+}
+# Threads for upstream calls made off the request thread, e.x. hedges.
+LMS_BACKGROUND_MAX_WORKERS = int(
+    os.environ.get('LMS_BACKGROUND_MAX_WORKERS', 16)
+)
+# Threads shared by every fan-out, upstream calls made in parallel for one
+# request, and how many of them a single fan-out may use at once.
+LMS_FAN_OUT_MAX_WORKERS = int(os.environ.get('LMS_FAN_OUT_MAX_WORKERS', 32))
+LMS_FAN_OUT_CONCURRENCY = int(os.environ.get('LMS_FAN_OUT_CONCURRENCY', 8))
+# Seconds LMS reads are cached for in process, per resource, 0 turns caching
+# a resource off. Clients can skip the cache with Cache-Control: no-cache.
+LMS_CACHE_TTL_COURSES = float(os.environ.get('LMS_CACHE_TTL_COURSES', 300))
+LMS_CACHE_TTL_STUDENTS = float(os.environ.get('LMS_CACHE_TTL_STUDENTS', 300))
+# The current user is kept per set of credentials, until Sakai refuses them.
+LMS_CACHE_TTL_CURRENT_USER = float(
+    os.environ.get('LMS_CACHE_TTL_CURRENT_USER', 60)
+)
+# Cached assignments are dropped whenever the assignment is written to.
+LMS_CACHE_TTL_ASSIGNMENT = float(
+    os.environ.get('LMS_CACHE_TTL_ASSIGNMENT', 60)
+)
+# Assignments Sakai does not have are cached for less, creating one drops
+# the cached miss.
+LMS_CACHE_TTL_ASSIGNMENT_MISSING = float(
+    os.environ.get('LMS_CACHE_TTL_ASSIGNMENT_MISSING', 15)
+)
+# Courses and enrollments are paginated when clients pass limit or cursor,
+# limit defaults to LMS_PAGE_DEFAULT_LIMIT and can be at most
+# LMS_PAGE_MAX_LIMIT.
+LMS_PAGE_DEFAULT_LIMIT = int(os.environ.get('LMS_PAGE_DEFAULT_LIMIT', 100))
+LMS_PAGE_MAX_LIMIT = int(os.environ.get('LMS_PAGE_MAX_LIMIT', 1000))
+# Assignment ids a single existence check may be given.
+LMS_ASSIGNMENT_EXISTENCE_MAX_IDS = int(
+    os.environ.get('LMS_ASSIGNMENT_EXISTENCE_MAX_IDS', 100)
+)
+# Seconds past their ttl that cached reads are still answered with, while
+# they are refreshed in the background.
+LMS_CACHE_STALE_GRACE = float(os.environ.get('LMS_CACHE_STALE_GRACE', 300))
+# Seconds caches in front of the connector may keep successful reads for,
+# per view, sent as Cache-Control. Responses vary on the credential headers
+# and carry an LMS-Credential-Fingerprint header. Writes are never kept.
+# API Gateway does not read Cache-Control, it is given these ttls in
+# serverless.yml instead, and does not cache assignments.
+LMS_EDGE_MAX_AGE_COURSES = int(os.environ.get('LMS_EDGE_MAX_AGE_COURSES', 60))
+LMS_EDGE_MAX_AGE_STUDENTS = int(
+    os.environ.get('LMS_EDGE_MAX_AGE_STUDENTS', 60)
+)
+LMS_EDGE_MAX_AGE_CURRENT_USER = int(
+    os.environ.get('LMS_EDGE_MAX_AGE_CURRENT_USER', 60)
+)
+LMS_EDGE_MAX_AGE_ASSIGNMENT = int(
+    os.environ.get('LMS_EDGE_MAX_AGE_ASSIGNMENT', 300)
+)
+# Approximate bytes, as json, the in process read cache may hold.
+LMS_READ_CACHE_MAX_BYTES = int(
+    os.environ.get('LMS_READ_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+)
+# With LMS_SHARED_CACHE_ENABLED on, LMS reads are also cached in the cache
+# below, so that every worker using it shares them. The default only lives
+# in the process, for memory shared by the workers of one host use
+# LMS_CACHE_BACKEND=lms_connector.cache.shared_memory.SharedMemoryCache
+# LMS_CACHE_LOCATION=/dev/shm/lms-connector-cache
+# Other Django cache backends also work, once their client library is added
+# to the Pipfile.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'LMS_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('LMS_CACHE_LOCATION', ''),
+        'KEY_PREFIX': 'lms-connector',
+        'OPTIONS': json.loads(os.environ.get('LMS_CACHE_OPTIONS', '{}')),
+    },
+}
+LMS_CACHE_ALIAS = 'default'
+LMS_SHARED_CACHE_ENABLED = (
+    os.environ.get('LMS_SHARED_CACHE_ENABLED', 'false').lower() == 'true'
+)
+# Shared cache entries at least this many bytes are compressed.
+LMS_CACHE_COMPRESS_MIN_BYTES = int(
+    os.environ.get('LMS_CACHE_COMPRESS_MIN_BYTES', 1024)
+)
+# Reuse a Sakai session per set of credentials instead of OAuth1 signing,
+# and having Sakai check, every call. Sessions are dropped after
+# LMS_SAKAI_SESSION_TTL seconds without use.
+LMS_SAKAI_SESSION_REUSE = (
+    os.environ.get('LMS_SAKAI_SESSION_REUSE', 'false').lower() == 'true'
+)
+LMS_SAKAI_SESSION_TTL = float(os.environ.get('LMS_SAKAI_SESSION_TTL', 600))
+LMS_SAKAI_SESSION_MAX_ENTRIES = int(
+    os.environ.get('LMS_SAKAI_SESSION_MAX_ENTRIES', 1000)
+)
+LMS_SAKAI_SESSION_COOKIE = os.environ.get(
+    'LMS_SAKAI_SESSION_COOKIE',
+    'JSESSIONID',
+)
+# Sites read from Sakai per call when listing courses, 0 reads them all in
+# one call.
+LMS_SAKAI_SITES_PAGE_SIZE = int(
+    os.environ.get('LMS_SAKAI_SITES_PAGE_SIZE', 100)
+)
@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import stat
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from mock import patch
+import pytest
+
+from lms_connector.cache.shared_memory import SharedMemoryCache
+
+
+def _get_cache(path, slots=16, slot_size=1024):
+    return SharedMemoryCache(str(path), {
+        'OPTIONS': {'SLOTS': slots, 'SLOT_SIZE': slot_size},
+    })
+
+
+def test_set_get_delete(tmp_path):
+    cache = _get_cache(tmp_path / 'cache')
+    assert cache.get('courses') is None
+    cache.set('courses', b'{"site_collection":[]}', timeout=None)
+    assert cache.get('courses') == b'{"site_collection":[]}'
+    assert not cache.add('courses', 'other')
+    assert cache.add('user', 'me')
+    assert cache.get('user') == 'me'
+    assert cache.delete('courses')
+    assert cache.get('courses', 'missing') == 'missing'
+    cache.clear()
+    assert cache.get('user') is None
+
+
+@patch('lms_connector.cache.shared_memory.time.time')
+def test_entries_expire(time_mock, tmp_path):
+    time_mock.return_value = 100
+    cache = _get_cache(tmp_path / 'cache')
+    cache.set('courses', 'sites', timeout=60)
+    time_mock.return_value = 159
+    assert cache.get('courses') == 'sites'
+    time_mock.return_value = 160
+    assert cache.get('courses') is None
+    # The expired key can be added again.
+    assert cache.add('courses', 'new sites')
+
+
+@patch('lms_connector.cache.shared_memory.time.time')
+def test_least_recently_written_replaced(time_mock, tmp_path):
+    cache = _get_cache(tmp_path / 'cache', slots=2)
+    for written_at, key in enumerate(['first', 'second', 'third']):
+        time_mock.return_value = written_at
+        cache.set(key, key, timeout=None)
+    assert cache.get('first') is None
+    assert cache.get('second') == 'second'
+    assert cache.get('third') == 'third'
+
+
+def test_too_large_not_kept(tmp_path):
+    cache = _get_cache(tmp_path / 'cache', slot_size=256)
+    cache.set('courses', 'sites', timeout=None)
+    cache.set('courses', 'x' * 1000, timeout=None)
+    assert cache.get('courses') is None
+
+
+def _set_in_child(path):
+    _get_cache(path).set('courses', 'from the child', timeout=None)
+
+
+def test_shared_between_processes(tmp_path):
+    cache = _get_cache(tmp_path / 'cache')
+    cache.set('user', 'from the parent', timeout=None)
+    process = multiprocessing.get_context('fork').Process(
+        target=_set_in_child,
+        args=(tmp_path / 'cache',),
+    )
+    process.start()
+    process.join(timeout=10)
+    assert process.exitcode == 0
+    assert cache.get('courses') == 'from the child'
+    assert cache.get('user') == 'from the parent'
+
+
+def test_readers_never_see_torn_writes(tmp_path):
+    cache = _get_cache(tmp_path / 'cache', slot_size=64 * 1024)
+    values = [bytes([number]) * 1000 for number in range(2)]
+    cache.set('courses', values[0], timeout=None)
+    done = threading.Event()
+
+    def write():
+        for number in range(200):
+            cache.set('courses', values[number % 2], timeout=None)
+        done.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    seen = []
+    while not done.is_set():
+        value = cache.get('courses')
+        if value is not None:
+            seen.append(value)
+    writer.join()
+    assert all(value in values for value in seen)
+
+
+def test_only_bytes_and_str_kept(tmp_path):
+    cache = _get_cache(tmp_path / 'cache')
+    with pytest.raises(TypeError):
+        cache.set('courses', {'site_collection': []}, timeout=None)
+
+
+def test_file_private_to_owner(tmp_path):
+    _get_cache(tmp_path / 'cache')
+    mode = stat.S_IMODE(os.stat(tmp_path / 'cache').st_mode)
+    assert mode & (stat.S_IRWXG | stat.S_IRWXO) == 0
+
+
+def test_other_layout_refused(tmp_path):
+    cache = _get_cache(tmp_path / 'cache', slots=16)
+    cache.set('courses', 'sites', timeout=None)
+    with pytest.raises(ImproperlyConfigured):
+        _get_cache(tmp_path / 'cache', slots=32)
+    # The file in use was left as it was.
+    assert cache.get('courses') == 'sites'
@@ -0,0 +1,16 @@
+from django.core.cache import caches
+import pytest
+
+from lms_connector.connectors.read_cache import read_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_read_cache():
+    """
+    Tests reuse LMS urls, so cached reads must not leak between them.
+    """
+    read_cache.clear()
+    caches[read_cache.shared.alias].clear()
+    yield
+    read_cache.clear()
+    caches[read_cache.shared.alias].clear()
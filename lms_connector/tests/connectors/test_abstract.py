@@ -1,9 +1,23 @@
+from django.test.utils import override_settings
+from mock import MagicMock, patch
+import asyncio
+import httpx
 import pytest
+import requests
+import requests_mock
+import threading
+import time
 
 from lms_connector.connectors.creds_envelope import CredsEnvelope
 from lms_connector.connectors import abstract
 from lms_connector.connectors.abstract import AbstractLMSConnector
 from lms_connector.connectors.sakai import SakaiConnector
+from lms_connector.connectors.deadline import Deadline
+from lms_connector.connectors.transport import (
+    CircuitState,
+    circuit_breakers,
+    latency_trackers,
+)
 from lms_connector.responses import (
     ErrorLCResponse,
     ErrorResponseCodes,
@@ -17,9 +31,10 @@ def test_get_connector():
     """
     creds_envelope = CredsEnvelope()
     connector = abstract.AbstractLMSConnector.get_connector(
-        'sakai', lms_base_url='http://something'
+        'sakai', lms_base_url='http://something', creds_envelope=creds_envelope
     )
     assert isinstance(connector, SakaiConnector)
+    assert connector.creds_envelope is creds_envelope
 
 
 def test_get_non_existent_connector():
@@ -55,3 +70,179 @@ def test_raise_thirdparty_error_on_error():
         assert error['detail'] == exception_str
     else:
         assert False, "Error should have be raised."
+
+
+@override_settings(
+    LMS_HEDGING_ENABLED=True,
+    LMS_HEDGE_MIN_SAMPLES=1,
+    LMS_HEDGE_BUDGET_RATIO=1,
+)
+def test_slow_get_is_hedged():
+    """
+    A GET slower than the host's usual latency is sent again, and the
+    first answer wins.
+    """
+    url = 'http://stalling-lms/direct/site.json'
+    first_call_released = threading.Event()
+    calls = []
+
+    def respond(method, url, **kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            # Stall the first call until the hedge has answered.
+            first_call_released.wait(timeout=5)
+            return MagicMock(status_code=200, text='first')
+        return MagicMock(status_code=200, text='hedge')
+
+    # requests_mock serializes calls, so mock the session instead.
+    session_mock = MagicMock()
+    session_mock.request.side_effect = respond
+
+    connector = SakaiConnector(lms_base_url='http://stalling-lms')
+    latency_trackers.get(url).record(0.01)
+    with patch.object(
+        SakaiConnector, '_session_for', return_value=session_mock,
+    ):
+        response = connector._request('GET', url, hedge=True)
+        first_call_released.set()
+
+    assert response.text == 'hedge'
+    assert len(calls) == 2
+    assert connector.upstream_hedges == 1
+    assert connector.upstream_headers['LMS-Upstream-Hedges'] == '1'
+
+
+@override_settings(LMS_HEDGING_ENABLED=True, LMS_HEDGE_MIN_SAMPLES=1)
+def test_post_is_not_hedged():
+    url = 'http://stalling-post-lms/direct/grades/gradeitem/c.json'
+    connector = SakaiConnector(lms_base_url='http://stalling-post-lms')
+    latency_trackers.get(url).record(0)
+    with requests_mock.Mocker() as http_mock:
+        http_mock.post(url, text='ok')
+        connector._request('POST', url, hedge=True)
+
+    assert http_mock.call_count == 1
+    assert connector.upstream_hedges == 0
+
+
+@override_settings(LMS_CIRCUIT_FAILURE_THRESHOLD=2)
+def test_tiny_budget_does_not_open_circuit():
+    """
+    Calls that time out because the client gave them almost no time are
+    not held against the host.
+    """
+    url = 'http://tiny-budget-lms/direct/site.json'
+
+    def time_out(method, url, timeout, **kwargs):
+        time.sleep(timeout[1])
+        raise requests.Timeout()
+
+    session_mock = MagicMock()
+    session_mock.request.side_effect = time_out
+    with patch.object(
+        SakaiConnector, '_session_for', return_value=session_mock,
+    ):
+        for _ in range(4):
+            connector = SakaiConnector(lms_base_url='http://tiny-budget-lms')
+            connector.deadline = Deadline(budget=0.01)
+            with pytest.raises(ErrorLCResponse) as e:
+                connector._request('GET', url)
+            assert e.value.status_code == 504
+
+    assert session_mock.request.call_count == 4
+    assert circuit_breakers.get(url).state == CircuitState.closed
+
+
+def _mock_async_client(handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return patch.object(
+        SakaiConnector,
+        '_async_client_for',
+        return_value=client,
+    )
+
+
+@override_settings(LMS_RETRY_BACKOFF_BASE=0)
+def test_async_get_is_retried():
+    url = 'http://async-flaky-lms/direct/site.json'
+    responses = [httpx.Response(503), httpx.Response(200, text='ok')]
+
+    connector = SakaiConnector(lms_base_url='http://async-flaky-lms')
+    with _mock_async_client(lambda request: responses.pop(0)):
+        response = asyncio.run(connector._arequest('GET', url))
+
+    assert response.text == 'ok'
+    assert connector.upstream_retries == 1
+
+
+@override_settings(LMS_CIRCUIT_FAILURE_THRESHOLD=2)
+def test_async_tiny_budget_does_not_open_circuit():
+    url = 'http://async-tiny-budget-lms/direct/site.json'
+
+    async def time_out(request):
+        await asyncio.sleep(0.01)
+        raise httpx.ReadTimeout('timed out', request=request)
+
+    with _mock_async_client(time_out):
+        for _ in range(4):
+            connector = SakaiConnector(
+                lms_base_url='http://async-tiny-budget-lms',
+            )
+            connector.deadline = Deadline(budget=0.01)
+            with pytest.raises(ErrorLCResponse) as e:
+                asyncio.run(connector._arequest('GET', url))
+            assert e.value.status_code == 504
+
+    assert circuit_breakers.get(url).state == CircuitState.closed
+
+
+@override_settings(
+    LMS_HEDGING_ENABLED=True,
+    LMS_HEDGE_MIN_SAMPLES=1,
+    LMS_HEDGE_BUDGET_RATIO=1,
+)
+def test_async_slow_get_is_hedged():
+    """
+    The hedge answers first and the stalled call is cancelled.
+    """
+    url = 'http://async-stalling-lms/direct/site.json'
+    calls = []
+    stalled_call_cancelled = []
+
+    async def respond(request):
+        calls.append(request)
+        if len(calls) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                stalled_call_cancelled.append(True)
+                raise
+        return httpx.Response(200, text=f'call {len(calls)}')
+
+    connector = SakaiConnector(lms_base_url='http://async-stalling-lms')
+    latency_trackers.get(url).record(0.01)
+    with _mock_async_client(respond):
+        response = asyncio.run(connector._arequest('GET', url, hedge=True))
+
+    assert response.text == 'call 2'
+    assert connector.upstream_hedges == 1
+    assert stalled_call_cancelled == [True]
+
+
+def test_async_defaults_to_sync_method_in_thread():
+    connector = SakaiConnector(lms_base_url='http://sync-only-lms')
+    threads = []
+
+    def list_sections_for_course(lms_course_id):
+        threads.append(threading.current_thread())
+        return [{'section_id': lms_course_id}]
+
+    with patch.object(
+        connector,
+        'list_sections_for_course',
+        side_effect=list_sections_for_course,
+    ):
+        sections = asyncio.run(connector.alist_sections_for_course('course'))
+
+    assert sections == [{'section_id': 'course'}]
+    assert threads[0] is not threading.main_thread()
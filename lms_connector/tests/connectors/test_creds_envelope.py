@@ -0,0 +1,96 @@
+import pytest
+
+from lms_connector.connectors.creds_envelope import (
+    DEFAULT_REQUIRED_HEADERS,
+    CredsEnvelope,
+)
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+)
+from lms_connector.tests import fixtures
+
+
+def test_from_request_meta():
+    creds_envelope = CredsEnvelope.from_request_meta(
+        fixtures.get_mocked_headers('http://sakai.edu'),
+        DEFAULT_REQUIRED_HEADERS,
+    )
+    assert creds_envelope.lms_type == 'sakai'
+    assert creds_envelope.lms_base_url == 'http://sakai.edu'
+    assert creds_envelope.client_key == (
+        fixtures.oauth_creds_dict['HTTP_LMS_CLIENT_KEY']
+    )
+    assert creds_envelope.oauth_token == (
+        fixtures.oauth_creds_dict['HTTP_LMS_OAUTH_TOKEN']
+    )
+
+
+def test_missing_required_headers():
+    with pytest.raises(ErrorLCResponse) as e:
+        CredsEnvelope.from_request_meta(
+            {'HTTP_LMS_TYPE': 'sakai'},
+            DEFAULT_REQUIRED_HEADERS,
+        )
+    assert [error['code'] for error in e.value.errors] == (
+        [ErrorResponseCodes.missing_required_header.value] *
+        len(DEFAULT_REQUIRED_HEADERS)
+    )
+
+
+def test_immutable():
+    creds_envelope = CredsEnvelope(client_key='key')
+    with pytest.raises(AttributeError):
+        creds_envelope.client_key = 'other key'
+    with pytest.raises(AttributeError):
+        del creds_envelope.client_key
+    assert creds_envelope.client_key == 'key'
+
+
+def test_identity():
+    creds_envelope = CredsEnvelope(
+        lms_base_url='http://sakai.edu',
+        client_key='key',
+        oauth_token='token',
+    )
+    same_creds_envelope = CredsEnvelope(
+        lms_base_url='http://sakai.edu',
+        client_key='key',
+        oauth_token='token',
+    )
+    other_creds_envelope = CredsEnvelope(
+        lms_base_url='http://sakai.edu',
+        client_key='key',
+        oauth_token='other token',
+    )
+    assert creds_envelope == same_creds_envelope
+    assert hash(creds_envelope) == hash(same_creds_envelope)
+    assert creds_envelope.identity == same_creds_envelope.identity
+    assert creds_envelope != other_creds_envelope
+    assert creds_envelope.identity != other_creds_envelope.identity
+    assert 'token' not in creds_envelope.identity
+    assert len({creds_envelope, same_creds_envelope}) == 1
+
+
+def test_repr_hides_secrets():
+    creds_envelope = CredsEnvelope(
+        client_key='key',
+        client_secret='client secret',
+        oauth_token='oauth token',
+    )
+    assert 'key' in repr(creds_envelope)
+    assert 'secret' not in repr(creds_envelope).replace('_secret', '')
+    assert 'oauth token' not in repr(creds_envelope)
+
+
+def test_fingerprint():
+    creds_envelope = CredsEnvelope(client_key='key', oauth_token='token')
+    same_creds_envelope = CredsEnvelope(client_key='key', oauth_token='token')
+    other_creds_envelope = CredsEnvelope(
+        client_key='key',
+        oauth_token='other token',
+    )
+    assert creds_envelope.fingerprint == same_creds_envelope.fingerprint
+    assert creds_envelope.fingerprint != other_creds_envelope.fingerprint
+    # Not something which can be computed without SECRET_KEY.
+    assert creds_envelope.fingerprint not in creds_envelope.identity
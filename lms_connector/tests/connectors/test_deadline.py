@@ -0,0 +1,64 @@
+from django.test.utils import override_settings
+from mock import MagicMock, patch
+import pytest
+
+from lms_connector.connectors.deadline import Deadline
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+)
+
+
+@override_settings(LMS_REQUEST_BUDGET=20)
+def test_default_budget():
+    deadline = Deadline.from_request_meta({})
+    assert deadline.budget == 20
+    assert 19 < deadline.remaining() <= 20
+
+
+@override_settings(LMS_REQUEST_BUDGET=20)
+def test_requested_budget_is_capped():
+    deadline = Deadline.from_request_meta({'HTTP_LMS_REQUEST_TIMEOUT': '5'})
+    assert deadline.budget == 5
+
+    deadline = Deadline.from_request_meta({'HTTP_LMS_REQUEST_TIMEOUT': '50'})
+    assert deadline.budget == 20
+
+
+@pytest.mark.parametrize('requested_budget', ['soon', '0', '-3'])
+def test_bad_requested_budget(requested_budget):
+    with pytest.raises(ErrorLCResponse) as e:
+        Deadline.from_request_meta({
+            'HTTP_LMS_REQUEST_TIMEOUT': requested_budget,
+        })
+    assert e.value.errors[0]['code'] == (
+        ErrorResponseCodes.bad_lms_connector_headers.value
+    )
+
+
+@override_settings(LMS_REQUEST_BUDGET=20, LMS_DEADLINE_MARGIN=1)
+def test_lambda_remaining_time():
+    lambda_context = MagicMock()
+    lambda_context.get_remaining_time_in_millis.return_value = 4000
+    deadline = Deadline.from_request_meta({
+        'serverless.context': lambda_context,
+    })
+    assert deadline.budget == 3
+
+
+@patch('lms_connector.connectors.deadline.time.monotonic')
+def test_expiry(monotonic_mock):
+    monotonic_mock.return_value = 100
+    deadline = Deadline(budget=2)
+    assert deadline.timeout() == (2, 2)
+    deadline.raise_if_expired('somewhere')
+
+    monotonic_mock.return_value = 103
+    assert deadline.expired
+    assert deadline.timeout() == (0, 0)
+    with pytest.raises(ErrorLCResponse) as e:
+        deadline.raise_if_expired('somewhere')
+    assert e.value.status_code == 504
+    assert e.value.errors[0]['code'] == (
+        ErrorResponseCodes.deadline_exceeded.value
+    )
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+from rest_framework import status
+
+from lms_connector.connectors.deadline import Deadline
+from lms_connector.connectors.fan_out import fan_out_calls
+from lms_connector.connectors.sakai import SakaiConnector
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+    FormattedError,
+)
+
+
+def test_results_keep_item_order_within_concurrency():
+    lock = threading.Lock()
+    running = []
+    most_running = []
+
+    def square(number):
+        with lock:
+            running.append(number)
+            most_running.append(len(running))
+        # Later items finish first.
+        time.sleep(0.01 * (6 - number))
+        with lock:
+            running.remove(number)
+        return number * number
+
+    fan_out_result = fan_out_calls(
+        square,
+        range(6),
+        deadline=Deadline(budget=5),
+        source='squares',
+        max_concurrency=2,
+    )
+
+    assert fan_out_result.results == [0, 1, 4, 9, 16, 25]
+    assert fan_out_result.errors == []
+    assert max(most_running) == 2
+    fan_out_result.raise_for_errors()
+
+
+def test_failures_are_collected():
+    not_found = ErrorLCResponse(
+        status_code=status.HTTP_404_NOT_FOUND,
+        errors=[FormattedError(
+            source='assignment 1',
+            code=ErrorResponseCodes.bad_thirdparty_request,
+            detail='not found',
+        )],
+    )
+
+    def check(number):
+        if number == 1:
+            raise not_found
+        if number == 2:
+            raise ValueError('bad json')
+        return number
+
+    fan_out_result = fan_out_calls(
+        check,
+        range(4),
+        deadline=Deadline(budget=5),
+        source='assignments',
+    )
+
+    assert fan_out_result.results == [0, None, None, 3]
+    assert fan_out_result.failures[1] is not_found
+    assert [error['source'] for error in fan_out_result.errors] == [
+        'assignment 1',
+        'assignments',
+    ]
+    assert fan_out_result.errors[1]['detail'] == 'bad json'
+    with pytest.raises(ErrorLCResponse) as e:
+        fan_out_result.raise_for_errors()
+    assert e.value.status_code == status.HTTP_404_NOT_FOUND
+    assert len(e.value.errors) == 2
+
+
+def test_calls_given_up_on_at_deadline():
+    started = []
+    release = threading.Event()
+
+    def stall(number):
+        started.append(number)
+        release.wait(timeout=5)
+        return number
+
+    connector = SakaiConnector(lms_base_url='http://slow-lms')
+    connector.deadline = Deadline(budget=0.05)
+    try:
+        fan_out_result = connector.fan_out(
+            stall,
+            range(3),
+            source='slow',
+            max_concurrency=1,
+        )
+    finally:
+        release.set()
+
+    # Only the first call was started, nothing was started after it.
+    assert started == [0]
+    assert fan_out_result.results == [None, None, None]
+    assert [error['code'] for error in fan_out_result.errors] == [
+        ErrorResponseCodes.deadline_exceeded.value,
+    ] * 3
@@ -0,0 +1,71 @@
+from mock import patch
+import json
+
+import pytest
+
+from lms_connector.connectors.json_stream import iter_array_items
+
+SITES = {
+    'entityPrefix': 'site',
+    'site_collection': [
+        {'id': 'site1', 'title': '학교는 재미있다', 'props': {'a': [1, 2.5]}},
+        {'id': 'site2', 'title': 'course "two"', 'sitePages': []},
+        12345,
+    ],
+    'after': 'never read',
+}
+
+
+def _chunks(data: bytes, size: int):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 100000])
+def test_items_across_chunk_boundaries(chunk_size):
+    data = json.dumps(SITES, ensure_ascii=False, indent=1).encode('utf-8')
+    items = iter_array_items(_chunks(data, chunk_size), 'site_collection')
+    assert list(items) == SITES['site_collection']
+
+
+def test_large_item_decoded_a_few_times():
+    item = {'id': 'site1', 'description': 'x' * 100000}
+    data = json.dumps({'site_collection': [item]}).encode('utf-8')
+    raw_decode = json.JSONDecoder.raw_decode
+    with patch.object(
+        json.JSONDecoder,
+        'raw_decode',
+        autospec=True,
+        side_effect=raw_decode,
+    ) as raw_decode_mock:
+        items = iter_array_items(_chunks(data, 100), 'site_collection')
+        assert list(items) == [item]
+
+    # Not once for each of the thousand chunks the item spans.
+    assert raw_decode_mock.call_count < 20
+
+
+def test_nothing_past_the_array_is_read():
+    chunks = [b'{"site_collection": [1, 2]', b', "rest": ']
+
+    def chunk_source():
+        yield from chunks
+        raise AssertionError('read past the array')
+
+    assert list(iter_array_items(chunk_source(), 'site_collection')) == [1, 2]
+
+
+@pytest.mark.parametrize('data', [b'{}', b'{"other": [1]}', b'{"x": []}'])
+def test_missing_key(data):
+    assert list(iter_array_items([data], 'site_collection')) == []
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'[]',
+    b'{"site_collection": [{"id": "site1"}',
+    b'{"site_collection": [{"id": "si',
+    b'{"site_collection": {}}',
+])
+def test_not_json(data):
+    with pytest.raises(ValueError):
+        list(iter_array_items([data], 'site_collection'))
@@ -0,0 +1,182 @@
+from django.test.utils import override_settings
+from mock import MagicMock, patch
+
+from lms_connector.connectors.read_cache import (
+    CacheEntry,
+    LayeredReadCache,
+    ReadCache,
+    SERIALIZATION_VERSION,
+    SharedReadCache,
+    dumps_entry,
+    get_cache_directives,
+    get_conditional_headers,
+    get_validators,
+    loads_entry,
+)
+
+
+@patch('lms_connector.connectors.read_cache.time.time')
+def test_entries_expire(time_mock):
+    time_mock.return_value = 0
+    read_cache = ReadCache(max_bytes=1000)
+    read_cache.set('courses', {'site_collection': []}, ttl=60)
+
+    time_mock.return_value = 59
+    assert read_cache.get('courses') == {'site_collection': []}
+    time_mock.return_value = 60
+    assert read_cache.get('courses') is None
+    assert read_cache.get_entry('courses') is None
+    assert read_cache.size == 0
+
+
+@patch('lms_connector.connectors.read_cache.time.time')
+def test_stale_entries_kept_for_grace(time_mock):
+    time_mock.return_value = 0
+    read_cache = ReadCache(max_bytes=1000)
+    read_cache.set('courses', {'site_collection': []}, ttl=60, grace=30)
+
+    time_mock.return_value = 89
+    assert read_cache.get('courses') is None
+    cache_entry = read_cache.get_entry('courses')
+    assert cache_entry.value == {'site_collection': []}
+    assert cache_entry.is_stale
+    assert cache_entry.age == 89
+
+    time_mock.return_value = 90
+    assert read_cache.get_entry('courses') is None
+
+
+def test_least_recently_used_evicted_by_size():
+    # Each value below is 9 bytes as json.
+    read_cache = ReadCache(max_bytes=25)
+    read_cache.set('one', {'a': '1'}, ttl=60)
+    read_cache.set('two', {'a': '2'}, ttl=60)
+    read_cache.get('one')
+    read_cache.set('three', {'a': '3'}, ttl=60)
+
+    assert read_cache.get('two') is None
+    assert read_cache.get('one') == {'a': '1'}
+    assert read_cache.get('three') == {'a': '3'}
+    assert read_cache.size == 18
+
+
+def test_value_too_large_is_not_cached():
+    read_cache = ReadCache(max_bytes=5)
+    read_cache.set('big', {'a': 'too big'}, ttl=60)
+    assert read_cache.get('big') is None
+    assert len(read_cache) == 0
+
+
+def test_get_cache_directives():
+    assert get_cache_directives({}) == set()
+    assert get_cache_directives({
+        'HTTP_CACHE_CONTROL': 'No-Cache, max-age=0',
+    }) == {'no-cache', 'max-age'}
+
+
+def test_entry_serialization():
+    cache_entry = CacheEntry(
+        value={'site_collection': [{'id': 'site', 'title': '학교'}]},
+        stored_at=40,
+        expires_at=100,
+        validators=(('ETag', '"site-v1"'),),
+    )
+    with override_settings(LMS_CACHE_COMPRESS_MIN_BYTES=1000):
+        data = dumps_entry(cache_entry)
+    assert data[:2] == bytes([SERIALIZATION_VERSION, 0])
+    assert loads_entry(data) == cache_entry
+
+    with override_settings(LMS_CACHE_COMPRESS_MIN_BYTES=1):
+        compressed_data = dumps_entry(cache_entry)
+    assert compressed_data[:2] == bytes([SERIALIZATION_VERSION, 1])
+    assert loads_entry(compressed_data) == cache_entry
+
+
+def test_entry_in_other_format_is_ignored():
+    data = dumps_entry(CacheEntry({'id': 'user'}, 40, 100))
+    assert loads_entry(bytes([SERIALIZATION_VERSION + 1]) + data[1:]) is None
+    assert loads_entry(None) is None
+
+
+def test_shared_hit_kept_in_process():
+    shared = SharedReadCache(alias='default')
+    layered = LayeredReadCache(local=ReadCache(max_bytes=1000), shared=shared)
+    with override_settings(LMS_SHARED_CACHE_ENABLED=True):
+        # As if another container had cached it.
+        shared.set('user', {'id': 'user'}, ttl=60)
+        assert layered.get('user') == {'id': 'user'}
+
+        shared.delete('user')
+        assert layered.get('user') == {'id': 'user'}
+        layered.delete('user')
+        assert layered.get('user') is None
+
+
+def test_failing_shared_cache_is_a_miss():
+    shared = SharedReadCache(alias='default')
+    failing_cache = MagicMock()
+    failing_cache.get.side_effect = ConnectionError('memcached is down')
+    failing_cache.set.side_effect = ConnectionError('memcached is down')
+    with patch.object(SharedReadCache, 'cache', failing_cache):
+        shared.set('user', {'id': 'user'}, ttl=60)
+        assert shared.get_entry('user') is None
+
+
+def _get_layered_cache():
+    return LayeredReadCache(
+        local=ReadCache(max_bytes=1000),
+        shared=SharedReadCache(alias='default'),
+    )
+
+
+def test_read_racing_a_write_is_not_cached():
+    layered = _get_layered_cache()
+    # The read takes the tokens, the write invalidates, then the read
+    # stores what it fetched from before the write.
+    tag_tokens = layered.tag_tokens(['assignment'])
+    layered.invalidate_tags(['assignment'])
+    layered.set('assignment', {'name': 'old'}, ttl=60, tags=tag_tokens)
+    assert layered.get('assignment') is None
+
+    layered.set(
+        'assignment',
+        {'name': 'new'},
+        ttl=60,
+        tags=layered.tag_tokens(['assignment']),
+    )
+    assert layered.get('assignment') == {'name': 'new'}
+
+
+@override_settings(LMS_SHARED_CACHE_ENABLED=True)
+def test_invalidation_shared_between_containers():
+    container = _get_layered_cache()
+    other_container = _get_layered_cache()
+    container.set(
+        'assignment',
+        {'name': 'assignment'},
+        ttl=60,
+        tags=container.tag_tokens(['assignment']),
+    )
+    assert other_container.get('assignment') == {'name': 'assignment'}
+
+    container.invalidate_tags(['assignment'])
+    # Even the copy kept in the other container's process is dropped.
+    assert other_container.get('assignment') is None
+
+
+def test_conditional_headers_from_validators():
+    validators = get_validators({
+        'ETag': '"site-v1"',
+        'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT',
+        'Content-Type': 'application/json',
+    })
+    assert validators == (
+        ('ETag', '"site-v1"'),
+        ('Last-Modified', 'Wed, 21 Oct 2015 07:28:00 GMT'),
+    )
+    assert get_conditional_headers(validators) == {
+        'If-None-Match': '"site-v1"',
+        'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT',
+    }
+    assert get_validators({}) == ()
+    assert get_conditional_headers(()) == {}
@@ -1,8 +1,37 @@
-from lms_connector.connectors.sakai import SakaiConnector
+from urllib.parse import urljoin
+import asyncio
+import json
+
+from django.test.utils import override_settings
+from mock import patch
+import httpx
+import pytest
+import requests
+import requests_mock
+
+from lms_connector.connectors.creds_envelope import CredsEnvelope
+from lms_connector.connectors.sakai import (
+    ASSIGNMENT_RESOURCE,
+    COURSES_PAGE_RESOURCE,
+    COURSES_RESOURCE,
+    CURRENT_USER_RESOURCE,
+    SCORES_RESOURCE,
+    SESSION_RESOURCE,
+    SakaiConnector,
+    SakaiSessionCache,
+    sakai_sessions,
+)
 from lms_connector.tests.fixtures import (
+    current_user_response,
+    get_mocked_headers,
+    oauth_creds_dict,
+    sakai_get_assignment_response,
+    sakai_post_grade_data,
+    sakai_post_grade_response,
     sample_html_error_message_page,
     sample_html_error_message,
 )
+from lms_connector.responses import ErrorLCResponse, ErrorResponseCodes
 
 
 def test_parse_html_error():
@@ -15,3 +44,339 @@ def test_parse_html_error():
 def test_parse_non_html_error():
     sample_text = "blah blah blah"
     assert SakaiConnector.get_error(sample_text) == sample_text
+
+
+class InlineExecutor:
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+def _get_connector(lms_base_url):
+    return SakaiConnector.get_connector(
+        'sakai',
+        lms_base_url,
+        CredsEnvelope.from_request_meta(
+            get_mocked_headers(lms_base_url),
+            required_headers=[],
+        ),
+    )
+
+
+@override_settings(
+    LMS_SAKAI_SESSION_REUSE=True,
+    LMS_CACHE_TTL_CURRENT_USER=0,
+)
+@patch(
+    'lms_connector.connectors.sakai.get_background_executor',
+    InlineExecutor,
+)
+def test_session_reused_after_first_call():
+    lms_base_url = 'http://session-lms'
+    user_url = urljoin(lms_base_url, CURRENT_USER_RESOURCE)
+    session_url = urljoin(lms_base_url, SESSION_RESOURCE)
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(user_url, json=current_user_response)
+        http_mock.get(
+            session_url,
+            json={},
+            cookies={'JSESSIONID': 'sakai-session-id'},
+        )
+        _get_connector(lms_base_url).get_current_user_info()
+        _get_connector(lms_base_url).get_current_user_info()
+
+    # The executor runs inline, so the session is created before the
+    # first call is made.
+    session_call, first_call, second_call = http_mock.request_history
+    assert b'oauth_signature' in first_call.headers['Authorization']
+    assert b'oauth_signature' in session_call.headers['Authorization']
+    assert session_call.url == session_url
+    # The second call rides on the session rather than being signed.
+    assert 'Authorization' not in second_call.headers
+    assert second_call.headers['Cookie'] == 'JSESSIONID=sakai-session-id'
+
+
+@override_settings(LMS_SAKAI_SESSION_REUSE=True)
+def test_rejected_session_falls_back_to_oauth():
+    lms_base_url = 'http://expired-session-lms'
+    user_url = urljoin(lms_base_url, CURRENT_USER_RESOURCE)
+    connector = _get_connector(lms_base_url)
+    session_key = connector._get_session_key(
+        connector.creds_envelope,
+        lms_base_url,
+    )
+    sakai_sessions.set(session_key, 'expired-session-id')
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(user_url, [
+            {'status_code': 401},
+            {'json': current_user_response},
+        ])
+        user = connector.get_current_user_info()
+
+    assert user['lms_user_id'] == current_user_response['id']
+    session_call, signed_call = http_mock.request_history
+    assert 'Authorization' not in session_call.headers
+    assert b'oauth_signature' in signed_call.headers['Authorization']
+    assert sakai_sessions.get(session_key) is None
+
+
+def test_session_cache_expiry():
+    session_cache = SakaiSessionCache(ttl=60, max_entries=1)
+    with patch('lms_connector.connectors.sakai.time.monotonic') as now_mock:
+        now_mock.return_value = 0
+        session_cache.set(('host', 'creds'), 'session-id')
+        now_mock.return_value = 59
+        assert session_cache.get(('host', 'creds')) == 'session-id'
+        # Using the session extended it.
+        now_mock.return_value = 118
+        assert session_cache.get(('host', 'creds')) == 'session-id'
+        now_mock.return_value = 179
+        assert session_cache.get(('host', 'creds')) is None
+
+    session_cache.set(('host', 'creds'), 'session-id')
+    session_cache.set(('host', 'other creds'), 'other-session-id')
+    assert session_cache.get(('host', 'creds')) is None
+
+
+@override_settings(
+    LMS_CACHE_TTL_COURSES=60,
+    LMS_SAKAI_SITES_PAGE_SIZE=100,
+)
+def test_list_courses_caches_only_what_courses_need():
+    lms_base_url = 'http://large-sites-lms'
+    site_props = {'prop{}'.format(i): 'x' * 100 for i in range(50)}
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(urljoin(lms_base_url, COURSES_RESOURCE), json={
+            'site_collection': [
+                {
+                    'id': 'site1',
+                    'title': 'Course',
+                    'props': site_props,
+                    'sitePages': [{'title': 'Gradebook', 'tools': []}],
+                },
+                {'id': 'site2', 'title': 'No gradebook', 'props': {}},
+            ],
+        })
+        connector = _get_connector(lms_base_url)
+        courses = connector.list_courses()
+
+    assert courses == [{'course_id': 'site1', 'title': 'Course'}]
+    assert http_mock.request_history[0].stream
+    cache_entry = connector._get_cached((
+        lms_base_url,
+        COURSES_PAGE_RESOURCE.format(start=0, limit=100),
+        connector.creds_envelope.identity,
+    ))
+    assert cache_entry.value == {'site_collection': [
+        {'id': 'site1', 'title': 'Course', 'sitePages': [
+            {'title': 'Gradebook'},
+        ]},
+        {'id': 'site2', 'title': 'No gradebook', 'sitePages': []},
+    ]}
+
+
+@override_settings(LMS_CACHE_TTL_CURRENT_USER=60)
+def test_failed_current_user_read_keeps_sakai_error():
+    lms_base_url = 'http://failing-user-lms'
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(lms_base_url, CURRENT_USER_RESOURCE),
+            status_code=500,
+            text=sample_html_error_message_page,
+        )
+        with pytest.raises(ErrorLCResponse) as error_info:
+            _get_connector(lms_base_url).get_current_user_info()
+
+    error, = error_info.value.data['errors']
+    assert error['code'] == ErrorResponseCodes.bad_thirdparty_request.value
+    assert error['detail'] == sample_html_error_message
+    assert error['status'] == 500
+
+
+class StreamedSites:
+    """
+    A site.json response read in small chunks, keeping track of how much
+    of it was read.
+    """
+    def __init__(self, body):
+        self.body = body
+        self.read_until = 0
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), 16):
+            self.read_until = start + 16
+            yield self.body[start:start + 16]
+
+
+def test_parse_sites_reads_the_whole_body():
+    body = json.dumps({
+        'site_collection': [{'id': 'site1', 'title': 'Site', 'props': {}}],
+        'entityPrefix': 'site' * 100,
+    }).encode('utf-8')
+    response = StreamedSites(body)
+
+    assert SakaiConnector._parse_sites(response) == {'site_collection': [
+        {'id': 'site1', 'title': 'Site', 'sitePages': []},
+    ]}
+    assert response.read_until >= len(body)
+
+
+@override_settings(LMS_CACHE_TTL_COURSES=60)
+@patch.object(requests.Response, 'close', autospec=True)
+def test_streamed_responses_closed(close_mock):
+    lms_base_url = 'http://closing-lms'
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(lms_base_url, COURSES_RESOURCE),
+            json={'site_collection': []},
+        )
+        _get_connector(lms_base_url).list_courses()
+
+    assert close_mock.call_count == http_mock.call_count == 1
+
+
+def _gradebook_site(site_id):
+    return {
+        'id': site_id,
+        'title': site_id,
+        'sitePages': [{'title': 'Gradebook'}],
+    }
+
+
+def _mock_site_pages(http_mock, lms_base_url, sites, page_size):
+    for start in range(0, len(sites) + 1, page_size):
+        http_mock.get(
+            urljoin(lms_base_url, COURSES_PAGE_RESOURCE.format(
+                start=start,
+                limit=page_size,
+            )),
+            json={'site_collection': sites[start:start + page_size]},
+            complete_qs=True,
+        )
+
+
+@override_settings(LMS_CACHE_TTL_COURSES=0, LMS_SAKAI_SITES_PAGE_SIZE=2)
+def test_list_courses_pages_through_sites():
+    lms_base_url = 'http://paged-sites-lms'
+    sites = [_gradebook_site(f'site{i}') for i in range(5)]
+    with requests_mock.Mocker() as http_mock:
+        _mock_site_pages(http_mock, lms_base_url, sites, page_size=2)
+        courses = _get_connector(lms_base_url).list_courses()
+
+    assert [course['course_id'] for course in courses] == [
+        'site0', 'site1', 'site2', 'site3', 'site4',
+    ]
+    # The last page is short, so no more are asked for.
+    assert sorted(call.qs['_start'] for call in http_mock.request_history) == [
+        ['0'], ['2'], ['4'],
+    ]
+
+
+@override_settings(LMS_CACHE_TTL_COURSES=0, LMS_SAKAI_SITES_PAGE_SIZE=1)
+def test_iter_courses_stops_paging_with_the_caller():
+    lms_base_url = 'http://many-sites-lms'
+    sites = [_gradebook_site(f'site{i}') for i in range(20)]
+    with requests_mock.Mocker() as http_mock:
+        _mock_site_pages(http_mock, lms_base_url, sites, page_size=1)
+        courses = _get_connector(lms_base_url).iter_courses()
+        first_course = next(courses)
+        courses.close()
+
+    assert first_course['course_id'] == 'site0'
+    # The first page, and at most the one read ahead of it.
+    assert http_mock.call_count <= 2
+
+
+@override_settings(LMS_CACHE_TTL_COURSES=0, LMS_SAKAI_SITES_PAGE_SIZE=2)
+def test_list_courses_when_sakai_ignores_paging():
+    lms_base_url = 'http://unpaged-sites-lms'
+    sites = [_gradebook_site('site0'), _gradebook_site('site1')]
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(lms_base_url, COURSES_RESOURCE),
+            json={'site_collection': sites},
+        )
+        courses = _get_connector(lms_base_url).list_courses()
+
+    assert [course['course_id'] for course in courses] == ['site0', 'site1']
+    assert http_mock.call_count == 2
+
+
+def _mock_async_client(handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return patch.object(
+        SakaiConnector,
+        '_async_client_for',
+        return_value=client,
+    )
+
+
+@override_settings(LMS_CACHE_TTL_ASSIGNMENT=0)
+def test_async_get_assignment_matches_sync():
+    lms_base_url = 'http://async-lms'
+    assignment_url = urljoin(lms_base_url, ASSIGNMENT_RESOURCE.format(
+        lms_course_id='course',
+        lms_assignment_id='assignment',
+    ))
+    async_requests = []
+
+    def respond(request):
+        async_requests.append(request)
+        return httpx.Response(200, json=sakai_get_assignment_response)
+
+    with _mock_async_client(respond), requests_mock.Mocker() as http_mock:
+        http_mock.get(assignment_url, json=sakai_get_assignment_response)
+        sync_assignment = _get_connector(lms_base_url).get_assignment(
+            'course',
+            'assignment',
+        )
+        async_assignment = asyncio.run(
+            _get_connector(lms_base_url).aget_assignment(
+                'course',
+                'assignment',
+            )
+        )
+
+    assert async_assignment == sync_assignment
+    request, = async_requests
+    assert str(request.url) == assignment_url
+    authorization = request.headers['Authorization']
+    assert 'oauth_signature=' in authorization
+    assert (
+        f'oauth_token="{oauth_creds_dict["HTTP_LMS_OAUTH_TOKEN"]}"'
+        in authorization
+    )
+
+
+def test_async_post_grades_matches_sync():
+    lms_base_url = 'http://async-post-lms'
+    scores_url = urljoin(lms_base_url, SCORES_RESOURCE.format(
+        lms_course_id='course',
+    ))
+    post_grades_kwargs = {
+        'lms_course_id': 'course',
+        'lms_assignment_id': 'assignment',
+        'max_grade': sakai_post_grade_data['max_grade'],
+        'student_grade_info': sakai_post_grade_data['grades'],
+        'external_assignment_id': (
+            sakai_post_grade_data['external_assignment_id']
+        ),
+    }
+    async_requests = []
+
+    def respond(request):
+        async_requests.append(request)
+        return httpx.Response(200, json=sakai_post_grade_response)
+
+    with _mock_async_client(respond), requests_mock.Mocker() as http_mock:
+        http_mock.post(scores_url, json=sakai_post_grade_response)
+        sync_assignment = _get_connector(lms_base_url).post_grades(
+            **post_grades_kwargs
+        )
+        async_assignment = asyncio.run(
+            _get_connector(lms_base_url).apost_grades(**post_grades_kwargs)
+        )
+
+    assert async_assignment == sync_assignment
+    request, = async_requests
+    assert request.method == 'POST'
+    assert json.loads(request.content) == http_mock.last_request.json()
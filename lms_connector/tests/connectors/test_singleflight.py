@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+
+from rest_framework import status
+import pytest
+
+from lms_connector.connectors.singleflight import (
+    AsyncSingleFlight,
+    SingleFlight,
+    SingleFlightTimeout,
+)
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+    FormattedError,
+)
+
+
+def _run_concurrently(single_flight, fn, callers=5):
+    """
+    Start callers identical calls while the first one is held in flight.
+    """
+    release = threading.Event()
+    calls = []
+
+    def held_fn():
+        calls.append(1)
+        release.wait(timeout=5)
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        futures = [
+            executor.submit(single_flight.do, 'key', held_fn)
+            for _ in range(callers)
+        ]
+        # Give every caller time to join the call in flight.
+        time.sleep(0.1)
+        release.set()
+    return calls, futures
+
+
+def test_concurrent_calls_share_one_call():
+    single_flight = SingleFlight()
+    result = {'site_collection': []}
+    calls, futures = _run_concurrently(single_flight, lambda: result)
+
+    assert len(calls) == 1
+    assert all(future.result() is result for future in futures)
+    assert single_flight.in_flight == 0
+
+
+def test_concurrent_calls_share_failure():
+    single_flight = SingleFlight()
+    error_response = ErrorLCResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        errors=[FormattedError(
+            source='http://sakai.edu',
+            code=ErrorResponseCodes.bad_thirdparty_request,
+            detail='nope',
+        )],
+    )
+
+    def fail():
+        raise error_response
+
+    calls, futures = _run_concurrently(single_flight, fail)
+    assert len(calls) == 1
+    raised = [future.exception() for future in futures]
+    for exception in raised:
+        assert isinstance(exception, ErrorLCResponse)
+        assert exception.errors == error_response.errors
+    # Every caller gets its own response to render.
+    assert len({id(exception) for exception in raised}) == len(raised)
+
+
+def test_sequential_calls_are_not_shared():
+    single_flight = SingleFlight()
+    assert single_flight.do('key', lambda: 1) == 1
+    assert single_flight.do('key', lambda: 2) == 2
+
+
+def test_waiting_caller_times_out():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(single_flight.do, 'key', release.wait)
+        while single_flight.in_flight == 0:
+            time.sleep(0.001)
+        with pytest.raises(SingleFlightTimeout):
+            single_flight.do('key', lambda: None, timeout=0.01)
+        release.set()
+
+
+def test_async_concurrent_calls_share_one_call():
+    single_flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {'grades_collection': []}
+
+    async def run():
+        return await asyncio.gather(*[
+            single_flight.do('key', fetch) for _ in range(5)
+        ])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert single_flight.in_flight == 0
+
+
+def test_async_concurrent_calls_share_failure():
+    single_flight = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError('bad json')
+
+    async def run():
+        return await asyncio.gather(
+            *[single_flight.do('key', fetch) for _ in range(3)],
+            return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
@@ -0,0 +1,252 @@
+from mock import patch
+import asyncio
+import requests_mock
+
+from lms_connector.connectors.transport import (
+    AsyncClientPool,
+    CircuitBreaker,
+    CircuitState,
+    HedgeBudget,
+    LatencyTracker,
+    RetryPolicy,
+    SessionPool,
+    TokenBucket,
+    get_host_key,
+    parse_retry_after,
+)
+
+
+def _get_pool(**kwargs):
+    pool_kwargs = {
+        'max_hosts': 2,
+        'pool_maxsize': 3,
+        'idle_timeout': 60,
+    }
+    pool_kwargs.update(kwargs)
+    return SessionPool(**pool_kwargs)
+
+
+def test_get_host_key():
+    assert get_host_key('HTTP://Sakai.edu/portal/') == 'http://sakai.edu'
+    assert get_host_key('https://sakai.edu:8443') == 'https://sakai.edu:8443'
+
+
+def test_session_reused_per_host():
+    """
+    Calls against the same host share a session, other hosts do not.
+    """
+    pool = _get_pool()
+    session = pool.session_for('http://sakai.edu/')
+    assert pool.session_for('http://sakai.edu/direct/') is session
+    assert pool.session_for('http://other.edu/') is not session
+
+
+def test_pool_size_is_bounded():
+    pool = _get_pool()
+    adapter = pool.session_for('http://sakai.edu/').get_adapter(
+        'http://sakai.edu/'
+    )
+    assert adapter._pool_maxsize == 3
+
+
+def test_least_recently_used_host_evicted():
+    pool = _get_pool()
+    first_session = pool.session_for('http://one.edu')
+    pool.session_for('http://two.edu')
+    # Touch one.edu so that two.edu is the least recently used.
+    pool.session_for('http://one.edu')
+
+    with patch.object(first_session, 'close') as close_mock:
+        pool.session_for('http://three.edu')
+        assert close_mock.call_count == 0
+
+    assert pool.hosts == ['http://one.edu', 'http://three.edu']
+
+
+@patch('lms_connector.connectors.transport.time.monotonic')
+def test_idle_host_evicted(monotonic_mock):
+    pool = _get_pool()
+    monotonic_mock.return_value = 0
+    idle_session = pool.session_for('http://idle.edu')
+
+    monotonic_mock.return_value = 61
+    with patch.object(idle_session, 'close') as close_mock:
+        pool.session_for('http://busy.edu')
+        assert close_mock.call_count == 1
+
+    assert pool.hosts == ['http://busy.edu']
+    assert pool.session_for('http://idle.edu') is not idle_session
+
+
+@patch('lms_connector.connectors.transport.time.monotonic')
+def test_circuit_breaker_opens_and_recovers(monotonic_mock):
+    monotonic_mock.return_value = 0
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+    assert breaker.state == CircuitState.closed
+
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.open
+    assert not breaker.allow_request()
+    assert breaker.retry_after() == 10
+
+    # After the reset timeout a single probe is allowed through.
+    monotonic_mock.return_value = 10
+    assert breaker.state == CircuitState.half_open
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitState.closed
+    assert breaker.allow_request()
+
+
+@patch('lms_connector.connectors.transport.time.monotonic')
+def test_circuit_breaker_failed_probe_reopens(monotonic_mock):
+    monotonic_mock.return_value = 0
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+    breaker.record_failure()
+
+    monotonic_mock.return_value = 11
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.open
+    assert not breaker.allow_request()
+
+
+def test_retry_backoff_is_bounded():
+    retry_policy = RetryPolicy(
+        max_retries=5,
+        backoff_base=1,
+        backoff_max=3,
+    )
+    for retry_number in range(1, 6):
+        backoff = retry_policy.backoff(retry_number)
+        assert 0 <= backoff <= min(3, 2 ** (retry_number - 1))
+
+
+def test_latency_percentile():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for latency in range(1, 10):
+        tracker.record(latency)
+    assert tracker.percentile(95) is None
+
+    for latency in range(10, 201):
+        tracker.record(latency)
+    # Only the last 100 calls count.
+    assert tracker.percentile(95) == 195
+    assert tracker.percentile(50) == 150
+
+
+def test_hedge_budget():
+    budget = HedgeBudget(ratio=0.5, max_tokens=2)
+    budget.record_call()
+    assert not budget.try_spend()
+    budget.record_call()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+    for _ in range(10):
+        budget.record_call()
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+
+@patch('lms_connector.connectors.transport.time.monotonic')
+def test_token_bucket_limits_rate(monotonic_mock):
+    monotonic_mock.return_value = 0
+    bucket = TokenBucket(rate=2, burst=2)
+    assert bucket.acquire(timeout=0) == (True, 0)
+    assert bucket.acquire(timeout=0) == (True, 0)
+    # The next token is half a second away.
+    assert bucket.acquire(timeout=0.1) == (False, 0)
+    assert bucket.retry_after() == 0.5
+
+    monotonic_mock.return_value = 0.5
+    assert bucket.acquire(timeout=0) == (True, 0)
+
+
+def test_async_client_reused_per_host_and_event_loop():
+    pool = AsyncClientPool(max_hosts=2, pool_maxsize=3, idle_timeout=60)
+
+    async def get_clients():
+        return (
+            pool.client_for('http://sakai.edu/'),
+            pool.client_for('http://sakai.edu/direct/'),
+        )
+
+    client, same_loop_client = asyncio.run(get_clients())
+    other_loop_client, _ = asyncio.run(get_clients())
+    assert same_loop_client is client
+    assert other_loop_client is not client
+    # The client of the first, now closed, event loop was dropped.
+    assert pool.hosts == ['http://sakai.edu']
+
+
+def test_token_bucket_queues_within_timeout():
+    bucket = TokenBucket(rate=50, burst=1)
+    assert bucket.acquire(timeout=0)[0]
+    acquired, queue_depth = bucket.acquire(timeout=1)
+    assert acquired
+    assert queue_depth == 1
+    assert bucket.queue_depth == 0
+
+
+def test_token_bucket_async_acquire_queues_within_timeout():
+    bucket = TokenBucket(rate=50, burst=1)
+
+    async def acquire_twice():
+        return await asyncio.gather(
+            bucket.aacquire(timeout=1),
+            bucket.aacquire(timeout=1),
+        )
+
+    first, second = asyncio.run(acquire_twice())
+    assert first == (True, 0)
+    assert second == (True, 1)
+    assert bucket.queue_depth == 0
+
+
+@patch('lms_connector.connectors.transport.time.monotonic')
+def test_token_bucket_backs_off_when_throttled(monotonic_mock):
+    monotonic_mock.return_value = 0
+    bucket = TokenBucket(rate=10, burst=10)
+    bucket.record_throttled(retry_after=30)
+    assert bucket.rate == 5
+    assert bucket.acquire(timeout=29) == (False, 0)
+    assert bucket.retry_after() == 30
+
+    monotonic_mock.return_value = 30
+    assert bucket.acquire(timeout=0)[0]
+
+    for _ in range(20):
+        bucket.record_success()
+    assert bucket.rate == 10
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+
+
+def test_pooled_session_keeps_no_cookies():
+    """
+    Sessions are shared across credentials, so must not hold cookies.
+    """
+    pool = _get_pool()
+    session = pool.session_for('http://sakai.edu')
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            'http://sakai.edu/direct/site.json',
+            cookies={'JSESSIONID': 'someone-elses-session'},
+        )
+        response = session.get('http://sakai.edu/direct/site.json')
+        session.get('http://sakai.edu/direct/site.json')
+
+    assert response.cookies.get('JSESSIONID') == 'someone-elses-session'
+    assert len(session.cookies) == 0
+    assert 'Cookie' not in http_mock.request_history[1].headers
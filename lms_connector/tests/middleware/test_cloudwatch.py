@@ -29,3 +29,24 @@ def test_cloudwatch_status_mode_metric():
         actual = actual['Dimensions'][0]['Value']
 
         assert actual == str(status_code)
+
+
+def test_cloudwatch_rate_limit_queue_depth_metric():
+    resp = Response()
+    resp.rate_limit_queue_depths = {'http://sakai.edu': 7}
+
+    with patch(
+        'lms_connector.middleware.cloudwatch.boto3.client',
+        autospec=True
+    ) as boto3_mock, patch.dict(
+        'os.environ', {'STAGE': 'funstage'},
+    ):
+        client_mock = MagicMock()
+        boto3_mock.return_value = client_mock
+        CloudWatch(lambda request: resp)(None)
+
+        metric_data = client_mock.method_calls[0][2]['MetricData']
+        assert len(metric_data) == 2
+        assert metric_data[1]['MetricName'] == 'rate_limit_queue_depth'
+        assert metric_data[1]['Dimensions'][0]['Value'] == 'http://sakai.edu'
+        assert metric_data[1]['Value'] == 7
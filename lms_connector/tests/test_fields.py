@@ -0,0 +1,41 @@
+import pytest
+
+from lms_connector.entities import (
+    Assignment,
+    AssignmentExistence,
+    AssignmentExistenceStatus,
+    Course,
+    Grade,
+    LMSUser,
+    Role,
+    Student,
+)
+from lms_connector.fields import project
+
+
+@pytest.mark.parametrize('entity', [
+    Course(course_id='course', title='title'),
+    Student(
+        student_id='student',
+        email='email',
+        role=Role.student,
+        first_name='first',
+        last_name='last',
+        user_name='user',
+    ),
+    LMSUser(lms_user_id='user', email='email', first_name='', last_name=''),
+    Grade(lms_student_id='student', grade=1),
+    Assignment(title='title', max_grade=1, grades=[]),
+    AssignmentExistence(
+        lms_assignment_id='assignment',
+        status=AssignmentExistenceStatus.found,
+    ),
+])
+def test_entity_fields(entity):
+    assert set(entity).issubset(type(entity).FIELDS)
+
+
+def test_project():
+    assignment = Assignment(title='title', max_grade=10)
+    assert project(assignment, None) is assignment
+    assert project(assignment, ('max_grade', 'grades')) == {'max_grade': 10}
@@ -0,0 +1,50 @@
+import json
+
+from rest_framework import status
+
+from lms_connector.renderers import NDJSONRenderer, json_lines
+from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+    FormattedError,
+)
+
+
+def test_lines_end_with_errors_on_failure():
+    def courses():
+        yield {'course_id': 'site1'}
+        raise KeyError('site_collection')
+
+    lines = list(json_lines(courses(), source='/courses'))
+
+    assert json.loads(lines[0]) == {'course_id': 'site1'}
+    errors = json.loads(lines[1])['errors']
+    assert errors[0]['source'] == '/courses'
+    assert errors[0]['code'] == 'unhandled_exception'
+    assert all(line.endswith(b'\n') for line in lines)
+
+
+def test_lines_end_with_error_response_errors():
+    lms_error = FormattedError(
+        source='http://lms/direct/site.json?_start=100&_limit=100',
+        code=ErrorResponseCodes.bad_thirdparty_request,
+        detail='Sakai is down',
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+    def courses():
+        yield {'course_id': 'site1'}
+        raise ErrorLCResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            errors=[lms_error],
+        )
+
+    lines = list(json_lines(courses(), source='/courses'))
+
+    assert json.loads(lines[1]) == {'errors': [lms_error]}
+
+
+def test_render_single_line():
+    renderer = NDJSONRenderer()
+    assert renderer.render({'errors': []}) == b'{"errors":[]}\n'
+    assert renderer.render(None) == b''
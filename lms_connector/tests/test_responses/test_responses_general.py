@@ -1,3 +1,5 @@
+import copy
+
 from rest_framework.response import Response as DRFResponse
 from rest_framework import status
 
@@ -83,3 +85,34 @@ def test_error_response_shorthand():
     num_errors_expected = 2
     assert response.data['errors'] == [formatted_error] * num_errors_expected
     assert response.status_code == mock_status_code
+
+
+def test_copy_error_response():
+    error_response = ErrorLCResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        errors=[formatted_error],
+    )
+    error_response['Retry-After'] = '5'
+
+    error_response_copy = copy.copy(error_response)
+    assert error_response_copy is not error_response
+    assert error_response_copy.status_code == error_response.status_code
+    assert error_response_copy.errors == [formatted_error]
+    assert error_response_copy['Retry-After'] == '5'
+
+
+def test_etag_over_rendered_body():
+    response = SingleLCResponse(
+        status_code=mock_status_code,
+        result={'toronto': 'snow', 'montréal': 'ice'},
+    )
+    response.content = b'{"result":{"toronto":"snow"}}'
+    etag = response.etag
+    assert etag.startswith('"')
+
+    response.content = b'{"result":{"toronto":"ice"}}'
+    assert response.etag != etag
+
+    response.not_modified()
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b''
@@ -1,4 +1,6 @@
+import json
 import pytest
+from django.conf import settings
 from django.test import Client
 from django.urls import reverse
 from django.test.utils import override_settings
@@ -10,6 +12,7 @@ from urllib.parse import (
 )
 import requests
 import requests_mock
+import time
 
 from lms_connector.responses import (
     ErrorLCResponse,
@@ -21,7 +24,13 @@ from lms_connector.tests import fixtures
 from lms_connector.tests.helpers import spy_on
 from lms_connector.entities import Role
 from lms_connector.connectors import sakai
+from lms_connector.connectors.creds_envelope import (
+    DEFAULT_REQUIRED_HEADERS,
+    CredsEnvelope,
+)
+from lms_connector.connectors.read_cache import read_cache
 from lms_connector import helpers
+from lms_connector import views
 
 
 TEST_API_KEY = 'TEST_API_KEY'
@@ -115,7 +124,8 @@ def test_sakai_auth_url(oauth_mock):
     Test that we can retrieve a formatted Oauth1 URL for Sakai
     """
     def mock_fetch_token(mock_oauth_token, mock_oauth_token_secret):
-        def mock_token_getter(mock_url):
+        def mock_token_getter(mock_url, timeout):
+            assert timeout[0] > 0
             return {
                 'oauth_token': mock_oauth_token,
                 'oauth_token_secret': mock_oauth_token_secret,
@@ -364,9 +374,9 @@ def test_get_assignment():
     Test getting an assignment.
 
     Submit a quoted assignment id to the lms connector, and observe
-    that we call requests.get() using the unquoted version.
+    that we call Session.request() using the unquoted version.
 
-    We mock the quoted version because requests.get() will automatically
+    We mock the quoted version because Session.request() will automatically
     quote the assignment id.
     """
     mocked_lms_base_url = 'http://jjjjjjjj'
@@ -388,9 +398,10 @@ def test_get_assignment():
     )
     mocked_url = urljoin(mocked_lms_base_url, mocked_resource)
 
-    requests.get = spy_on(requests.get)
+    session_request_spy = spy_on(requests.Session.request)
 
-    with requests_mock.Mocker() as http_mock:
+    with requests_mock.Mocker() as http_mock, \
+            patch.object(requests.Session, 'request', session_request_spy):
         client = Client()
         http_mock.get(
             mocked_url_quoted,
@@ -417,8 +428,9 @@ def test_get_assignment():
     assert resp.json() == expected
     assert resp.status_code == status.HTTP_200_OK
 
-    # Check that we called get with the unquoted resource
-    actual_get_url = requests.get.mock.call_args_list[0][0][0]
+    # Check that we called get with the unquoted resource, the first
+    # positional arguments are the session itself and the method.
+    actual_get_url = session_request_spy.mock.call_args_list[0][0][2]
     assert actual_get_url == mocked_url
 
 
@@ -620,7 +632,9 @@ def test_required_get_auth_headers():
         **headers,
     )
     expected_errors = []
-    for required_header in sakai.AUTH_REQUIRED_HEADERS:
+    for required_header in views.AuthUrlView.required_headers:
+        if required_header in headers:
+            continue
         expected_errors.append(FormattedError(
             source=helpers.HEADERS_PROCESSOR,
             code=ErrorResponseCodes.missing_required_header,
@@ -656,7 +670,7 @@ def test_required_headers_via_get(http_method, endpoint, endpoint_kwargs):
         **headers,
     )
     expected_errors = []
-    for required_header in sakai.DEFAULT_REQUIRED_HEADERS:
+    for required_header in DEFAULT_REQUIRED_HEADERS:
         expected_errors.append(FormattedError(
             source=helpers.HEADERS_PROCESSOR,
             code=ErrorResponseCodes.missing_required_header,
@@ -667,3 +681,1058 @@ def test_required_headers_via_get(http_method, endpoint, endpoint_kwargs):
         errors=expected_errors,
     )
     assert resp.data == expected_error_response.data
+
+
+@patch('lms_connector.connectors.abstract.time.sleep')
+def test_get_retried_on_gateway_error(sleep_mock):
+    mocked_lms_base_url = 'http://flaky-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.CURRENT_USER_RESOURCE)
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, [
+            {'status_code': status.HTTP_503_SERVICE_UNAVAILABLE},
+            {'exc': requests.exceptions.ConnectionError},
+            {
+                'status_code': status.HTTP_200_OK,
+                'json': fixtures.current_user_response,
+            },
+        ])
+        resp = Client().get(
+            reverse('current_user'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert http_mock.call_count == 3
+    assert sleep_mock.call_count == 2
+    assert resp['LMS-Upstream-Retries'] == '2'
+    assert resp['LMS-Circuit-State'] == 'http://flaky-lms=closed'
+
+
+@patch('lms_connector.connectors.abstract.time.sleep')
+def test_post_is_not_retried(sleep_mock):
+    mocked_lms_base_url = 'http://flaky-post-lms'
+    mocked_url = urljoin(
+        mocked_lms_base_url,
+        sakai.SCORES_RESOURCE.format(lms_course_id='course'),
+    )
+    with requests_mock.Mocker() as http_mock:
+        http_mock.post(
+            mocked_url,
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            text='unavailable',
+        )
+        resp = Client().post(
+            reverse(
+                'grades',
+                kwargs={'lms_course_id': 'course', 'lms_assignment_id': 'a'},
+            ),
+            content_type='application/json',
+            data=fixtures.sakai_post_grade_data,
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    assert http_mock.call_count == 1
+    assert sleep_mock.call_count == 0
+    assert resp['LMS-Upstream-Retries'] == '0'
+
+
+@override_settings(LMS_CIRCUIT_FAILURE_THRESHOLD=2, LMS_RETRY_MAX=0)
+def test_open_circuit_fails_fast():
+    mocked_lms_base_url = 'http://sick-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE)
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, exc=requests.exceptions.ConnectTimeout)
+        for _ in range(2):
+            resp = client.get(
+                reverse('courses'),
+                **fixtures.get_mocked_headers(mocked_lms_base_url)
+            )
+            assert resp.status_code == status.HTTP_400_BAD_REQUEST
+        assert resp['LMS-Circuit-State'] == 'http://sick-lms=open'
+
+        resp = client.get(
+            reverse('courses'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    # The last call never reached the LMS.
+    assert http_mock.call_count == 2
+    assert resp.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert resp.json()['errors'][0]['code'] == (
+        ErrorResponseCodes.lms_circuit_open.value
+    )
+    assert int(resp['Retry-After']) > 0
+    assert resp['LMS-Circuit-State'] == 'http://sick-lms=open'
+
+
+def test_upstream_calls_share_deadline():
+    mocked_lms_base_url = 'http://jjjjjjjj'
+    mocked_url = urljoin(
+        mocked_lms_base_url,
+        sakai.SCORES_RESOURCE.format(lms_course_id='course'),
+    )
+    with requests_mock.Mocker() as http_mock:
+        http_mock.post(
+            mocked_url,
+            status_code=status.HTTP_200_OK,
+            json=fixtures.sakai_post_assignment_response,
+        )
+        resp = Client().post(
+            reverse(
+                'assignments',
+                kwargs={'lms_course_id': 'course', 'lms_assignment_id': 'a'},
+            ),
+            content_type='application/json',
+            data=fixtures.sakai_post_assignment_data,
+            HTTP_LMS_REQUEST_TIMEOUT='3',
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert resp.status_code == status.HTTP_200_OK
+    connect_timeout, read_timeout = http_mock.request_history[0].timeout
+    assert 0 < connect_timeout <= 3
+    assert 0 < read_timeout <= 3
+
+
+@patch('lms_connector.connectors.deadline.time.monotonic')
+def test_deadline_exceeded(monotonic_mock):
+    mocked_lms_base_url = 'http://slow-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE)
+    monotonic_mock.return_value = 0
+
+    def slow_response(request, context):
+        # The LMS used up the whole budget.
+        monotonic_mock.return_value = 10
+        raise requests.exceptions.ReadTimeout
+
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, text=slow_response)
+        resp = Client().get(
+            reverse('courses'),
+            HTTP_LMS_REQUEST_TIMEOUT='2',
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert http_mock.call_count == 1
+    assert resp.status_code == status.HTTP_504_GATEWAY_TIMEOUT
+    assert resp.json()['errors'][0]['code'] == (
+        ErrorResponseCodes.deadline_exceeded.value
+    )
+
+
+def test_throttled_get_waits_for_retry_after():
+    mocked_lms_base_url = 'http://throttling-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.CURRENT_USER_RESOURCE)
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, [
+            {
+                'status_code': status.HTTP_429_TOO_MANY_REQUESTS,
+                'headers': {'Retry-After': '0'},
+            },
+            {
+                'status_code': status.HTTP_200_OK,
+                'json': fixtures.current_user_response,
+            },
+        ])
+        resp = Client().get(
+            reverse('current_user'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert http_mock.call_count == 2
+    assert resp['LMS-Upstream-Retries'] == '1'
+
+
+@override_settings(LMS_RATE_LIMITS={'http://busy-lms': 0.01})
+def test_rate_limited_past_deadline():
+    mocked_lms_base_url = 'http://busy-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.CURRENT_USER_RESOURCE)
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            mocked_url,
+            status_code=status.HTTP_200_OK,
+            json=fixtures.current_user_response,
+        )
+        with override_settings(LMS_RATE_LIMIT_BURST=1):
+            resp = client.get(
+                reverse('current_user'),
+                **fixtures.get_mocked_headers(mocked_lms_base_url)
+            )
+            assert resp.status_code == status.HTTP_200_OK
+
+        # The next token is 100 seconds away, well past the deadline.
+        resp = client.get(
+            reverse('current_user'),
+            HTTP_LMS_REQUEST_TIMEOUT='1',
+            HTTP_CACHE_CONTROL='no-cache',
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert http_mock.call_count == 1
+    assert resp.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert resp.json()['errors'][0]['code'] == (
+        ErrorResponseCodes.lms_rate_limited.value
+    )
+    assert int(resp['Retry-After']) > 1
+
+
+def test_courses_cached_per_credentials():
+    mocked_lms_base_url = 'http://cached-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE)
+    other_user_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+    other_user_headers['HTTP_LMS_OAUTH_TOKEN'] = 'someone-else'
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, json={'site_collection': []})
+        for _ in range(2):
+            resp = client.get(
+                reverse('courses'),
+                **fixtures.get_mocked_headers(mocked_lms_base_url)
+            )
+            assert resp.status_code == status.HTTP_200_OK
+        assert http_mock.call_count == 1
+
+        # Other credentials never see what was cached for these.
+        client.get(reverse('courses'), **other_user_headers)
+        assert http_mock.call_count == 2
+
+
+def test_no_cache_skips_cached_courses():
+    mocked_lms_base_url = 'http://no-cache-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE)
+    client = Client()
+    course_site = {
+        'id': 'course-id',
+        'title': 'New course',
+        'sitePages': [{'title': 'Gradebook'}],
+    }
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, [
+            {'json': {'site_collection': []}},
+            {'json': {'site_collection': [course_site]}},
+        ])
+        client.get(
+            reverse('courses'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+        resp = client.get(
+            reverse('courses'),
+            HTTP_CACHE_CONTROL='no-cache',
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+        assert resp.json()['results'] == [
+            {'course_id': 'course-id', 'title': 'New course'},
+        ]
+
+        # The fresh answer replaced the cached one.
+        resp = client.get(
+            reverse('courses'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert http_mock.call_count == 2
+    assert len(resp.json()['results']) == 1
+
+
+@override_settings(LMS_SHARED_CACHE_ENABLED=True)
+def test_courses_shared_between_containers():
+    mocked_lms_base_url = 'http://shared-cache-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE)
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, json={'site_collection': []})
+        client.get(
+            reverse('courses'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+        # As if the next request landed on another container.
+        read_cache.local.clear()
+        resp = client.get(
+            reverse('courses'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert http_mock.call_count == 1
+
+
+class InlineExecutor:
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+def _seed_courses_cache(lms_base_url, site_collection, age):
+    creds_envelope = CredsEnvelope.from_request_meta(
+        fixtures.get_mocked_headers(lms_base_url),
+        required_headers=[],
+    )
+    cache_key = (
+        lms_base_url,
+        sakai.COURSES_PAGE_RESOURCE.format(
+            start=0,
+            limit=settings.LMS_SAKAI_SITES_PAGE_SIZE,
+        ),
+        creds_envelope.identity,
+    )
+    read_cache.local.set(
+        cache_key,
+        {'site_collection': site_collection},
+        ttl=300,
+        grace=300,
+        stored_at=time.time() - age,
+    )
+    return cache_key
+
+
+@patch('lms_connector.connectors.abstract.get_background_executor')
+def test_stale_courses_served_and_refreshed(executor_mock):
+    executor_mock.return_value = InlineExecutor()
+    mocked_lms_base_url = 'http://stale-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE)
+    _seed_courses_cache(mocked_lms_base_url, [], age=400)
+    course_site = {
+        'id': 'course-id',
+        'title': 'New course',
+        'sitePages': [{'title': 'Gradebook'}],
+    }
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, json={'site_collection': [course_site]})
+        stale_resp = client.get(
+            reverse('courses'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+        fresh_resp = client.get(
+            reverse('courses'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert stale_resp.json()['results'] == []
+    assert stale_resp['LMS-Cache'] == 'stale'
+    assert int(stale_resp['Age']) >= 400
+    # The stale entry was refreshed in the background.
+    assert http_mock.call_count == 1
+    assert len(fresh_resp.json()['results']) == 1
+    assert fresh_resp['LMS-Cache'] == 'hit'
+    assert int(fresh_resp['Age']) < 400
+
+
+def test_stale_courses_refreshed_once():
+    mocked_lms_base_url = 'http://stale-refreshing-lms'
+    cache_key = _seed_courses_cache(mocked_lms_base_url, [], age=400)
+    # As if another request was already refreshing it.
+    assert read_cache.start_refresh(cache_key)
+    client = Client()
+    try:
+        with requests_mock.Mocker() as http_mock:
+            resp = client.get(
+                reverse('courses'),
+                **fixtures.get_mocked_headers(mocked_lms_base_url)
+            )
+    finally:
+        read_cache.end_refresh(cache_key)
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp['LMS-Cache'] == 'stale'
+    assert http_mock.call_count == 0
+
+
+def test_courses_past_grace_are_fetched():
+    mocked_lms_base_url = 'http://expired-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE)
+    _seed_courses_cache(mocked_lms_base_url, [], age=600)
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, json={'site_collection': []})
+        resp = client.get(
+            reverse('courses'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert http_mock.call_count == 1
+    assert resp['LMS-Cache'] == 'miss'
+    assert 'Age' not in resp
+
+
+def _assignment_response(name):
+    assignment_response = dict(fixtures.sakai_post_grade_response)
+    assignment_response['name'] = name
+    return assignment_response
+
+
+def test_grade_post_invalidates_cached_assignment_for_everyone():
+    mocked_lms_base_url = 'http://invalidated-lms'
+    assignment_url = urljoin(
+        mocked_lms_base_url,
+        sakai.ASSIGNMENT_RESOURCE.format(
+            lms_course_id='course',
+            lms_assignment_id='assignment',
+        ),
+    )
+    scores_url = urljoin(
+        mocked_lms_base_url,
+        sakai.SCORES_RESOURCE.format(lms_course_id='course'),
+    )
+    assignment_path = reverse('assignments', kwargs={
+        'lms_course_id': 'course',
+        'lms_assignment_id': 'assignment',
+    })
+    grades_path = reverse('grades', kwargs={
+        'lms_course_id': 'course',
+        'lms_assignment_id': 'assignment',
+    })
+    other_user_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+    other_user_headers['HTTP_LMS_OAUTH_TOKEN'] = 'someone-else'
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            assignment_url,
+            json=fixtures.sakai_get_assignment_response,
+        )
+        http_mock.post(scores_url, json=_assignment_response('assignment'))
+        client.get(assignment_path, **other_user_headers)
+        client.get(assignment_path, **other_user_headers)
+        assert http_mock.call_count == 1
+
+        client.post(
+            grades_path,
+            content_type='application/json',
+            data=fixtures.sakai_post_grade_data,
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+        resp = client.get(assignment_path, **other_user_headers)
+
+    assert resp['LMS-Cache'] == 'miss'
+    assert [request.method for request in http_mock.request_history] == [
+        'GET',
+        'POST',
+        'GET',
+    ]
+
+
+def test_assignment_post_seeds_cache():
+    mocked_lms_base_url = 'http://seeded-lms'
+    scores_url = urljoin(
+        mocked_lms_base_url,
+        sakai.SCORES_RESOURCE.format(lms_course_id='course'),
+    )
+    assignment_path = reverse('assignments', kwargs={
+        'lms_course_id': 'course',
+        'lms_assignment_id': 'assignment',
+    })
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.post(scores_url, json=_assignment_response('assignment'))
+        client.post(
+            assignment_path,
+            content_type='application/json',
+            data=fixtures.sakai_post_assignment_data,
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+        resp = client.get(
+            assignment_path,
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    # Only the POST reached Sakai.
+    assert http_mock.call_count == 1
+    assert resp['LMS-Cache'] == 'hit'
+    assert resp.json()['result'] == {
+        'title': 'assignment',
+        'max_grade': fixtures.sakai_post_grade_response['pointsPossible'],
+    }
+    cached_assignment = read_cache.get((
+        mocked_lms_base_url,
+        sakai.ASSIGNMENT_RESOURCE.format(
+            lms_course_id='course',
+            lms_assignment_id='assignment',
+        ),
+        CredsEnvelope.from_request_meta(
+            fixtures.get_mocked_headers(mocked_lms_base_url),
+            required_headers=[],
+        ).identity,
+    ))
+    # The scores the POST was answered with are not cached.
+    assert set(cached_assignment) == {'id', 'name', 'pointsPossible'}
+
+
+def test_if_none_match_not_modified():
+    mocked_lms_base_url = 'http://etag-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE)
+    mocked_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, json={'site_collection': []})
+        resp = client.get(reverse('courses'), **mocked_headers)
+        etag = resp['ETag']
+
+        not_modified = client.get(
+            reverse('courses'),
+            HTTP_IF_NONE_MATCH=f'"other", W/{etag}',
+            **mocked_headers
+        )
+        modified = client.get(
+            reverse('courses'),
+            HTTP_IF_NONE_MATCH='"other"',
+            **mocked_headers
+        )
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+    assert not_modified.content == b''
+    assert not_modified['ETag'] == etag
+    assert modified.status_code == status.HTTP_200_OK
+    assert modified['ETag'] == etag
+    assert modified.json() == resp.json()
+
+
+def test_cache_policy_per_view():
+    mocked_lms_base_url = 'http://edge-lms'
+    mocked_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+    assignment_url = urljoin(
+        mocked_lms_base_url,
+        sakai.ASSIGNMENT_RESOURCE.format(
+            lms_course_id='course',
+            lms_assignment_id='assignment',
+        ),
+    )
+    scores_url = urljoin(
+        mocked_lms_base_url,
+        sakai.SCORES_RESOURCE.format(lms_course_id='course'),
+    )
+    grades_path = reverse('grades', kwargs={
+        'lms_course_id': 'course',
+        'lms_assignment_id': 'assignment',
+    })
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE),
+            json={'site_collection': []},
+        )
+        http_mock.get(
+            assignment_url,
+            json=fixtures.sakai_get_assignment_response,
+        )
+        http_mock.post(scores_url, json=_assignment_response('assignment'))
+        courses_resp = client.get(reverse('courses'), **mocked_headers)
+        assignment_resp = client.get(
+            reverse('assignments', kwargs={
+                'lms_course_id': 'course',
+                'lms_assignment_id': 'assignment',
+            }),
+            **mocked_headers
+        )
+        grades_resp = client.post(
+            grades_path,
+            content_type='application/json',
+            data=fixtures.sakai_post_grade_data,
+            **mocked_headers
+        )
+
+    assert courses_resp['Cache-Control'] == 'max-age=60'
+    assert assignment_resp['Cache-Control'] == 'max-age=300'
+    assert grades_resp['Cache-Control'] == 'no-store'
+    assert 'ETag' not in grades_resp
+    fingerprint = CredsEnvelope.from_request_meta(
+        mocked_headers,
+        [],
+    ).fingerprint
+    for resp in (courses_resp, assignment_resp, grades_resp):
+        assert 'LMS-OAUTH-TOKEN' in resp['Vary']
+        assert resp['LMS-Credential-Fingerprint'] == fingerprint
+
+
+def test_error_not_cacheable():
+    mocked_lms_base_url = 'http://edge-error-lms'
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE),
+            status_code=status.HTTP_404_NOT_FOUND,
+            json={},
+        )
+        resp = Client().get(
+            reverse('courses'),
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert resp.status_code != status.HTTP_200_OK
+    assert resp['Cache-Control'] == 'no-store'
+
+
+def test_revalidated_with_upstream_validators():
+    mocked_lms_base_url = 'http://validating-lms'
+    mocked_url = urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE)
+    mocked_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+    site_collection = [{
+        'id': 'site',
+        'title': 'Site',
+        'sitePages': [{'title': 'Gradebook'}],
+    }]
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, [
+            {
+                'json': {'site_collection': site_collection},
+                'headers': {'ETag': '"sites-v1"'},
+            },
+            {
+                'status_code': status.HTTP_304_NOT_MODIFIED,
+                'headers': {'ETag': '"sites-v1"'},
+            },
+        ])
+        resp = client.get(reverse('courses'), **mocked_headers)
+        revalidated_resp = client.get(
+            reverse('courses'),
+            HTTP_CACHE_CONTROL='no-cache',
+            **mocked_headers
+        )
+
+    assert http_mock.call_count == 2
+    assert 'If-None-Match' not in http_mock.request_history[0].headers
+    # OAuth1 signing turns the headers to bytes.
+    assert http_mock.request_history[1].headers['If-None-Match'] in (
+        '"sites-v1"',
+        b'"sites-v1"',
+    )
+    assert revalidated_resp.status_code == status.HTTP_200_OK
+    assert revalidated_resp.json() == resp.json()
+    assert resp.json()['results'] == [{'course_id': 'site', 'title': 'Site'}]
+
+
+def test_assignment_existence():
+    mocked_lms_base_url = 'http://existence-lms'
+    mocked_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+
+    def assignment_url(lms_assignment_id):
+        return urljoin(
+            mocked_lms_base_url,
+            sakai.ASSIGNMENT_RESOURCE.format(
+                lms_course_id='course',
+                lms_assignment_id=lms_assignment_id,
+            ),
+        )
+
+    existence_path = (
+        reverse('assignment_existence', kwargs={'lms_course_id': 'course'}) +
+        '?lms_assignment_id=found&lms_assignment_id=missing'
+        '&lms_assignment_id=broken'
+    )
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            assignment_url('found'),
+            json=fixtures.sakai_get_assignment_response,
+        )
+        http_mock.get(
+            assignment_url('missing'),
+            status_code=status.HTTP_404_NOT_FOUND,
+            text='<html>Not Found</html>',
+        )
+        http_mock.get(
+            assignment_url('broken'),
+            status_code=status.HTTP_403_FORBIDDEN,
+            text='<html>Forbidden</html>',
+        )
+        http_mock.post(
+            urljoin(
+                mocked_lms_base_url,
+                sakai.SCORES_RESOURCE.format(lms_course_id='course'),
+            ),
+            json=_assignment_response('other'),
+        )
+        resp = client.get(existence_path, **mocked_headers)
+        assert http_mock.call_count == 3
+        # Found and missing are both cached, the error is not.
+        client.get(existence_path, **mocked_headers)
+        assert http_mock.call_count == 4
+        # Creating the missing assignment drops its cached miss.
+        client.post(
+            reverse('assignments', kwargs={
+                'lms_course_id': 'course',
+                'lms_assignment_id': 'missing',
+            }),
+            content_type='application/json',
+            data=fixtures.sakai_post_assignment_data,
+            **mocked_headers
+        )
+        client.get(existence_path, **mocked_headers)
+
+    assert sorted(
+        request.url for request in http_mock.request_history[5:]
+    ) == sorted([assignment_url('missing'), assignment_url('broken')])
+    assert resp.status_code == status.HTTP_200_OK
+    found, missing, broken = resp.json()['results']
+    assert found == {
+        'lms_assignment_id': 'found',
+        'status': 'found',
+        'assignment': {
+            'title': fixtures.sakai_get_assignment_response['name'],
+            'max_grade': (
+                fixtures.sakai_get_assignment_response['pointsPossible']
+            ),
+        },
+        'errors': [],
+    }
+    assert missing == {
+        'lms_assignment_id': 'missing',
+        'status': 'missing',
+        'assignment': None,
+        'errors': [],
+    }
+    assert broken['status'] == 'error'
+    assert broken['errors'][0]['code'] == 'bad_thirdparty_request'
+
+
+def test_assignment_existence_needs_ids():
+    resp = Client().get(
+        reverse('assignment_existence', kwargs={'lms_course_id': 'course'}),
+        **fixtures.get_mocked_headers('http://existence-lms')
+    )
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    assert resp.json()['errors'][0]['code'] == 'bad_request_parameters'
+
+
+def test_current_user_memoized_until_credentials_refused():
+    mocked_lms_base_url = 'http://memoized-user-lms'
+    mocked_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+    current_user_url = urljoin(
+        mocked_lms_base_url,
+        sakai.CURRENT_USER_RESOURCE,
+    )
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(current_user_url, json=fixtures.current_user_response)
+        http_mock.get(
+            urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE),
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            json={},
+        )
+        resp = client.get(reverse('current_user'), **mocked_headers)
+        memoized_resp = client.get(reverse('current_user'), **mocked_headers)
+        assert http_mock.call_count == 1
+
+        # Sakai refusing the credentials for any call drops the user.
+        client.get(reverse('courses'), **mocked_headers)
+        refetched_resp = client.get(reverse('current_user'), **mocked_headers)
+
+    assert http_mock.call_count == 3
+    assert memoized_resp['LMS-Cache'] == 'hit'
+    assert refetched_resp['LMS-Cache'] == 'miss'
+    assert memoized_resp.json() == resp.json() == refetched_resp.json()
+    # Only the projected user is kept.
+    cache_entry = read_cache.get_entry((
+        mocked_lms_base_url,
+        sakai.CURRENT_USER_RESOURCE,
+        CredsEnvelope.from_request_meta(mocked_headers, []).identity,
+    ))
+    assert cache_entry.value == resp.json()['result']
+
+
+def test_paginated_courses():
+    mocked_lms_base_url = 'http://paginated-lms'
+    mocked_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+    site_collection = [
+        {
+            'id': f'site{number}',
+            'title': f'Site {number}',
+            'sitePages': [{'title': 'Gradebook'}],
+        }
+        for number in (3, 1, 4, 2, 5)
+    ]
+    client = Client()
+    pages = []
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE),
+            json={'site_collection': site_collection},
+        )
+        resp = client.get(reverse('courses'), {'limit': 2}, **mocked_headers)
+        pages.append(resp.json())
+        while resp.json()['next']:
+            resp = client.get(
+                reverse('courses'),
+                {'limit': 2, 'cursor': resp.json()['next']},
+                **mocked_headers
+            )
+            pages.append(resp.json())
+        bad_cursor_resp = client.get(
+            reverse('course_enrollments', kwargs={'lms_course_id': 'site1'}),
+            {'cursor': pages[0]['next']},
+            **mocked_headers
+        )
+
+    # Every page was cut from the one call to Sakai.
+    assert http_mock.call_count == 1
+    assert [
+        [course['course_id'] for course in page['results']]
+        for page in pages
+    ] == [['site1', 'site2'], ['site3', 'site4'], ['site5']]
+    assert pages[-1]['next'] is None
+    # Cursors only work where they were returned.
+    assert bad_cursor_resp.status_code == status.HTTP_400_BAD_REQUEST
+    assert bad_cursor_resp.json()['errors'][0]['code'] == (
+        'bad_request_parameters'
+    )
+
+
+def test_paged_courses_revalidated_later():
+    mocked_lms_base_url = 'http://revalidated-page-lms'
+    mocked_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+    site_collection = [
+        {
+            'id': f'site{number}',
+            'title': f'Site {number}',
+            'sitePages': [{'title': 'Gradebook'}],
+        }
+        for number in range(3)
+    ]
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE),
+            json={'site_collection': site_collection},
+        )
+        resp = client.get(reverse('courses'), {'limit': 2}, **mocked_headers)
+        with patch('time.time', return_value=time.time() + 5):
+            later_resp = client.get(
+                reverse('courses'),
+                {'limit': 2},
+                HTTP_IF_NONE_MATCH=resp['ETag'],
+                **mocked_headers
+            )
+
+    assert resp.json()['next']
+    # The cursor, and so the ETag, does not change over time.
+    assert later_resp.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def test_limit_out_of_range():
+    resp = Client().get(
+        reverse('courses'),
+        {'limit': 0},
+        **fixtures.get_mocked_headers('http://paginated-lms')
+    )
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_courses_streamed_as_ndjson():
+    mocked_lms_base_url = 'http://ndjson-lms'
+    mocked_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+    site_collection = [
+        {
+            'id': f'site{number}',
+            'title': f'Site {number}',
+            'sitePages': [{'title': 'Gradebook'}],
+        }
+        for number in (2, 1, 3)
+    ]
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE),
+            json={'site_collection': site_collection},
+        )
+        resp = client.get(
+            reverse('courses'),
+            HTTP_ACCEPT='application/x-ndjson',
+            **mocked_headers
+        )
+        lines = list(resp.streaming_content)
+        page_resp = client.get(
+            reverse('courses'),
+            {'limit': 2},
+            HTTP_ACCEPT='application/x-ndjson',
+            **mocked_headers
+        )
+        page_lines = list(page_resp.streaming_content)
+        json_resp = client.get(reverse('courses'), **mocked_headers)
+
+    assert resp['Content-Type'] == 'application/x-ndjson'
+    assert 'Accept' in resp['Vary']
+    assert [json.loads(line)['course_id'] for line in lines] == [
+        'site2',
+        'site1',
+        'site3',
+    ]
+    assert [json.loads(line)['course_id'] for line in page_lines] == [
+        'site1',
+        'site2',
+    ]
+    assert page_resp['LMS-Next-Cursor']
+    assert json_resp['Content-Type'] == 'application/json'
+    assert 'Accept' in json_resp['Vary']
+    assert len(json_resp.json()['results']) == 3
+
+
+def test_ndjson_error_is_one_line():
+    headers = fixtures.get_mocked_headers('http://ndjson-lms')
+    del headers['HTTP_LMS_BASE_URL']
+    resp = Client().get(
+        reverse('courses'),
+        HTTP_ACCEPT='application/x-ndjson',
+        **headers
+    )
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    assert resp.content.count(b'\n') == 1
+    assert json.loads(resp.content)['errors']
+
+
+@pytest.mark.parametrize('sakai_error', [
+    {'json': {'error': 'Sakai is down'}},
+    {'text': fixtures.sample_html_error_message_page},
+])
+def test_ndjson_courses_when_sakai_fails(sakai_error):
+    mocked_lms_base_url = 'http://failing-ndjson-lms'
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(mocked_lms_base_url, sakai.COURSES_RESOURCE),
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            **sakai_error
+        )
+        resp = Client().get(
+            reverse('courses'),
+            HTTP_ACCEPT='application/x-ndjson',
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    # An error response, not a 200 stream ending in an error.
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    error, = json.loads(resp.content)['errors']
+    assert error['code'] == ErrorResponseCodes.bad_thirdparty_request.value
+    assert error['status'] == status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+@pytest.mark.parametrize('sakai_response', [
+    {'status_code': status.HTTP_403_FORBIDDEN, 'json': {'error': 'No'}},
+    {'status_code': status.HTTP_200_OK, 'json': {'unexpected': []}},
+])
+def test_ndjson_enrollments_when_sakai_fails(sakai_response):
+    mocked_lms_base_url = 'http://failing-roster-lms'
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(
+                mocked_lms_base_url,
+                sakai.STUDENTS_RESOURCE.format(lms_course_id='course'),
+            ),
+            **sakai_response
+        )
+        resp = Client().get(
+            reverse('course_enrollments', kwargs={'lms_course_id': 'course'}),
+            HTTP_ACCEPT='application/x-ndjson',
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    error, = json.loads(resp.content)['errors']
+    assert error['code'] == ErrorResponseCodes.bad_thirdparty_request.value
+
+
+def _sakai_student(student_id):
+    return {
+        'userId': student_id,
+        'email': f'{student_id}@example.com',
+        'fname': 'First',
+        'lname': 'Last',
+        'username': student_id,
+    }
+
+
+def test_enrollments_with_fields():
+    mocked_lms_base_url = 'http://sparse-lms'
+    mocked_headers = fixtures.get_mocked_headers(mocked_lms_base_url)
+    mocked_url = urljoin(
+        mocked_lms_base_url,
+        sakai.STUDENTS_RESOURCE.format(lms_course_id='course'),
+    )
+    client = Client()
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(mocked_url, json={'grades_collection': [
+            _sakai_student('student2'),
+            _sakai_student('student1'),
+        ]})
+        resp = client.get(
+            reverse('course_enrollments', kwargs={'lms_course_id': 'course'}),
+            {'fields': 'email, student_id', 'limit': 1},
+            **mocked_headers
+        )
+        page_resp = client.get(
+            reverse('course_enrollments', kwargs={'lms_course_id': 'course'}),
+            {'fields': 'email', 'cursor': resp.json()['next']},
+            **mocked_headers
+        )
+        ndjson_resp = client.get(
+            reverse('course_enrollments', kwargs={'lms_course_id': 'course'}),
+            {'fields': 'student_id'},
+            HTTP_ACCEPT='application/x-ndjson',
+            **mocked_headers
+        )
+        lines = list(ndjson_resp.streaming_content)
+
+    assert resp.status_code == status.HTTP_200_OK
+    assert resp.json()['results'] == [
+        {'student_id': 'student1', 'email': 'student1@example.com'},
+    ]
+    # Cursors do not depend on the fields asked for.
+    assert page_resp.json()['results'] == [{'email': 'student2@example.com'}]
+    assert [json.loads(line) for line in lines] == [
+        {'student_id': 'student2'},
+        {'student_id': 'student1'},
+    ]
+
+
+def test_current_user_with_fields():
+    mocked_lms_base_url = 'http://sparse-user-lms'
+    with requests_mock.Mocker() as http_mock:
+        http_mock.get(
+            urljoin(mocked_lms_base_url, sakai.CURRENT_USER_RESOURCE),
+            json=fixtures.current_user_response,
+        )
+        resp = Client().get(
+            reverse('current_user'),
+            {'fields': 'lms_user_id'},
+            **fixtures.get_mocked_headers(mocked_lms_base_url)
+        )
+
+    assert resp.json()['result'] == {
+        'lms_user_id': fixtures.current_user_response['id'],
+    }
+
+
+@pytest.mark.parametrize('fields', ['course_id,grade', '', ' , '])
+def test_unknown_fields(fields):
+    with requests_mock.Mocker() as http_mock:
+        resp = Client().get(
+            reverse('courses'),
+            {'fields': fields},
+            **fixtures.get_mocked_headers('http://sparse-lms')
+        )
+
+    assert http_mock.call_count == 0
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    error = resp.json()['errors'][0]
+    assert error['code'] == ErrorResponseCodes.bad_request_parameters.value
+    assert 'course_id, title' in error['detail']
+
+
+def test_nested_fields_refused():
+    with requests_mock.Mocker() as http_mock:
+        resp = Client().get(
+            reverse(
+                'assignments',
+                kwargs={'lms_course_id': 'course', 'lms_assignment_id': 'a'},
+            ),
+            {'fields': 'title,grades.grade'},
+            **fixtures.get_mocked_headers('http://sparse-lms')
+        )
+
+    assert http_mock.call_count == 0
+    assert resp.status_code == status.HTTP_400_BAD_REQUEST
+    error = resp.json()['errors'][0]
+    assert error['code'] == ErrorResponseCodes.bad_request_parameters.value
+    assert 'grades.grade' in error['detail']
+    assert 'nested' in error['detail']
@@ -41,6 +41,11 @@ urlpatterns = [
         views.EnrollmentsView.as_view(),
         name='course_enrollments',
     ),
+    path(
+        'courses/<str:lms_course_id>/assignments',
+        views.AssignmentExistenceView.as_view(),
+        name='assignment_existence',
+    ),
     path(
         'courses/<str:lms_course_id>'
         '/assignments/<str:lms_assignment_id>',
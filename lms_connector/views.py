@@ -1,28 +1,160 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags
 from rest_framework.response import Response
 from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework import status
 from lms_connector.responses import (
+    ErrorLCResponse,
+    ErrorResponseCodes,
+    ErrorResponseDetails,
+    FormattedError,
+    LCResponse,
     MultiLCResponse,
     SingleLCResponse,
 )
+from typing import Dict, Iterator, List, Optional, Tuple
 from urllib.parse import unquote
-from lms_connector.entities import Grade
+from lms_connector.entities import (
+    Assignment,
+    AssignmentExistence,
+    Course,
+    Grade,
+    LMSUser,
+    Student,
+)
 
 from lms_connector.connectors.abstract import AbstractLMSConnector
+from lms_connector.connectors.creds_envelope import (
+    AUTH_REQUIRED_HEADERS,
+    CREDENTIAL_HEADER_NAMES,
+    DEFAULT_REQUIRED_HEADERS,
+    CredsEnvelope,
+)
+from lms_connector.fields import get_fields, project, project_all
+from lms_connector.pagination import (
+    NEXT_CURSOR_HEADER,
+    PageRequest,
+    get_page_request,
+    paginate,
+)
+from lms_connector.permissions import API_KEY_HEADER_NAME
+from lms_connector.renderers import (
+    NDJSON_MEDIA_TYPE,
+    NDJSONRenderer,
+    json_lines,
+)
 
 
 def connector(request: Request) -> AbstractLMSConnector:
-    return AbstractLMSConnector.get_connector_from_request(request)
+    """
+    Get the connector for this request, it is created once per request.
+    """
+    if getattr(request, 'lms_connector', None) is None:
+        request.lms_connector = (
+            AbstractLMSConnector.get_connector_from_request(
+                request,
+                getattr(request, 'creds_envelope', None),
+            )
+        )
+    return request.lms_connector
+
+
+class ConnectorView(APIView):
+    """
+    Base for views which talk to an LMS through a connector.
+
+    The credentials are read from the headers, and checked against
+    required_headers, once before the handler runs.
+    """
+    required_headers = DEFAULT_REQUIRED_HEADERS
+
+    def initial(self, request, *args, **kwargs):
+        super(ConnectorView, self).initial(request, *args, **kwargs)
+        request.creds_envelope = CredsEnvelope.from_request_meta(
+            request.META,
+            self.required_headers,
+        )
 
+    def get_cache_max_age(self) -> Optional[int]:
+        """
+        Seconds caches between us and the client may keep successful
+        reads of this view for, None if they must not.
+        """
+        return None
 
-class AuthUrlView(APIView):
-    required_headers = [
-        'HTTP_LMS_TYPE',
-        'HTTP_LMS_BASE_URL',
-        'HTTP_LMS_CLIENT_KEY',
-        'HTTP_LMS_CLIENT_SECRET',
-    ]
+    def get_vary_headers(self) -> Tuple[str, ...]:
+        """
+        The request headers responses of this view depend on.
+        """
+        return (API_KEY_HEADER_NAME,) + CREDENTIAL_HEADER_NAMES
+
+    @staticmethod
+    def _is_read(request, response: LCResponse) -> bool:
+        return (
+            request.method in ('GET', 'HEAD') and
+            response.status_code == status.HTTP_200_OK and
+            not isinstance(response, ErrorLCResponse)
+        )
+
+    def _set_cache_policy(self, request, response: LCResponse) -> None:
+        max_age = None
+        if self._is_read(request, response):
+            max_age = self.get_cache_max_age()
+        creds_envelope = getattr(request, 'creds_envelope', None)
+        response.set_cache_policy(
+            max_age,
+            vary=self.get_vary_headers(),
+            fingerprint=(
+                creds_envelope.fingerprint if creds_envelope else None
+            ),
+        )
+
+    @staticmethod
+    def _set_etag(request, response: LCResponse) -> None:
+        """
+        Render the read, its ETag is over the body that is sent, and answer
+        with a 304 when the client already has it.
+        """
+        response.render()
+        response['ETag'] = response.etag
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if not if_none_match:
+            return
+        # If-None-Match uses the weak comparison.
+        client_etags = [
+            etag[2:] if etag.startswith('W/') else etag
+            for etag in parse_etags(if_none_match)
+        ]
+        if '*' in client_etags or response['ETag'] in client_etags:
+            response.not_modified()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if isinstance(response, LCResponse):
+            self._set_cache_policy(request, response)
+        response = super(ConnectorView, self).finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (
+            isinstance(response, LCResponse) and
+            self._is_read(request, response)
+        ):
+            self._set_etag(request, response)
+        lms_connector = getattr(request, 'lms_connector', None)
+        if lms_connector is not None:
+            for header, value in lms_connector.upstream_headers.items():
+                response[header] = value
+            # Picked up by the CloudWatch middleware.
+            response.rate_limit_queue_depths = (
+                lms_connector.rate_limit_queue_depths
+            )
+        return response
+
+
+class AuthUrlView(ConnectorView):
+    required_headers = AUTH_REQUIRED_HEADERS
 
     def get(self, request):
         auth_url_payload = connector(request).get_auth_url(
@@ -33,46 +165,158 @@ class AuthUrlView(APIView):
         return Response(auth_url_payload)
 
 
-class CurrentUserView(APIView):
+class CurrentUserView(ConnectorView):
+    def get_cache_max_age(self):
+        return settings.LMS_EDGE_MAX_AGE_CURRENT_USER
+
     def get(self, request):
+        fields = get_fields(request, LMSUser)
         return SingleLCResponse(
             status_code=status.HTTP_200_OK,
-            result=connector(request).get_current_user_info(),
+            result=project(connector(request).get_current_user_info(), fields),
         )
 
 
-class CoursesView(APIView):
-    def get(self, request):
-        courses = connector(request).list_courses()
+def paginated_response(
+    results: List[Dict],
+    key: str,
+    page_request: Optional[PageRequest],
+    fields: Optional[Tuple[str, ...]] = None,
+) -> MultiLCResponse:
+    """
+    A response with the page of results asked for, ordered by key, or with
+    every result if no page was.
+
+    :param fields: of the results to return, see get_fields(). Results are
+        paged by every field, so cursors work whatever the fields.
+    """
+    if page_request is None:
         return MultiLCResponse(
             status_code=status.HTTP_200_OK,
-            results=courses,
+            results=list(project_all(results, fields)),
+        )
+    page = paginate(results, key, page_request)
+    response = MultiLCResponse(
+        status_code=status.HTTP_200_OK,
+        results=list(project_all(page.results, fields)),
+    )
+    response.set_next_cursor(page.next_cursor)
+    return response
+
+
+class NDJSONMixin:
+    """
+    For views whose results can be streamed to clients which Accept
+    application/x-ndjson, one entity per line, without the results ever
+    being held in a list or rendered into one buffer.
+
+    Only servers which stream responses, e.x. gunicorn in a container, send
+    lines as they are made. API Gateway buffers the whole response.
+    """
+    renderer_classes = (
+        list(api_settings.DEFAULT_RENDERER_CLASSES) + [NDJSONRenderer]
+    )
+
+    def get_vary_headers(self) -> Tuple[str, ...]:
+        return super(NDJSONMixin, self).get_vary_headers() + ('Accept',)
+
+    @staticmethod
+    def wants_ndjson(request: Request) -> bool:
+        return isinstance(
+            getattr(request, 'accepted_renderer', None),
+            NDJSONRenderer,
+        )
+
+    def ndjson_response(
+        self,
+        request: Request,
+        entities: Iterator[Dict],
+        key: str,
+        page_request: Optional[PageRequest],
+        fields: Optional[Tuple[str, ...]] = None,
+    ) -> StreamingHttpResponse:
+        """
+        :param entities: sorted into a page first when one is asked for,
+            the next cursor is then sent in the LMS-Next-Cursor header.
+        :param fields: see paginated_response()
+        """
+        next_cursor = None
+        if page_request is not None:
+            page = paginate(list(entities), key, page_request)
+            entities, next_cursor = iter(page.results), page.next_cursor
+        response = StreamingHttpResponse(
+            json_lines(project_all(entities, fields), source=request.path),
+            content_type=NDJSON_MEDIA_TYPE,
         )
+        if next_cursor is not None:
+            response[NEXT_CURSOR_HEADER] = next_cursor
+        response['Cache-Control'] = 'no-store'
+        response['Vary'] = ', '.join(self.get_vary_headers())
+        return response
+
+
+class CoursesView(NDJSONMixin, ConnectorView):
+    def get_cache_max_age(self):
+        return settings.LMS_EDGE_MAX_AGE_COURSES
+
+    def get(self, request):
+        page_request = get_page_request(request)
+        fields = get_fields(request, Course)
+        if self.wants_ndjson(request):
+            return self.ndjson_response(
+                request,
+                connector(request).iter_courses(),
+                'course_id',
+                page_request,
+                fields,
+            )
+        courses = connector(request).list_courses()
+        return paginated_response(courses, 'course_id', page_request, fields)
 
 
-class EnrollmentsView(APIView):
+class EnrollmentsView(NDJSONMixin, ConnectorView):
+    def get_cache_max_age(self):
+        return settings.LMS_EDGE_MAX_AGE_STUDENTS
+
     def get(self, request, lms_course_id: str):
+        page_request = get_page_request(request)
+        fields = get_fields(request, Student)
+        if self.wants_ndjson(request):
+            return self.ndjson_response(
+                request,
+                connector(request).iter_students_in_course(lms_course_id),
+                'student_id',
+                page_request,
+                fields,
+            )
         students = connector(request).list_students_in_course(lms_course_id)
-        return MultiLCResponse(
-            status_code=status.HTTP_200_OK,
-            results=students,
+        return paginated_response(
+            students,
+            'student_id',
+            page_request,
+            fields,
         )
 
 
-class AssignmentView(APIView):
+class AssignmentView(ConnectorView):
+    def get_cache_max_age(self):
+        return settings.LMS_EDGE_MAX_AGE_ASSIGNMENT
+
     def get(self, request, lms_course_id: str, lms_assignment_id: str):
         lms_assignment_id = unquote(lms_assignment_id)
+        fields = get_fields(request, Assignment)
         lms_column = connector(request).get_assignment(
             lms_course_id=lms_course_id,
             lms_assignment_id=lms_assignment_id,
         )
         return SingleLCResponse(
             status_code=status.HTTP_200_OK,
-            result=lms_column,
+            result=project(lms_column, fields),
         )
 
     def post(self, request, lms_course_id: str, lms_assignment_id: str):
         lms_assignment_id = unquote(lms_assignment_id)
+        fields = get_fields(request, Assignment)
         assignment = connector(request).post_assignment(
             lms_course_id=lms_course_id,
             lms_assignment_id=lms_assignment_id,
@@ -81,11 +325,12 @@ class AssignmentView(APIView):
         )
         return SingleLCResponse(
             status_code=status.HTTP_200_OK,
-            result=assignment,
+            result=project(assignment, fields),
         )
 
     def put(self, request, lms_course_id: str, lms_assignment_id: str):
         lms_assignment_id = unquote(lms_assignment_id)
+        fields = get_fields(request, Assignment)
         assignment = connector(request).update_assignment(
             lms_course_id=lms_course_id,
             lms_assignment_id=lms_assignment_id,
@@ -94,13 +339,45 @@ class AssignmentView(APIView):
         )
         return SingleLCResponse(
             status_code=status.HTTP_200_OK,
-            result=assignment,
+            result=project(assignment, fields),
+        )
+
+
+class AssignmentExistenceView(ConnectorView):
+    def get(self, request, lms_course_id: str):
+        """
+        Whether each of the lms_assignment_id query parameters is an
+        assignment of the course, found, missing or error.
+        """
+        lms_assignment_ids = request.GET.getlist('lms_assignment_id')
+        fields = get_fields(request, AssignmentExistence)
+        max_ids = settings.LMS_ASSIGNMENT_EXISTENCE_MAX_IDS
+        if not lms_assignment_ids or len(lms_assignment_ids) > max_ids:
+            raise ErrorLCResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                errors=[FormattedError(
+                    source=request.path,
+                    code=ErrorResponseCodes.bad_request_parameters,
+                    detail=ErrorResponseDetails.bad_ids_count(
+                        'lms_assignment_id',
+                        max_ids,
+                    ),
+                )],
+            )
+        existences = connector(request).check_assignments_exist(
+            lms_course_id=lms_course_id,
+            lms_assignment_ids=lms_assignment_ids,
+        )
+        return MultiLCResponse(
+            status_code=status.HTTP_200_OK,
+            results=list(project_all(existences, fields)),
         )
 
 
-class GradesView(APIView):
+class GradesView(ConnectorView):
     def post(self, request, lms_course_id: str, lms_assignment_id: str):
         lms_assignment_id = unquote(lms_assignment_id)
+        fields = get_fields(request, Assignment)
         grades = []
         for grade_info in request.data['grades']:
             grades.append(Grade(
@@ -117,7 +394,7 @@ class GradesView(APIView):
         )
         return SingleLCResponse(
             status_code=status.HTTP_200_OK,
-            result=assignment,
+            result=project(assignment, fields),
         )
 
 